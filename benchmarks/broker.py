@@ -0,0 +1,63 @@
+"""
+Load-tests order submission through the broker stub: orders per second and request latency for several numbers of
+concurrent clients and order batch sizes.
+
+Usage: python -m benchmarks.broker
+"""
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_feature_tensor
+from trading.broker_stub import BrokerController, serve_broker
+from trading.paper import PaperController
+
+NUM_ASSETS = 100
+DURATION = 2.
+CLIENTS = [1, 4, 16]
+BATCH_SIZES = [1, 10, 100]
+
+
+def load_test(url: str, clients: int, batch_size: int) -> tuple:
+    # Runs clients submitting random batches for DURATION seconds, returns (orders/s, request latencies)
+    latencies = [[] for _ in range(clients)]
+
+    def client(latency: list, seed: int):
+        broker = BrokerController(url)
+        rng = np.random.default_rng(seed)
+        deadline = time.perf_counter() + DURATION
+        while time.perf_counter() < deadline:
+            assets = rng.integers(0, NUM_ASSETS, batch_size)
+            quantities = rng.integers(-5, 6, batch_size)
+            start = time.perf_counter()
+            broker.submit_orders(assets, quantities)
+            latency.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(latencies[i], i)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    requests = sum(len(latency) for latency in latencies)
+    return requests * batch_size / DURATION, np.concatenate([np.array(latency) for latency in latencies])
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as path:
+        make_feature_tensor(path, 100, NUM_ASSETS)
+        controller = PaperController(path, initial_balance=1e12)
+        server = serve_broker(controller)
+        url = f'http://127.0.0.1:{server.server_port}'
+
+        print(f'{"clients":>8} {"batch":>6} {"orders/s":>12} {"p50 ms":>10} {"p99 ms":>10}')
+        for clients in CLIENTS:
+            for batch_size in BATCH_SIZES:
+                controller.reset()
+                orders_per_second, latencies = load_test(url, clients, batch_size)
+                p50, p99 = np.percentile(latencies * 1e3, [50, 99])
+                print(f'{clients:>8} {batch_size:>6} {orders_per_second:>12.1f} {p50:>10.3f} {p99:>10.3f}')
+
+        server.shutdown()
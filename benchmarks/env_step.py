@@ -0,0 +1,40 @@
+"""
+Measures MarketEnv steps per second as the size of the asset universe grows.
+
+Usage: python -m benchmarks.env_step
+"""
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_feature_tensor
+from envs.market_env import MarketEnv
+from trading.training_controller import TrainingController
+
+ASSET_COUNTS = [10, 50, 100, 500]
+DAYS = 1000
+
+
+def steps_per_second(num_assets: int, days: int = DAYS) -> float:
+    with tempfile.TemporaryDirectory() as path:
+        make_feature_tensor(path, days, num_assets)
+        env = MarketEnv(TrainingController(path))
+        actions = np.random.default_rng(0).integers(-5, 6, size=(days, num_assets))
+
+        env.reset()
+        start = time.perf_counter()
+        steps = 0
+        done = False
+        while not done:
+            _, _, done, _ = env.step(actions[steps])
+            steps += 1
+        elapsed = time.perf_counter() - start
+
+    return steps / elapsed
+
+
+if __name__ == '__main__':
+    print(f'{"assets":>8} {"steps/s":>12}')
+    for count in ASSET_COUNTS:
+        print(f'{count:>8} {steps_per_second(count):>12.1f}')
@@ -0,0 +1,81 @@
+"""
+Reports p50/p99 decision latency of TD3.select_action against the InferencePolicy variants, and of the
+micro-batching InferenceServer under concurrent strategies.
+
+Usage: python -m benchmarks.inference
+"""
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import torch
+
+from model.inference import InferencePolicy, InferenceServer
+from model.td3 import TD3
+from trading.training_controller import FEATURES
+
+NUM_ASSETS = 100
+REQUESTS = 2000
+STRATEGIES = [1, 8, 32]
+
+
+def percentiles(latencies: list) -> str:
+    p50, p99 = np.percentile(np.array(latencies) * 1e3, [50, 99])
+    return format_percentiles({'p50': p50, 'p99': p99})
+
+
+def format_percentiles(latency: dict) -> str:
+    return f'{latency["p50"]:>10.3f} {latency["p99"]:>10.3f}'
+
+
+def time_calls(fn, state) -> list:
+    for _ in range(50):
+        fn(state)
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        fn(state)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def serve_concurrently(server: InferenceServer, strategies: int, state) -> dict:
+    def strategy():
+        for _ in range(REQUESTS // strategies):
+            server.act(state)
+
+    threads = [threading.Thread(target=strategy) for _ in range(strategies)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return server.latency_percentiles()
+
+
+if __name__ == '__main__':
+    state_dim, action_dim = 1 + NUM_ASSETS + NUM_ASSETS * len(FEATURES), NUM_ASSETS
+    state = np.random.default_rng(0).standard_normal(state_dim).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as path:
+        filename = os.path.join(path, 'TD3')
+        policy = TD3(state_dim, action_dim, 5.)
+        torch.save(policy.actor.state_dict(), filename + "_actor")
+
+        print(f'{"path":>28} {"p50 ms":>10} {"p99 ms":>10}')
+        print(f'{"TD3.select_action":>28} {percentiles(time_calls(policy.select_action, state))}')
+        variants = {
+            'InferencePolicy': {},
+            'InferencePolicy int8': {'quantize': True},
+            'InferencePolicy script': {'script': True},
+        }
+        for name, kwargs in variants.items():
+            inference = InferencePolicy(filename, state_dim, action_dim, 5., **kwargs)
+            print(f'{name:>28} {percentiles(time_calls(inference.act, state))}')
+
+        for strategies in STRATEGIES:
+            server = InferenceServer(InferencePolicy(filename, state_dim, action_dim, 5.))
+            latency = serve_concurrently(server, strategies, state)
+            server.stop()
+            print(f'{f"server, {strategies} strategies":>28} {format_percentiles(latency)}')
@@ -0,0 +1,110 @@
+"""
+Compares time-to-target-reward of TD3 training with and without observation normalization.
+
+The synthetic market carries a learnable signal: each asset's 'roc' feature is its next day's return, while 'adi' and
+'obv' are cumulative volume-like series in the millions, as raw indicators are. Both runs train on the same data with
+the same seeds and are evaluated every EVAL_EVERY steps; the target is a fraction of the best evaluation either run
+reached, and the report shows the environment steps and wall time each run needed to get there.
+
+Usage: python -m benchmarks.normalization [--steps 30000] [--fraction 0.8]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.synthetic import make_feature_tensor
+from envs.vector_market_env import VectorMarketEnv
+from model.evaluation import Evaluator
+from model.td3 import TD3
+from model.utils import CompactReplayBuffer, ObservationNormalizer
+from trading.training_controller import FEATURES
+
+DAYS = 1500
+ASSETS = 10
+NUM_ENVS = 8
+START_STEPS = 2000
+EVAL_EVERY = 2000
+BATCH_SIZE = 256
+
+
+def make_signal_tensor(path: str):
+    make_feature_tensor(path, DAYS, ASSETS)
+    features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r+')
+    rng = np.random.default_rng(1)
+
+    closes = features[:, :, FEATURES.index('close')]
+    features[:-1, :, FEATURES.index('roc')] = 100 * (closes[1:] / closes[:-1] - 1)
+    for name in ('adi', 'obv'):
+        features[:, :, FEATURES.index(name)] = np.cumsum(rng.normal(0, 1e6, size=(DAYS, ASSETS)), axis=0)
+    features.flush()
+
+
+def train(path: str, steps: int, normalize: bool) -> list:
+    # Trains for the given number of environment steps, returning (steps, seconds, evaluation) after every evaluation
+    torch.manual_seed(0)
+    np.random.seed(0)
+    env = VectorMarketEnv(path, NUM_ENVS, max_episode_steps=100, seed=0)
+    normalizer = ObservationNormalizer(env.asset_info_length) if normalize else None
+    env.normalizer = normalizer
+    evaluator = Evaluator(path, 0, eval_episodes=5, max_episode_steps=100)
+
+    state_dim, action_dim = env.single_observation_space.shape[0], env.single_action_space.shape[0]
+    policy = TD3(state_dim, action_dim, 5., policy_noise=1., noise_clip=2.5)
+    replay_buffer = CompactReplayBuffer(state_dim, action_dim, max_size=steps + NUM_ENVS, num_envs=NUM_ENVS)
+
+    results = []
+    start, eval_seconds = time.perf_counter(), 0.
+    state = env.reset()
+    for t in range(0, steps, NUM_ENVS):
+        if t < START_STEPS:
+            action = env.action_space.sample()
+        else:
+            action = (policy.select_actions(state) + np.random.normal(0, 0.5, size=(NUM_ENVS, action_dim))).clip(-5, 5)
+
+        next_state, reward, done, info = env.step(action)
+        transition_next_state = np.where(done[:, None], info.get('final_observation', next_state), next_state)
+        replay_buffer.add_batch(state, action, transition_next_state, reward, (done & ~info['truncated']).astype(float),
+                                done)
+        state = next_state
+
+        if t >= START_STEPS:
+            for _ in range(NUM_ENVS):
+                policy.train(replay_buffer, BATCH_SIZE)
+
+        if (t + NUM_ENVS) // EVAL_EVERY > t // EVAL_EVERY:
+            # Evaluation time is not counted
+            eval_start = time.perf_counter()
+            avg_reward = evaluator.evaluate(policy.actor, normalizer)
+            results.append((t + NUM_ENVS, eval_start - start - eval_seconds, avg_reward))
+            eval_seconds += time.perf_counter() - eval_start
+
+    evaluator.close()
+    return results
+
+
+def time_to_target(results: list, target: float) -> tuple:
+    # (steps, seconds) of the first evaluation reaching the target, or None
+    return next(((steps, seconds) for steps, seconds, reward in results if reward >= target), None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--steps', type=int, default=30000)
+    parser.add_argument('--fraction', type=float, default=0.8, help='Target as a fraction of the best evaluation')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        make_signal_tensor(path)
+        runs = {mode: train(path, args.steps, mode == 'normalized') for mode in ('raw', 'normalized')}
+
+    target = args.fraction * max(reward for results in runs.values() for _, _, reward in results)
+    print(f'Target reward: {target:.3f}')
+    print(f'{"mode":>12} {"steps":>10} {"seconds":>10} {"best":>12}')
+    for mode, results in runs.items():
+        reached = time_to_target(results, target)
+        steps, seconds = reached if reached else ('-', float('nan'))
+        print(f'{mode:>12} {steps:>10} {seconds:>10.1f} {max(reward for _, _, reward in results):>12.3f}')
@@ -0,0 +1,57 @@
+"""
+Compares memory use and sampling speed of ReplayBuffer and CompactReplayBuffer for growing asset universes.
+
+Usage: python -m benchmarks.replay_buffer
+"""
+import time
+
+import numpy as np
+
+from model.utils import CompactReplayBuffer, ReplayBuffer
+from trading.training_controller import FEATURES
+
+ASSET_COUNTS = [10, 100, 500]
+MAX_SIZE = int(1e5)
+NUM_ENVS = 8
+BATCH_SIZE = 256
+SAMPLES = 1000
+
+
+def fill(buffer, state_dim, action_dim, rng):
+    state = rng.standard_normal((NUM_ENVS, state_dim), dtype=np.float32)
+    for _ in range(MAX_SIZE // NUM_ENVS):
+        next_state = rng.standard_normal((NUM_ENVS, state_dim), dtype=np.float32)
+        action = rng.uniform(-5, 5, size=(NUM_ENVS, action_dim))
+        buffer.add_batch(state, action, next_state, rng.standard_normal(NUM_ENVS), np.zeros(NUM_ENVS))
+        state = next_state
+
+
+def samples_per_second(buffer) -> float:
+    buffer.sample(BATCH_SIZE)  # Warm up (allocates the preallocated batch for CompactReplayBuffer)
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        buffer.sample(BATCH_SIZE)
+    return SAMPLES / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    print(f'{"assets":>8} {"buffer":>10} {"MB":>10} {"samples/s":>12}')
+    for count in ASSET_COUNTS:
+        state_dim, action_dim = 1 + count + count * len(FEATURES), count
+        buffers = {
+            'default': lambda: ReplayBuffer(state_dim, action_dim, MAX_SIZE),
+            'float32': lambda: CompactReplayBuffer(state_dim, action_dim, MAX_SIZE, NUM_ENVS),
+            'float16': lambda: CompactReplayBuffer(state_dim, action_dim, MAX_SIZE, NUM_ENVS, state_dtype=np.float16),
+        }
+        for name, make_buffer in buffers.items():
+            # Built one at a time so only a single buffer is resident
+            buffer = make_buffer()
+            fill(buffer, state_dim, action_dim, rng)
+            if isinstance(buffer, CompactReplayBuffer):
+                nbytes = buffer.nbytes()
+            else:
+                nbytes = sum(array.nbytes for array in (buffer.state, buffer.action, buffer.next_state, buffer.reward,
+                                                        buffer.not_done))
+            print(f'{count:>8} {name:>10} {nbytes / 2 ** 20:>10.1f} {samples_per_second(buffer):>12.1f}')
+            del buffer
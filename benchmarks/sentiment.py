@@ -0,0 +1,51 @@
+"""
+Measures sentiment ingestion throughput in records per hour, for LexiconScorer.score alone and for scoring plus
+session assignment and aggregation (aggregate_sentiment), against the millions of records per hour target.
+
+Usage: python -m benchmarks.sentiment [records]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from market_data.sentiment import LEXICON, LexiconScorer, aggregate_sentiment
+
+RECORDS = 1_000_000
+CHUNK_SIZE = 100_000
+TARGET_PER_HOUR = 1_000_000
+FILLER = ['shares', 'the', 'company', 'quarter', 'market', 'analysts', 'said', 'not', 'on', 'after']
+
+
+def synthetic_records(records: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(list(LEXICON) + FILLER * 5, dtype=object)
+    words = vocabulary[rng.integers(len(vocabulary), size=(records, 12))]
+    start = pd.Timestamp('2015-01-01', tz='UTC').value
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(rng.integers(start, start + 9 * 365 * 86400 * 10 ** 9, size=records), utc=True),
+        'ticker': np.array(['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOG'])[rng.integers(5, size=records)],
+        'text': [' '.join(row) for row in words],
+    })
+
+
+def per_hour(fn, records: int) -> float:
+    start = time.perf_counter()
+    fn()
+    return records / (time.perf_counter() - start) * 3600
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else RECORDS
+    df = synthetic_records(records)
+    chunks = [df.iloc[i:i + CHUNK_SIZE] for i in range(0, records, CHUNK_SIZE)]
+
+    scorer = LexiconScorer()
+    results = {
+        'LexiconScorer.score': per_hour(lambda: [scorer.score(chunk.text.to_numpy()) for chunk in chunks], records),
+        'aggregate_sentiment': per_hour(lambda: aggregate_sentiment(chunks, scorer), records),
+    }
+    print(f'{"stage":>22} {"records/hour":>14} {"target":>8}')
+    for name, rate in results.items():
+        print(f'{name:>22} {rate:>14,.0f} {"ok" if rate >= TARGET_PER_HOUR else "MISSED":>8}')
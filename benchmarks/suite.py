@@ -0,0 +1,129 @@
+"""
+Training throughput benchmark suite.
+
+Times each training stage in isolation and one end-to-end training tick on synthetic market data, for several asset
+counts and batch sizes, and reports per-iteration latency percentiles and throughput. Results can be saved as a
+baseline and later runs compared against it; any stage whose median latency regresses by more than the tolerance
+fails the run.
+
+Usage:
+    python -m benchmarks.suite [--assets 10 100 500] [--batch-sizes 64 256 1024] [--output results.json]
+                               [--baseline baseline.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.synthetic import make_feature_tensor
+from envs.vector_market_env import VectorMarketEnv
+from model.td3 import TD3
+from model.utils import CompactReplayBuffer
+
+DAYS = 2000
+NUM_ENVS = 8
+BUFFER_SIZE = 20000
+ITERATIONS = 200
+WARMUP = 10
+
+
+def _time(fn, iterations: int = ITERATIONS, items: int = 1) -> dict:
+    for _ in range(WARMUP):
+        fn()
+
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        latencies[i] = time.perf_counter() - start
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    return {'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'per_sec': items * iterations / latencies.sum()}
+
+
+def run_suite(asset_counts: list, batch_sizes: list) -> dict:
+    results = {}
+    for num_assets in asset_counts:
+        with tempfile.TemporaryDirectory() as path:
+            make_feature_tensor(path, DAYS, num_assets)
+            env = VectorMarketEnv(path, NUM_ENVS, seed=0)
+            step_env = VectorMarketEnv(path, NUM_ENVS, seed=1)  # Stepped alone, so env keeps a consistent stream
+            step_env.reset()
+            state_dim = env.single_observation_space.shape[0]
+
+            state = env.reset()
+            replay_buffer = CompactReplayBuffer(state_dim, num_assets, BUFFER_SIZE, NUM_ENVS)
+            for _ in range(BUFFER_SIZE // NUM_ENVS):
+                action = env.action_space.sample()
+                next_state, reward, done, info = env.step(action)
+                replay_buffer.add_batch(state, action, next_state, reward, np.zeros(NUM_ENVS), done)
+                state = next_state
+
+            policy = TD3(state_dim, num_assets, 5.)
+            collector = {'state': state}
+
+            def collect_tick():
+                action = policy.select_actions(collector['state'])
+                next_state, reward, done, _ = env.step(action)
+                replay_buffer.add_batch(collector['state'], action, next_state, reward, np.zeros(NUM_ENVS), done)
+                collector['state'] = next_state
+
+            single_state, states = state[0].copy(), state.copy()
+            results[f'{num_assets}/env_step'] = _time(lambda: step_env.step(step_env.action_space.sample()),
+                                                      items=NUM_ENVS)
+            results[f'{num_assets}/select_action'] = _time(lambda: policy.select_action(single_state))
+            results[f'{num_assets}/select_actions'] = _time(lambda: policy.select_actions(states), items=NUM_ENVS)
+
+            for batch_size in batch_sizes:
+                results[f'{num_assets}/replay_sample/{batch_size}'] = _time(
+                    lambda: replay_buffer.sample(batch_size), items=batch_size)
+                results[f'{num_assets}/td3_train/{batch_size}'] = _time(
+                    lambda: policy.train(replay_buffer, batch_size), items=1)
+
+                def end_to_end():
+                    collect_tick()
+                    for _ in range(NUM_ENVS):
+                        policy.train(replay_buffer, batch_size)
+
+                results[f'{num_assets}/end_to_end/{batch_size}'] = _time(end_to_end, ITERATIONS // 4, items=NUM_ENVS)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    # Stages whose median latency is more than tolerance slower than in the baseline
+    return [(stage, baseline[stage]['p50_ms'], stats['p50_ms']) for stage, stats in results.items()
+            if stage in baseline and stats['p50_ms'] > baseline[stage]['p50_ms'] * (1 + tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--assets', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--output', help='Write results as JSON, e.g. to store a new baseline')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p50 slowdown')
+    args = parser.parse_args()
+
+    results = run_suite(args.assets, args.batch_sizes)
+
+    print(f'{"stage":>32} {"p50 ms":>10} {"p90 ms":>10} {"p99 ms":>10} {"items/s":>12}')
+    for stage, stats in results.items():
+        print(f'{stage:>32} {stats["p50_ms"]:>10.3f} {stats["p90_ms"]:>10.3f} {stats["p99_ms"]:>10.3f} '
+              f'{stats["per_sec"]:>12.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for stage, before, after in regressions:
+            print(f'REGRESSION {stage}: p50 {before:.3f} ms -> {after:.3f} ms')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,24 @@
+"""
+Synthetic market data for benchmarks, written in the same on-disk layout as real preprocessed features.
+"""
+import numpy as np
+
+from trading.training_controller import FEATURES, write_feature_tensor
+
+
+def make_feature_tensor(path: str, days: int, assets: int, seed: int = 0) -> list:
+    """
+    Writes a random-walk (days, assets, features) feature tensor for TrainingController to path.
+
+    :return: The generated ticker symbols
+    """
+    rng = np.random.default_rng(seed)
+    features = rng.standard_normal((days, assets, len(FEATURES)), dtype=np.float32)
+
+    # Closing prices follow a geometric random walk so trades have realistic, strictly positive costs
+    log_returns = rng.normal(0, 0.02, size=(days, assets))
+    features[:, :, 0] = 100 * np.exp(np.cumsum(log_returns, axis=0))
+
+    tickers = [f'SYN{i}' for i in range(assets)]
+    write_feature_tensor(features, tickers, path)
+    return tickers
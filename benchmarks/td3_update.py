@@ -0,0 +1,55 @@
+"""
+Measures TD3.train updates per second for the original update path against the fused and compiled ones.
+
+Usage: python -m benchmarks.td3_update
+"""
+import time
+
+import numpy as np
+import torch
+
+from model.td3 import TD3
+from model.utils import ReplayBuffer
+from trading.training_controller import FEATURES
+
+ASSET_COUNTS = [10, 100]
+BATCH_SIZE = 256
+BUFFER_SIZE = 10000
+WARMUP = 20
+UPDATES = 500
+
+MODES = {
+    'original': {'fused': False},
+    'fused': {'fused': True},
+    'compiled': {'fused': True, 'compile': True},
+}
+
+
+def updates_per_second(num_assets: int, **kwargs) -> float:
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    state_dim, action_dim = 1 + num_assets + num_assets * len(FEATURES), num_assets
+
+    replay_buffer = ReplayBuffer(state_dim, action_dim, BUFFER_SIZE)
+    replay_buffer.add_batch(rng.standard_normal((BUFFER_SIZE, state_dim)),
+                            rng.uniform(-5, 5, (BUFFER_SIZE, action_dim)),
+                            rng.standard_normal((BUFFER_SIZE, state_dim)), rng.standard_normal(BUFFER_SIZE),
+                            np.zeros(BUFFER_SIZE))
+    policy = TD3(state_dim, action_dim, 5., **kwargs)
+
+    for _ in range(WARMUP):  # Includes compilation for the compiled mode
+        policy.train(replay_buffer, BATCH_SIZE)
+
+    start = time.perf_counter()
+    for _ in range(UPDATES):
+        policy.train(replay_buffer, BATCH_SIZE)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return UPDATES / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    print(f'{"assets":>8} {"mode":>10} {"updates/s":>12}')
+    for count in ASSET_COUNTS:
+        for mode, kwargs in MODES.items():
+            print(f'{count:>8} {mode:>10} {updates_per_second(count, **kwargs):>12.1f}')
@@ -0,0 +1,48 @@
+"""
+Compares the per-cell BeautifulSoup history parser with the bulk table extractor on large history pages.
+
+Usage: python -m benchmarks.yh_parse [saved_page.html ...]
+Without arguments, a synthetic page with several decades of daily rows is used.
+"""
+import sys
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from market_data.yh_finance import extract_history_table, parse_history_page
+
+SYNTHETIC_ROWS = 30 * 252
+REPEATS = 3
+
+
+def synthetic_page(rows: int = SYNTHETIC_ROWS) -> str:
+    cells = []
+    day = date(2024, 3, 11)
+    for i in range(rows):
+        price = f'{1000 + (i % 500) * 1.25:,.2f}'
+        values = [day.strftime('%b %d, %Y')] + [price] * 5 + [f'{1000000 + i:,}']
+        cells.append('<tr class="row">' + ''.join(f'<td class="cell"><span>{v}</span></td>' for v in values) + '</tr>')
+        day -= timedelta(days=1)
+    return ('<html><body><table class="table svelte-ewueuo"><thead><tr><th>Date</th></tr></thead><tbody>'
+            + ''.join(cells) + '</tbody></table></body></html>')
+
+
+def best_time(parse, html: str) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        parse(html)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    pages = {path: open(path, encoding='utf-8').read() for path in sys.argv[1:]} or {'synthetic': synthetic_page()}
+    print(f'{"page":>30} {"rows":>8} {"per-cell s":>12} {"bulk s":>10} {"speedup":>8}')
+    for name, html in pages.items():
+        expected = parse_history_page(html)
+        pd.testing.assert_frame_equal(extract_history_table(html), expected, check_dtype=False)
+
+        per_cell, bulk = best_time(parse_history_page, html), best_time(extract_history_table, html)
+        print(f'{name[-30:]:>30} {len(expected):>8} {per_cell:>12.3f} {bulk:>10.3f} {per_cell / bulk:>7.1f}x')
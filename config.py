@@ -1,4 +1,7 @@
 LOOK_BACK_WINDOW = 14  # 14 or 9, how many days to look back to determine past asset prices
+STORE_PATH = "./store"  # Root directory of the columnar raw data and feature store
+FEATURE_PATH = "./features"  # Directory of the memory-mapped (days, assets, features) training tensor
+INITIAL_BALANCE = 10000.  # Starting cash balance of the simulated training account
 
 #
 # Enviroment & Model Config
@@ -7,7 +10,15 @@ ENV = "envs/MarketEnv"  # OpenAI gym environment name
 SEED = 0  # Sets Gym, PyTorch and Numpy seeds
 START_TIMESTEPS = 25e3  # Time steps initial random policy is used
 EVAL_FREQ = 5e3  # How often (time steps) we evaluate
+EVAL_EPISODES = 10  # Episodes per evaluation, run in parallel
+ASYNC_EVAL = True  # Evaluate a snapshot of the actor on a background thread instead of pausing training
 MAX_TIMESTEPS = 1e6  # Max time steps to run environment
+NUM_ENVS = 8  # Independent episodes stepped together by the vectorized environment
+EPISODE_LENGTH = 300  # Steps per training and evaluation episode
+VAL_FRACTION = 0.2  # Fraction of the history held out for evaluation episodes, 0 trains and evaluates on all of it
+SPLIT_BLOCK_DAYS = 252  # Min length of the train/validation split blocks, raised to EPISODE_LENGTH + 1 if shorter
+SPLIT_SEED = 0  # Seed of the train/validation split, kept fixed across training seeds
+CURRICULUM_STEPS = 0  # Time steps to widen training from the calmest windows to all of them, 0 disables the curriculum
 
 EXPL_NOISE = 0.1  # Std of Gaussian exploration noise
 BATCH_SIZE = 256  # Batch size for both actor and critic
@@ -16,6 +27,29 @@ TAU = 0.005  # Target network update rate
 POLICY_NOISE = 0.2  # Noise added to target policy during critic update
 NOISE_CLIP = 0.5  # Range to clip target policy noise
 POLICY_FREQ = 2  # Frequency of delayed policy updates
+FUSED_UPDATE = False  # Stacked twin critic, multi-tensor Adam and Polyak averaging in TD3.train, no gain on CPU
+TORCH_COMPILE = False  # torch.compile the actor and critic networks used by TD3.train
+UPDATE_TO_DATA_RATIO = 1.  # TD3 updates per environment step
+ASYNC_LEARNER = True  # Run TD3 updates on a background learner thread while the main loop collects transitions
+ACTOR_SYNC_FREQ = 1000  # Environment steps between copies of the learner's actor weights into the acting actor
+NORMALIZE_OBSERVATIONS = True  # Standardize observations with running statistics, see ObservationNormalizer
+NORMALIZE_CLIP = 10.  # Normalized observation values are clipped to [-NORMALIZE_CLIP, NORMALIZE_CLIP]
+REPLAY_BUFFER = "compact"  # "uniform" (ReplayBuffer), "compact" (CompactReplayBuffer) or "prioritized"
+PER_ALPHA = 0.6  # How strongly TD error shapes prioritized sampling (0 is uniform)
+PER_BETA = 0.4  # Initial importance-sampling correction, annealed to 1 over MAX_TIMESTEPS
+
+TELEMETRY = True  # Record training metrics to TELEMETRY_PATH, False disables all recording
+TELEMETRY_PATH = "./results/telemetry.bin"  # Append-only binary metric log, read with telemetry.read_log
+TELEMETRY_LEVEL = 20  # Minimum level of recorded metrics (10 includes per-step debug metrics)
+TELEMETRY_SAMPLE_EVERY = 100  # Keep every n-th value of each metric
+PROFILE = None  # Profile the training loop: None, "cprofile" or "torch" (torch.profiler)
+# Under "cprofile" TD3 updates run synchronously on the training loop thread, ignoring ASYNC_LEARNER
+PROFILE_PATH = "./results/profile"  # Trace file name, without extension
+PROFILE_STEPS = 200  # Training loop iterations to profile, starting when training begins
+
+CHECKPOINT_PATH = "./checkpoints"  # Directory of the full training state checkpoint
+CHECKPOINT_FREQ = 1e5  # How often (time steps) the full training state is checkpointed, 0 disables checkpoints
+RESUME = False  # Resume from the checkpoint in CHECKPOINT_PATH if there is one
 
 SAVE_MODEL = True  # Save model and optimizer parameters  (action=store_true)
 LOAD_MODEL = "./model..."  # Model load file name, "" doesn't load, "default" uses file_name
\ No newline at end of file
@@ -1,7 +1,9 @@
 from gymnasium.envs.registration import register
 
+import config
+
 register(
      id="envs/MarketEnv-v0",
      entry_point="envs.market_env:MarketEnv",
-     max_episode_steps=300,
+     max_episode_steps=config.EPISODE_LENGTH,
 )
\ No newline at end of file
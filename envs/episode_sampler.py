@@ -0,0 +1,148 @@
+"""
+Episode windows over long multi-asset histories.
+
+An episode is a window of episode_length + 1 consecutive days of the aligned (days, assets, features) panel and a
+subset of its tickers. Every valid window start is computed once up front, so drawing a new episode is a lookup into
+that index and nothing is copied; the environment reads the panel through the window's day and ticker indexes.
+
+History is divided into blocks of at least block_days days, never shorter than a window, and a seeded permutation holds
+out val_fraction of the blocks for validation (at least one, and never all of them when there are two or more). A
+remainder shorter than a block joins the last block, so every validation block fits a whole window. Windows never
+straddle a train/validation boundary, and train and validation samplers built with the same
+split_seed always agree on the split. Without a curriculum, starts are drawn from a shuffled pass over all valid
+windows, so collection is spread evenly over the whole history rather than concentrated where random draws happen to
+land. With a difficulty score per start day, windows are ordered easiest first and set_progress widens the pool from
+the easiest curriculum_start fraction to all of them.
+"""
+import numpy as np
+
+
+def split_days(num_days: int, split: str = None, val_fraction: float = 0.2, block_days: int = 252,
+               split_seed: int = 0) -> np.ndarray:
+    """
+    :param split: None for every day, 'train' or 'val'
+    :return: Boolean mask of the days in the split, every block spans at least block_days days
+    """
+    if split is None:
+        return np.ones(num_days, dtype=bool)
+    if split not in ('train', 'val'):
+        raise ValueError(f'Unknown split {split}, expected None, "train" or "val"')
+
+    num_blocks = max(num_days // block_days, 1)
+    num_val = 0
+    if val_fraction > 0:
+        num_val = max(round(val_fraction * num_blocks), 1)
+        num_val = min(num_val, num_blocks - 1) if num_blocks > 1 else num_val
+    val_blocks = np.random.default_rng(split_seed).permutation(num_blocks)[:num_val]
+    block = np.minimum(np.arange(num_days) // block_days, num_blocks - 1)  # The remainder joins the last block
+    val = np.isin(block, val_blocks)
+    return val if split == 'val' else ~val
+
+
+def volatility_difficulty(closing_prices: np.ndarray, episode_length: int) -> np.ndarray:
+    """
+    Curriculum difficulty of every start day: the mean absolute daily log return of all assets over the window.
+
+    :param closing_prices: (days, assets) closing prices
+    :return: (days,) difficulty, windows running past the end of the data score as the rest of the data
+    """
+    returns = np.abs(np.diff(np.log(closing_prices), axis=0)).mean(axis=1)
+    total = np.r_[0., np.cumsum(returns)]
+    end = np.minimum(np.arange(len(closing_prices)) + episode_length, len(returns))
+    start = np.minimum(np.arange(len(closing_prices)), end - 1)
+    return (total[end] - total[start]) / np.maximum(end - start, 1)
+
+
+class EpisodeSampler(object):
+    """
+    Draws (start day, ticker subset) episode windows, see the module docstring.
+
+    :param num_days: Days in the panel
+    :param num_assets: Tickers in the panel
+    :param episode_length: Steps per episode, a window covers episode_length + 1 days
+    :param assets_per_episode: Tickers per episode, None trades all of them
+    :param split: None for every day, 'train' or 'val'
+    :param val_fraction: Fraction of the blocks held out for validation
+    :param block_days: Minimum length of the blocks history is split into, raised to episode_length + 1 if shorter
+    :param split_seed: Seed of the train/validation assignment, independent of seed
+    :param difficulty: Optional (days,) curriculum difficulty per start day, e.g. from volatility_difficulty
+    :param curriculum_start: Fraction of the easiest windows sampled at progress 0
+    :param seed: Seed of the window and ticker draws
+    """
+
+    def __init__(self, num_days: int, num_assets: int, episode_length: int, assets_per_episode: int = None,
+                 split: str = None, val_fraction: float = 0.2, block_days: int = 252, split_seed: int = 0,
+                 difficulty: np.ndarray = None, curriculum_start: float = 0.1, seed: int = None):
+        self.num_assets = num_assets
+        self.assets_per_episode = assets_per_episode or num_assets
+        self.curriculum_start = curriculum_start
+        self.progress = 1.
+
+        # Valid starts: every day of the window is in the split
+        span = min(episode_length + 1, num_days)
+        in_split = split_days(num_days, split, val_fraction, max(block_days, span), split_seed)
+        count = np.r_[0, np.cumsum(in_split)]
+        starts = np.flatnonzero(count[span:] - count[:-span] == span)
+        if not len(starts):
+            raise ValueError(f'No {split or "full"} window of {span} days in {num_days} days of data with '
+                             f'EPISODE_LENGTH={episode_length}, SPLIT_BLOCK_DAYS={block_days} and '
+                             f'VAL_FRACTION={val_fraction}, the history needs a {split or "full"} block of at least '
+                             f'EPISODE_LENGTH + 1 days')
+
+        self.curriculum = difficulty is not None
+        if self.curriculum:
+            starts = starts[np.argsort(difficulty[starts], kind='stable')]  # Easiest first
+        self.starts = starts
+        self.seed(seed)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def seed(self, seed: int = None):
+        self.np_random = np.random.default_rng(seed)
+        self._order = self.np_random.permutation(len(self.starts))
+        self._next = 0
+
+    def state_dict(self) -> dict:
+        # Draw state for resuming from a checkpoint, the windows themselves are rebuilt from the constructor arguments
+        return {'rng': self.np_random.bit_generator.state, 'order': self._order.copy(), 'next': self._next,
+                'progress': self.progress}
+
+    def load_state_dict(self, state: dict):
+        self.np_random.bit_generator.state = state['rng']
+        self._order, self._next, self.progress = state['order'].copy(), state['next'], state['progress']
+
+    def set_progress(self, progress: float):
+        # Curriculum progress in [0, 1], ignored without a difficulty score
+        self.progress = min(max(progress, 0.), 1.)
+
+    def _sample_starts(self, n: int) -> np.ndarray:
+        if self.curriculum and self.progress < 1:
+            pool = self.curriculum_start + (1 - self.curriculum_start) * self.progress
+            return self.starts[self.np_random.integers(0, max(int(pool * len(self.starts)), 1), size=n)]
+
+        # Shuffled passes over every window
+        index = np.empty(n, dtype=np.int64)
+        filled = 0
+        while filled < n:
+            if self._next == len(self._order):
+                self._order = self.np_random.permutation(len(self.starts))
+                self._next = 0
+            taken = self._order[self._next:self._next + n - filled]
+            index[filled:filled + len(taken)] = taken
+            filled += len(taken)
+            self._next += len(taken)
+        return self.starts[index]
+
+    def sample(self, n: int) -> tuple:
+        """
+        :return: Tuple of (n,) start days and (n, assets_per_episode) sorted ticker indexes, None when every episode
+        trades all tickers
+        """
+        starts = self._sample_starts(n)
+        if self.assets_per_episode >= self.num_assets:
+            return starts, None
+
+        keys = self.np_random.random((n, self.num_assets))
+        assets = np.argpartition(keys, self.assets_per_episode - 1, axis=1)[:, :self.assets_per_episode]
+        return starts, np.sort(assets, axis=1)
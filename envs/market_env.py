@@ -2,9 +2,36 @@ import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 
+import telemetry
 from trading.controller import Controller
 
 
+def fill_orders(action, shares_owned, cash_balance, closing_prices, cost_rate=0.):
+    """
+    Fills whole-share orders at the closing price for one account (assets,) or a batch of accounts (n, assets).
+    Sells settle first and never for more shares than are owned, then buys fill in asset order for as long as the
+    cumulative cost, including transaction costs, is covered by the cash balance.
+
+    :param action: Signed number of shares to trade per asset
+    :param shares_owned: Shares held per asset, updated in place
+    :param cash_balance: Cash balance of each account
+    :param closing_prices: Closing price per asset
+    :param cost_rate: Transaction cost as a fraction of traded value, deducted from sale proceeds and added to buys
+    :return: Cash balance of each account after the trades
+    """
+    shares = np.rint(action).astype(np.float32)
+
+    sells = np.minimum(np.maximum(-shares, 0), shares_owned)
+    shares_owned -= sells
+    cash_balance = cash_balance + (sells * closing_prices).sum(axis=-1) * (1 - cost_rate)
+
+    buys = np.maximum(shares, 0)
+    costs = buys * closing_prices * (1 + cost_rate)
+    filled = np.cumsum(costs, axis=-1) <= np.expand_dims(cash_balance, -1)
+    shares_owned += buys * filled
+    return cash_balance - (costs * filled).sum(axis=-1)
+
+
 class MarketEnv(gym.Env):
     def __init__(self, controller: Controller):
         super(MarketEnv, self).__init__()
@@ -16,12 +43,18 @@ class MarketEnv(gym.Env):
 
         # Observation space: [cash_balance, shares_owned, asset_info]
         self.num_assets = len(self.controller.get_open_positions())
-        self.shares_owned = np.zeros(self.num_assets)
-        asset_info_length = 11  # TODO Closing price + technical indicators
-        low_obs = np.array([0] * (1 + self.num_assets + self.num_assets * asset_info_length), dtype=np.float32)
-        high_obs = np.array([np.inf] * (1 + self.num_assets + self.num_assets * asset_info_length), dtype=np.float32)
+        self.shares_owned = np.zeros(self.num_assets, dtype=np.float32)
+        asset_info_length = self.controller.get_asset_info().shape[-1]  # Closing price + indicators (+ sentiment)
+        obs_length = 1 + self.num_assets + self.num_assets * asset_info_length
+        low_obs = np.zeros(obs_length, dtype=np.float32)
+        high_obs = np.full(obs_length, np.inf, dtype=np.float32)
         self.observation_space = spaces.Box(low=low_obs, high=high_obs, dtype=np.float32)
 
+        # Observations are written into two alternating preallocated buffers, so the previous observation stays valid
+        # while the next one is built (e.g. when both are stored as a replay buffer transition)
+        self._observations = np.zeros((2, obs_length), dtype=np.float32)
+        self._obs_index = 0
+
         # Action space: one integer per asset TODO bound it to avoid selling too many stocks or buying too many shares
         self.action_space = spaces.Box(low=-5, high=5, shape=(self.num_assets,), dtype=np.int32)
 
@@ -32,33 +65,31 @@ class MarketEnv(gym.Env):
         super().reset(seed=seed)
         self.controller.reset()
         self.cash_balance = self.initial_balance
-        self.shares_owned = np.zeros(self.num_assets)
+        self.shares_owned[:] = 0
+        self._previous_portfolio_value = self.controller.get_portfolio_value()
         return self._get_observation()
 
     def _get_observation(self):
-        asset_info = []
-        for pos in self.controller.get_open_positions():
-            closing_price, indicators = self.controller.get_position_data(pos)
-            asset_info.append(closing_price)
-            asset_info.extend(indicators)
+        self._obs_index ^= 1
+        observation = self._observations[self._obs_index]
 
-        observation = [self.cash_balance] + list(self.shares_owned) + asset_info
-        return np.array(observation, dtype=np.float32)
+        observation[0] = self.cash_balance
+        observation[1:1 + self.num_assets] = self.shares_owned
+        observation[1 + self.num_assets:] = self.controller.get_asset_info().reshape(-1)
+        return observation
 
     def step(self, action):  # Occurs at end of each day
-        # Perform the trades
-        for i, act in enumerate(action):
-            closing_price = self.controller.get_position_data(self.controller.positions[i])[0]
-            # TODO modify this behavior to limit purchasing
-            if act > 0:  # Buy shares
-                cost = act * closing_price
-                if self.cash_balance >= cost:
-                    self.cash_balance -= cost
-                    self.shares_owned[i] += act
-            elif act < 0:  # Sell shares
-                if self.shares_owned[i] >= act:
-                    self.cash_balance += act * closing_price
-                    self.shares_owned[i] -= act
+        # Perform the trades TODO modify this behavior to limit purchasing
+        if self.controller.executes_orders:
+            # One order per asset, filled by the controller (e.g. with slippage and fees)
+            self.controller.submit_orders(np.arange(self.num_assets), action)
+            self.cash_balance = float(self.controller.get_buying_power())
+            self.shares_owned[:] = self.controller.get_shares_owned()
+        else:
+            self.cash_balance = float(fill_orders(action, self.shares_owned, self.cash_balance,
+                                                  self.controller.get_closing_prices()))
+            self.controller.sync_holdings(self.cash_balance, self.shares_owned)
+        self.controller.update()
 
         # Calculate reward
         portfolio_value = self.controller.get_portfolio_value()
@@ -68,6 +99,8 @@ class MarketEnv(gym.Env):
         done = self.controller.is_done()
         info = {}
 
-        obs = self._get_observation()
-        print(f'Observation at step {self.controller.step - 1}: {obs}')
-        return obs, reward, done, info
+        tm = telemetry.get()
+        if tm.enabled:
+            tm.record('env/portfolio_value', portfolio_value, self.controller.step, level=telemetry.DEBUG)
+
+        return self._get_observation(), reward, done, info
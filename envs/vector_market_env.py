@@ -0,0 +1,133 @@
+import numpy as np
+from gymnasium import spaces
+
+import config
+from envs.episode_sampler import EpisodeSampler
+from envs.market_env import fill_orders
+from trading.training_controller import load_feature_tensor
+
+
+class VectorMarketEnv:
+    """
+    Steps num_envs independent MarketEnv episodes at once over one shared, memory-mapped feature tensor.
+
+    Each episode starts at its own random day and, when assets_per_env is set, trades its own random subset of tickers,
+    both drawn by an EpisodeSampler (by default one over the whole history).
+    All accounts are stored as (num_envs, assets) arrays, so a step is a handful of NumPy operations regardless of how
+    many episodes are running, and the policy can act on the whole (num_envs, obs_dim) batch in one forward pass.
+
+    Finished episodes are reset automatically. Their terminal observation is returned in info['final_observation'] and
+    info['truncated'] marks the ones that hit max_episode_steps rather than the end of the market data.
+
+    With a normalizer (see ObservationNormalizer), observations are normalized in place before they are returned, and
+    the normalizer's statistics are updated with every step's observations unless it is frozen.
+    """
+
+    def __init__(self, path: str = config.FEATURE_PATH, num_envs: int = config.NUM_ENVS, assets_per_env: int = None,
+                 max_episode_steps: int = 300, initial_balance: float = config.INITIAL_BALANCE, seed: int = None,
+                 normalizer=None, sampler: EpisodeSampler = None):
+        self.tickers, self.features = load_feature_tensor(path)
+        self.num_days, total_assets, self.asset_info_length = self.features.shape
+
+        self.num_envs = num_envs
+        self.num_assets = assets_per_env or total_assets
+        self.max_episode_steps = max_episode_steps
+        self.initial_balance = initial_balance
+        self.normalizer = normalizer
+        self.sampler = sampler or EpisodeSampler(self.num_days, total_assets, max_episode_steps, assets_per_env,
+                                                 seed=seed)
+        if self.sampler.assets_per_episode != self.num_assets:
+            raise ValueError(f'Sampler draws {self.sampler.assets_per_episode} assets, expected {self.num_assets}')
+
+        # Per-episode state
+        self.asset_index = np.tile(np.arange(self.num_assets), (num_envs, 1))
+        self.day = np.zeros(num_envs, dtype=np.int64)
+        self.episode_steps = np.zeros(num_envs, dtype=np.int64)
+        self.cash_balance = np.full(num_envs, initial_balance)
+        self.shares_owned = np.zeros((num_envs, self.num_assets), dtype=np.float32)
+        self._previous_portfolio_value = np.full(num_envs, initial_balance)
+
+        # Observation: [cash_balance, shares_owned, asset_info] per episode, double buffered like MarketEnv
+        obs_length = 1 + self.num_assets + self.num_assets * self.asset_info_length
+        self._observations = np.zeros((2, num_envs, obs_length), dtype=np.float32)
+        self._obs_index = 0
+
+        self.single_observation_space = spaces.Box(low=0, high=np.inf, shape=(obs_length,), dtype=np.float32)
+        self.single_action_space = spaces.Box(low=-5, high=5, shape=(self.num_assets,), dtype=np.int32)
+        self.observation_space = spaces.Box(low=0, high=np.inf, shape=(num_envs, obs_length), dtype=np.float32)
+        self.action_space = spaces.Box(low=-5, high=5, shape=(num_envs, self.num_assets), dtype=np.int32)
+
+    def seed(self, seed: int):
+        self.sampler.seed(seed)
+        self.action_space.seed(seed)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        self._reset_envs(np.arange(self.num_envs))
+        observation = self._get_observation()
+        if self.normalizer is not None:
+            self.normalizer.update(observation)
+            self.normalizer.normalize(observation, out=observation)
+        return observation
+
+    def _reset_envs(self, envs: np.ndarray):
+        # Draw new episode windows, with room for a full episode when the data allows it
+        self.day[envs], asset_index = self.sampler.sample(len(envs))
+        self.episode_steps[envs] = 0
+        if asset_index is not None:
+            self.asset_index[envs] = asset_index
+
+        self.cash_balance[envs] = self.initial_balance
+        self.shares_owned[envs] = 0
+        self._previous_portfolio_value[envs] = self.initial_balance
+
+    def _asset_info(self, envs=slice(None)) -> np.ndarray:
+        # (envs, num_assets, features) gather of each episode's current day and tickers
+        return self.features[self.day[envs, None], self.asset_index[envs]]
+
+    def _get_observation(self, asset_info: np.ndarray = None) -> np.ndarray:
+        self._obs_index ^= 1
+        observation = self._observations[self._obs_index]
+        self._write_observation(observation, slice(None), asset_info)
+        return observation
+
+    def _write_observation(self, observation: np.ndarray, envs, asset_info: np.ndarray = None):
+        if asset_info is None:
+            asset_info = self._asset_info(envs)
+
+        observation[envs, 0] = self.cash_balance[envs]
+        observation[envs, 1:1 + self.num_assets] = self.shares_owned[envs]
+        observation[envs, 1 + self.num_assets:] = asset_info.reshape(len(asset_info), -1)
+
+    def step(self, action):
+        # Perform the trades at today's closing prices
+        self.cash_balance = fill_orders(action, self.shares_owned, self.cash_balance, self._asset_info()[:, :, 0])
+
+        # Advance to the next day and value the portfolios there
+        self.day += 1
+        self.episode_steps += 1
+        asset_info = self._asset_info()
+        portfolio_value = self.cash_balance + (self.shares_owned * asset_info[:, :, 0]).sum(axis=1)
+        reward = portfolio_value - self._previous_portfolio_value
+        self._previous_portfolio_value = portfolio_value
+
+        terminated = self.day >= self.num_days - 1
+        truncated = ~terminated & (self.episode_steps >= self.max_episode_steps)
+        done = terminated | truncated
+
+        obs = self._get_observation(asset_info)
+        if self.normalizer is not None:
+            self.normalizer.update(obs)
+            self.normalizer.normalize(obs, out=obs)
+
+        info = {'truncated': truncated}
+        if done.any():
+            info['final_observation'] = obs.copy()
+            finished = np.flatnonzero(done)
+            self._reset_envs(finished)
+            self._write_observation(obs, finished)
+            if self.normalizer is not None:
+                obs[finished] = self.normalizer.normalize(obs[finished])
+
+        return obs, reward, done, info
@@ -1,36 +1,30 @@
+import contextlib
 import numpy as np
 import torch
-import gymnasium as gym
 import os
+import time
 
 import config
+import telemetry
+from envs.episode_sampler import EpisodeSampler, volatility_difficulty
+from envs.vector_market_env import VectorMarketEnv
 from model import td3, utils
-
-
-# Runs policy for X episodes and returns average reward
-# A fixed seed is used for the eval environment
-def eval_policy(policy, env_name, seed, eval_episodes=10):
-    eval_env = gym.make(env_name)
-    eval_env.seed(seed + 100)
-
-    avg_reward = 0.
-    for _ in range(eval_episodes):
-        state, done = eval_env.reset(), False
-        while not done:
-            action = policy.select_action(np.array(state))
-            state, reward, done, _ = eval_env.step(action)
-            avg_reward += reward
-
-    avg_reward /= eval_episodes
-
-    print("---------------------------------------")
-    print(f"Evaluation over {eval_episodes} episodes: {avg_reward:.3f}")
-    print("---------------------------------------")
-    return avg_reward
-
-
-if __name__ == "__main__":
-    file_name = f"TD3_{config.ENV}_{config.SEED}"
+from model.checkpoint import Checkpointer
+from model.evaluation import Evaluator
+from model.learner import AsyncLearner
+from trading.training_controller import load_feature_tensor
+
+
+def train(file_name: str = None, should_stop=None) -> list:
+    """
+    Runs one training job configured by the config module.
+
+    :param file_name: Name of the results and model files, defaults to one derived from the env and seed
+    :param should_stop: Called with the evaluations so far after every new evaluation, training ends early when it
+    returns True
+    :return: Average evaluation rewards
+    """
+    file_name = file_name or f"TD3_{config.ENV}_{config.SEED}"
     print("---------------------------------------")
     print(f"Policy: TD3, Env: {config.ENV}, Seed: {config.SEED}")
     print("---------------------------------------")
@@ -41,21 +35,36 @@ if __name__ == "__main__":
     if config.SAVE_MODEL and not os.path.exists("./models"):
         os.makedirs("./models")
 
-    env = gym.make(config.ENV)
+    # Training and evaluation episodes come from disjoint blocks of the history
+    _, features = load_feature_tensor(config.FEATURE_PATH)
+    split = {"val_fraction": config.VAL_FRACTION, "block_days": config.SPLIT_BLOCK_DAYS,
+             "split_seed": config.SPLIT_SEED}
+    difficulty = volatility_difficulty(features[:, :, 0], config.EPISODE_LENGTH) if config.CURRICULUM_STEPS else None
+    train_sampler = EpisodeSampler(len(features), features.shape[1], config.EPISODE_LENGTH,
+                                   split="train" if config.VAL_FRACTION else None, difficulty=difficulty,
+                                   seed=config.SEED, **split)
+    eval_sampler = EpisodeSampler(len(features), features.shape[1], config.EPISODE_LENGTH,
+                                  split="val" if config.VAL_FRACTION else None, **split)
+
+    env = VectorMarketEnv(config.FEATURE_PATH, config.NUM_ENVS, max_episode_steps=config.EPISODE_LENGTH,
+                          seed=config.SEED, sampler=train_sampler)
+    normalizer = None
+    if config.NORMALIZE_OBSERVATIONS:
+        normalizer = env.normalizer = utils.ObservationNormalizer(env.asset_info_length, config.NORMALIZE_CLIP)
 
     # Set seeds
     env.seed(config.SEED)
-    env.action_space.seed(config.SEED)
     torch.manual_seed(config.SEED)
     np.random.seed(config.SEED)
 
-    state_dim = env.observation_space.shape[0]
-    action_dim = env.action_space.shape[0]
-    max_action = float(env.action_space.high[0])
+    state_dim = env.single_observation_space.shape[0]
+    action_dim = env.single_action_space.shape[0]
+    max_action = float(env.single_action_space.high[0])
 
     kwargs = {"state_dim": state_dim, "action_dim": action_dim, "max_action": max_action, "discount": config.DISCOUNT,
               "tau": config.TAU, "policy_noise": config.POLICY_NOISE * max_action,
-              "noise_clip": config.NOISE_CLIP * max_action, "policy_freq": config.POLICY_FREQ}
+              "noise_clip": config.NOISE_CLIP * max_action, "policy_freq": config.POLICY_FREQ,
+              "fused": config.FUSED_UPDATE, "compile": config.TORCH_COMPILE}
 
     # Target policy smoothing is scaled wrt the action scale
     policy = td3.TD3(**kwargs)
@@ -63,57 +72,176 @@ if __name__ == "__main__":
     if config.LOAD_MODEL != "":
         policy_file = file_name if config.LOAD_MODEL == "default" else config.LOAD_MODEL
         policy.load(f"./models/{policy_file}")
-
-    replay_buffer = utils.ReplayBuffer(state_dim, action_dim)
+        if normalizer is not None and os.path.exists(f"./models/{policy_file}_normalizer"):
+            normalizer.load(f"./models/{policy_file}")
+
+    if config.REPLAY_BUFFER == "prioritized":
+        replay_buffer = utils.PrioritizedReplayBuffer(state_dim, action_dim, num_envs=env.num_envs,
+                                                      alpha=config.PER_ALPHA, beta=config.PER_BETA,
+                                                      beta_steps=int(config.MAX_TIMESTEPS))
+    elif config.REPLAY_BUFFER == "compact":
+        replay_buffer = utils.CompactReplayBuffer(state_dim, action_dim, num_envs=env.num_envs)
+    else:
+        replay_buffer = utils.ReplayBuffer(state_dim, action_dim)
+
+    # Resume the full training state of an interrupted run
+    checkpointer = Checkpointer(config.CHECKPOINT_PATH)
+    counters = checkpointer.load(policy, replay_buffer) if config.RESUME and checkpointer.exists() else None
+    if counters is not None and normalizer is not None and counters.get("normalizer") is not None:
+        normalizer.load_state_dict(counters["normalizer"])
+    if counters is not None and counters.get("sampler") is not None:
+        train_sampler.load_state_dict(counters["sampler"])
+
+    # Learn on a background thread while this loop keeps acting, except under cProfile which only sees this thread
+    learner = None
+    if config.ASYNC_LEARNER and config.PROFILE != "cprofile":
+        learner = AsyncLearner(policy, replay_buffer, config.BATCH_SIZE, config.UPDATE_TO_DATA_RATIO,
+                               config.ACTOR_SYNC_FREQ)
+        replay_buffer = learner.replay_buffer
+    pending_updates = 0.
 
     # Evaluate untrained policy
-    evaluations = [eval_policy(policy, config.ENV, config.SEED)]
-
-    state, done = env.reset(), False
-    episode_reward = 0
-    episode_timesteps = 0
-    episode_num = 0
-
-    for t in range(int(config.MAX_TIMESTEPS)):  # TODO remove config, use based on market data length
+    evaluator = Evaluator(config.FEATURE_PATH, config.SEED, config.EVAL_EPISODES, config.EPISODE_LENGTH,
+                          eval_sampler)
+    evaluations = [evaluator.evaluate(policy.actor, normalizer)] if counters is None else counters["evaluations"]
+    pending_evaluations = []
+
+    tm = telemetry.configure(config.TELEMETRY, path=config.TELEMETRY_PATH, level=config.TELEMETRY_LEVEL,
+                             sample_every=config.TELEMETRY_SAMPLE_EVERY)
+    profiler = telemetry.Profiler(config.PROFILE, config.PROFILE_PATH, int(config.START_TIMESTEPS),
+                                  config.PROFILE_STEPS)
+    last_rate_time, last_rate_t, last_rate_updates = time.perf_counter(), 0, 0
+    total_updates = 0
+    start_t, episode_num = 0, 0
+    if counters is not None:
+        start_t, episode_num = counters["t"], counters["episode_num"]
+        total_updates, pending_updates = counters["total_updates"], counters["pending_updates"]
+        print(f"Resuming from {config.CHECKPOINT_PATH} at t={start_t}")
+
+    # Resumed runs start fresh episodes, the replay buffer treats the interrupted ones as ended
+    state = env.reset()
+    episode_reward = np.zeros(env.num_envs)
+    episode_timesteps = np.zeros(env.num_envs, dtype=int)
+    reported_evaluations = len(evaluations)
+
+    # Every tick steps all NUM_ENVS episodes, so t counts individual environment steps
+    for t in range(start_t, int(config.MAX_TIMESTEPS), env.num_envs):  # TODO remove config, use based on market data length
 
         episode_timesteps += 1
+        profiler.step(t)
+        if config.CURRICULUM_STEPS:
+            train_sampler.set_progress(t / config.CURRICULUM_STEPS)
 
-        # Select action randomly or according to policy
+        # Select actions randomly or according to policy, one actor forward pass for the whole batch
         if t < config.START_TIMESTEPS:  # TODO adjust this to accurately reflect market data length
             action = env.action_space.sample()
         else:
             action = (
-                    policy.select_action(np.array(state))
-                    + np.random.normal(0, max_action * config.EXPL_NOISE, size=action_dim)
+                    (learner or policy).select_actions(state)
+                    + np.random.normal(0, max_action * config.EXPL_NOISE, size=(env.num_envs, action_dim))
             ).clip(-max_action, max_action)
 
-        # Perform action
-        next_state, reward, done, _ = env.step(action)
-        done_bool = float(done) if episode_timesteps < env._max_episode_steps else 0
+        # Perform actions
+        next_state, reward, done, info = env.step(action)
+
+        # Finished episodes were already reset, so their transition ends in the stored terminal observation
+        # Episodes cut off by the time limit keep not_done = 1
+        transition_next_state = np.where(done[:, None], info.get('final_observation', next_state), next_state)
+        done_bool = (done & ~info['truncated']).astype(float)
 
         # Store data in replay buffer
-        replay_buffer.add(state, action, next_state, reward, done_bool)
+        replay_buffer.add_batch(state, action, transition_next_state, reward, done_bool, done)
 
         state = next_state
         episode_reward += reward
 
-        # Train agent after collecting sufficient data
+        # Train agent after collecting sufficient data, UPDATE_TO_DATA_RATIO updates per environment step
         if t >= config.START_TIMESTEPS:
-            policy.train(replay_buffer, config.BATCH_SIZE)
-
-        if done:
-            # +1 to account for 0 indexing. +0 on ep_timesteps since it will increment +1 even if done=True
-            print(
-                f"Total T: {t + 1} Episode Num: {episode_num + 1} Episode T: {episode_timesteps} Reward: {episode_reward:.3f}")
-            # Reset environment
-            state, done = env.reset(), False
-            episode_reward = 0
-            episode_timesteps = 0
+            if learner is not None:
+                if not learner.started:
+                    learner.start()
+                learner.add_env_steps(env.num_envs)
+            else:
+                pending_updates += config.UPDATE_TO_DATA_RATIO * env.num_envs
+                while pending_updates >= 1:
+                    policy.train(replay_buffer, config.BATCH_SIZE)
+                    pending_updates -= 1
+                    total_updates += 1
+
+        if tm.enabled:
+            tm.step = t
+            if tm.should_record('collect/steps_per_sec'):
+                now = time.perf_counter()
+                updates = learner.updates if learner is not None else total_updates
+                tm.write('collect/steps_per_sec', (t - last_rate_t) / (now - last_rate_time))
+                tm.write('train/updates_per_sec', (updates - last_rate_updates) / (now - last_rate_time))
+                tm.write('replay/fill', replay_buffer.size / replay_buffer.max_size)
+                last_rate_time, last_rate_t, last_rate_updates = now, t, updates
+
+        for i in np.flatnonzero(done):
+            # Every episode is logged, only per-step metrics are sampled
+            if tm.enabled:
+                tm.write('episode/reward', episode_reward[i], t + 1)
+                tm.write('episode/length', episode_timesteps[i], t + 1)
+            # Environment was reset by the vectorized env
+            episode_reward[i] = 0
+            episode_timesteps[i] = 0
             episode_num += 1
 
         # Evaluate episode
-        if (t + 1) % config.EVAL_FREQ == 0:
-            evaluations.append(eval_policy(policy, config.ENV, config.SEED))
+        if (t + env.num_envs) // config.EVAL_FREQ > t // config.EVAL_FREQ:
+            with learner.weights_lock if learner is not None else contextlib.nullcontext():
+                if config.ASYNC_EVAL:
+                    pending_evaluations.append(evaluator.submit(policy.actor, normalizer))
+                else:
+                    evaluations.append(evaluator.evaluate(policy.actor, normalizer))
+                    tm.write('eval/avg_reward', evaluations[-1])
+                    np.save(f"./results/{file_name}", evaluations)
+                if config.SAVE_MODEL:
+                    policy.save(f"./models/{file_name}")
+                    if normalizer is not None:
+                        normalizer.save(f"./models/{file_name}")
+
+        # Collect finished background evaluations in submission order
+        while pending_evaluations and pending_evaluations[0].done():
+            evaluations.append(pending_evaluations.pop(0).result())
+            tm.write('eval/avg_reward', evaluations[-1])
             np.save(f"./results/{file_name}", evaluations)
-            if config.SAVE_MODEL:
-                policy.save(f"./models/{file_name}")
+
+        if should_stop is not None and len(evaluations) > reported_evaluations:
+            reported_evaluations = len(evaluations)
+            if should_stop(evaluations):
+                print(f"Stopping early at t={t + env.num_envs}")
+                break
+
+        # Checkpoint the full training state, the replay buffer rows are written in the background
+        if config.CHECKPOINT_FREQ and (t + env.num_envs) // config.CHECKPOINT_FREQ > t // config.CHECKPOINT_FREQ:
+            # Wait for evaluations still running, a resumed run could not redo them
+            while pending_evaluations:
+                evaluations.append(pending_evaluations.pop(0).result())
+                tm.write('eval/avg_reward', evaluations[-1])
+                np.save(f"./results/{file_name}", evaluations)
+
+            with learner.weights_lock if learner is not None else contextlib.nullcontext():
+                checkpointer.save(policy, replay_buffer, t=t + env.num_envs, episode_num=episode_num,
+                                  evaluations=evaluations, total_updates=total_updates,
+                                  pending_updates=pending_updates,
+                                  normalizer=None if normalizer is None else normalizer.state_dict(),
+                                  sampler=train_sampler.state_dict())
+
+    profiler.close()
+    if learner is not None:
+        learner.stop()
+
+    while pending_evaluations:
+        evaluations.append(pending_evaluations.pop(0).result())
+        tm.write('eval/avg_reward', evaluations[-1])
+    evaluator.close()
+    checkpointer.close()
+    tm.close()
+    np.save(f"./results/{file_name}", evaluations)
+    return evaluations
+
+
+if __name__ == "__main__":
+    train()
@@ -0,0 +1,137 @@
+"""
+feature-store
+
+A persistent, columnar on-disk store for raw price history and computed features, replacing one-off CSV dumps.
+
+Each (kind, ticker) entry is a directory holding one raw binary file per column plus meta.json. Columns are appended
+in place and read back as memory maps, so reads only touch the requested columns and date range. meta.json records the
+row count (bytes past it are an interrupted append and are ignored), the column dtypes, a content hash of everything
+appended so far and any parameters the entry was computed with, which is how stale features are detected.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+class FeatureStore(object):
+    def __init__(self, root: str = config.STORE_PATH):
+        self.root = root
+
+    def _path(self, kind: str, ticker: str, name: str = '') -> str:
+        return os.path.join(self.root, kind, ticker, name)
+
+    def meta(self, kind: str, ticker: str) -> dict:
+        """
+        :return: The entry's metadata, or None if it does not exist
+        """
+        try:
+            with open(self._path(kind, ticker, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, kind: str, ticker: str, meta: dict):
+        tmp_path = self._path(kind, ticker, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(kind, ticker, 'meta.json'))  # Atomic, readers never see a partial append
+
+    def last_date(self, kind: str, ticker: str) -> pd.Timestamp:
+        meta = self.meta(kind, ticker)
+        return None if meta is None or meta['last_date'] is None else pd.Timestamp(meta['last_date'])
+
+    def write(self, kind: str, ticker: str, df: pd.DataFrame, **params) -> dict:
+        """
+        Replaces an entry with the given DataFrame.
+
+        :param df: DataFrame with a 'date' column in chronological order
+        :param params: JSON serializable parameters the data was computed with, checked by is_valid
+        :return: The entry's metadata
+        """
+        shutil.rmtree(self._path(kind, ticker), ignore_errors=True)
+        return self.append(kind, ticker, df, **params)
+
+    def append(self, kind: str, ticker: str, df: pd.DataFrame, **params) -> dict:
+        """
+        Appends the rows of df dated after the last stored date. Columns must match the existing entry.
+
+        :param df: DataFrame with a 'date' column in chronological order
+        :param params: JSON serializable parameters the data was computed with, checked by is_valid
+        :return: The entry's metadata
+        """
+        meta = self.meta(kind, ticker)
+        if meta is None:
+            os.makedirs(self._path(kind, ticker), exist_ok=True)
+            meta = {'columns': {}, 'rows': 0, 'last_date': None, 'hash': '', 'params': params}
+            for column in df.columns:
+                dtype = np.dtype('int64') if column == 'date' else df[column].to_numpy().dtype
+                meta['columns'][column] = dtype.str
+        elif set(df.columns) != set(meta['columns']):
+            raise ValueError(f'Columns {list(df.columns)} do not match stored columns {list(meta["columns"])}')
+
+        if meta['last_date'] is not None:
+            df = df[df.date > pd.Timestamp(meta['last_date'])]
+        if df.empty:
+            return meta
+
+        content_hash = hashlib.sha256(meta['hash'].encode())
+        for column, dtype in meta['columns'].items():
+            values = df[column].to_numpy()
+            values = values.astype('datetime64[ns]').view('int64') if column == 'date' else values.astype(dtype)
+            data = np.ascontiguousarray(values).tobytes()
+            content_hash.update(data)
+
+            with open(self._path(kind, ticker, column), 'ab') as f:
+                f.truncate(meta['rows'] * np.dtype(dtype).itemsize)  # Drop bytes of an interrupted append
+                f.write(data)
+
+        meta['rows'] += len(df)
+        meta['last_date'] = str(df.date.iloc[-1])
+        meta['hash'] = content_hash.hexdigest()
+        meta['params'] = params or meta['params']
+        self._write_meta(kind, ticker, meta)
+        return meta
+
+    def read(self, kind: str, ticker: str, columns: list = None, start=None, end=None) -> pd.DataFrame:
+        """
+        Reads an entry, optionally only some columns and an inclusive date range. Data is memory-mapped, so only the
+        requested slice is read from disk.
+
+        :return: DataFrame with a 'date' column followed by the requested columns
+        """
+        meta = self.meta(kind, ticker)
+        if meta is None:
+            raise KeyError(f'No {kind} data stored for {ticker}')
+
+        dates = self._column(kind, ticker, meta, 'date')
+        lo = 0 if start is None else np.searchsorted(dates, pd.Timestamp(start).value, side='left')
+        hi = len(dates) if end is None else np.searchsorted(dates, pd.Timestamp(end).value, side='right')
+
+        data = {'date': dates[lo:hi].astype('datetime64[ns]')}
+        for column in columns or [column for column in meta['columns'] if column != 'date']:
+            data[column] = np.array(self._column(kind, ticker, meta, column)[lo:hi])
+        return pd.DataFrame(data)
+
+    def _column(self, kind: str, ticker: str, meta: dict, column: str) -> np.ndarray:
+        if meta['rows'] == 0:
+            return np.empty(0, dtype=meta['columns'][column])
+        return np.memmap(self._path(kind, ticker, column), dtype=meta['columns'][column], mode='r',
+                         shape=(meta['rows'],))
+
+    def content_hash(self, kind: str, ticker: str) -> str:
+        meta = self.meta(kind, ticker)
+        return None if meta is None else meta['hash']
+
+    def is_valid(self, kind: str, ticker: str, **params) -> bool:
+        """
+        Whether an entry exists and was computed with exactly these parameters, for example the content hash of its
+        source data and the indicator settings.
+        """
+        meta = self.meta(kind, ticker)
+        return meta is not None and meta['params'] == json.loads(json.dumps(params))
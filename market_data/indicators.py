@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from ta.momentum import RSIIndicator, StochasticOscillator, ROCIndicator, WilliamsRIndicator
 from ta.trend import MACD, SMAIndicator, EMAIndicator
@@ -69,3 +70,63 @@ def _build_indicator_classes(df: pd.DataFrame, window: int) -> dict:
         'ema': EMAIndicator(close=df['close'], window=window, fillna=True),
         'sma': SMAIndicator(close=df['close'], window=window, fillna=True)
     }
+
+
+# Indicator columns in the order add_technical_indicators adds them
+INDICATORS = ['adi', 'obv', 'rsi', 'sr', 'roc', 'wr', 'macd', 'ema', 'sma', 'disp_index']
+
+
+def batch_technical_indicators(high: pd.DataFrame, low: pd.DataFrame, close: pd.DataFrame, volume: pd.DataFrame,
+                               window: int = config.LOOK_BACK_WINDOW) -> dict:
+    """
+    Computes the same ten indicators as add_technical_indicators for many tickers at once. Every input is a wide
+    (dates x tickers) DataFrame and every formula is applied column-wise, reproducing the ta library with fillna=True.
+
+    Parameters:
+    high, low, close, volume (pd.DataFrame): Aligned DataFrames with one column per ticker.
+    window (int): Look-back window period for indicators.
+
+    Returns:
+    dict: Indicator name -> (dates x tickers) DataFrame, in INDICATORS order.
+    """
+    indicators = {}
+
+    # Accumulation/Distribution Index (ADI)
+    clv = (((close - low) - (high - close)) / (high - low)).fillna(0.0)
+    indicators['adi'] = _fill((clv * volume).cumsum(), 0)
+
+    # On-Balance Volume (OBV)
+    indicators['obv'] = _fill(volume.where(~(close < close.shift(1)), -volume).cumsum(), 0)
+
+    # Relative Strength Index (RSI)
+    diff = close.diff(1)
+    ema_up = diff.where(diff > 0, 0.0).ewm(alpha=1 / window, min_periods=0, adjust=False).mean()
+    ema_down = (-diff.where(diff < 0, 0.0)).ewm(alpha=1 / window, min_periods=0, adjust=False).mean()
+    indicators['rsi'] = _fill((100 - (100 / (1 + ema_up / ema_down))).where(ema_down != 0, 100.), 50)
+
+    # Stochastic Oscillator (SR) and Williams %R (WR)
+    lowest_low = low.rolling(window, min_periods=0).min()
+    highest_high = high.rolling(window, min_periods=0).max()
+    indicators['sr'] = _fill(100 * (close - lowest_low) / (highest_high - lowest_low), 50)
+
+    # Rate of Change (ROC)
+    indicators['roc'] = _fill(((close - close.shift(window)) / close.shift(window)) * 100, 0)
+
+    indicators['wr'] = _fill(-100 * (highest_high - close) / (highest_high - lowest_low), -50)
+
+    # Moving Average Convergence Divergence (MACD)
+    indicators['macd'] = _fill(close.ewm(span=12, min_periods=0, adjust=False).mean()
+                               - close.ewm(span=26, min_periods=0, adjust=False).mean(), 0)
+
+    # Exponential Moving Average (EMA) and Simple Moving Average (SMA)
+    indicators['ema'] = _fill(close.ewm(span=window, min_periods=0, adjust=False).mean(), 0)
+    indicators['sma'] = _fill(close.rolling(window, min_periods=0).mean(), 0)
+
+    indicators['disp_index'] = (close / indicators['ema']) * 100
+
+    return indicators
+
+
+def _fill(df: pd.DataFrame, value: float) -> pd.DataFrame:
+    # ta's fillna=True: infinities become NaN, then forward fill and fall back to value
+    return df.replace([np.inf, -np.inf], np.nan).ffill().fillna(value)
@@ -1,18 +1,24 @@
+import functools
 import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import exchange_calendars as xcals
 import pandas as pd
 
-from market_data.indicators import add_technical_indicators
+import config
+from market_data.feature_store import FeatureStore
+from market_data.indicators import INDICATORS, add_technical_indicators, batch_technical_indicators
+from trading.training_controller import FEATURES, SENTIMENT_FEATURES, save_feature_tensor
 
 
-def preprocess(df: pd.DataFrame, save_csv=True):
+def preprocess(df: pd.DataFrame, save_csv=False):
     # Remove timestamps that do not correspond with open market days
     # Note: not necessary when using yahoo finance, but would be useful for removing weekend/holiday sentiment analysis
     open_dates = _get_open_dates(df.iloc[0].date, df.iloc[-1].date)
-    df.drop(df[df.date != open_dates].index, inplace=True)
+    df.drop(df[~df.date.isin(open_dates)].index, inplace=True)
 
     # Remove adj_close
     df.drop(columns=['adj_close'], inplace=True)
@@ -33,7 +39,7 @@ def preprocess(df: pd.DataFrame, save_csv=True):
     """
     df_indicators.drop(columns=['date'], inplace=True)
 
-    # TODO regularize all columns except date by normalizing the observation space using Batch Normalization
+    # Features are left unscaled here, observations are standardized during training by ObservationNormalizer
 
     if save_csv:
         os.makedirs('./preprocessed', exist_ok=True)
@@ -42,11 +48,94 @@ def preprocess(df: pd.DataFrame, save_csv=True):
     return df_indicators
 
 
+def preprocess_batch(tickers: list, store: FeatureStore = None, max_workers: int = None,
+                     save_features: bool = True) -> pd.DataFrame:
+    """
+    Preprocesses many tickers into one panel aligned to a shared set of trading sessions.
+
+    Indicators are computed over each ticker's full raw history with batch_technical_indicators, one vectorized pass
+    per chunk of tickers with the chunks spread over a process pool, and cached in the feature store, keyed by the
+    content hash of the raw data and the indicator parameters, so only tickers whose data or parameters changed are
+    recomputed. Every ticker is then cut to the sessions all of them have data for, so all assets have an equal length
+    of history, and missing bars inside that range are forward filled. When sentiment scores were ingested for any of
+    the tickers (see market_data.sentiment), SENTIMENT_FEATURES are appended as extra feature columns, zero for
+    sessions without records.
+
+    :param tickers: Ticker symbols with raw data in the store (see yh_finance.get_historical_data)
+    :param store: Feature store holding the 'raw' bars and caching the computed 'features'
+    :param max_workers: Process pool size and number of ticker chunks, defaults to the number of CPUs
+    :param save_features: Also write the panel as the memory-mapped training feature tensor
+    :return: DataFrame indexed by session with (ticker, feature) columns
+    """
+    store = store or FeatureStore()
+    params = {ticker: {'source_hash': store.content_hash('raw', ticker), 'window': config.LOOK_BACK_WINDOW,
+                       'features': FEATURES} for ticker in tickers}
+
+    stale = [ticker for ticker in tickers if not store.is_valid('features', ticker, **params[ticker])]
+    if stale:
+        num_chunks = min(max_workers or os.cpu_count(), len(stale))
+        chunks = [stale[i::num_chunks] for i in range(num_chunks)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            raw = ([store.read('raw', ticker) for ticker in chunk] for chunk in chunks)
+            for chunk, frames in zip(chunks, executor.map(_preprocess_chunk, raw)):
+                for ticker, df in zip(chunk, frames):
+                    store.write('features', ticker, df, **params[ticker])
+
+    frames = {ticker: store.read('features', ticker) for ticker in tickers}
+
+    # Shared session index: the sessions every ticker has data for
+    start_date = max(df.date.iloc[0] for df in frames.values())
+    end_date = min(df.date.iloc[-1] for df in frames.values())
+    sessions = _get_open_dates(start_date, end_date)
+
+    aligned = {ticker: df.set_index('date')[FEATURES].reindex(sessions).ffill() for ticker, df in frames.items()}
+
+    features = FEATURES
+    if any(store.meta('sentiment', ticker) is not None for ticker in tickers):
+        features = FEATURES + SENTIMENT_FEATURES
+        for ticker in tickers:
+            if store.meta('sentiment', ticker) is None:
+                sentiment = pd.DataFrame(0., index=sessions, columns=SENTIMENT_FEATURES, dtype='float32')
+            else:
+                sentiment = store.read('sentiment', ticker, SENTIMENT_FEATURES, sessions[0], sessions[-1])
+                sentiment = sentiment.set_index('date').reindex(sessions, fill_value=0.)
+            aligned[ticker] = pd.concat([aligned[ticker], sentiment], axis=1)
+
+    if save_features:
+        save_feature_tensor(aligned, config.FEATURE_PATH, features)
+    return pd.concat(aligned, axis=1)
+
+
+def _preprocess_chunk(raw: list) -> list:
+    # Same features as preprocess for every ticker of the chunk, with the indicators computed in one batched pass
+    bars = []
+    for df in raw:
+        open_dates = _get_open_dates(df.date.iloc[0], df.date.iloc[-1])
+        bars.append(df[df.date.isin(open_dates)].reset_index(drop=True))
+
+    # Columns are aligned by bar number rather than date, so each one holds exactly its own ticker's history and only
+    # trails off with NaN after the last bar, where nothing is read back
+    wide = {name: pd.concat([df[name].astype('float64') for df in bars], axis=1, keys=range(len(bars)))
+            for name in ('high', 'low', 'close', 'volume')}
+    indicators = batch_technical_indicators(wide['high'], wide['low'], wide['close'], wide['volume'],
+                                            config.LOOK_BACK_WINDOW)
+
+    frames = []
+    for i, df in enumerate(bars):
+        columns = {'close': df.close, **{name: indicators[name][i].iloc[:len(df)] for name in INDICATORS}}
+        frames.append(pd.DataFrame({'date': df.date, **columns}).astype({feature: 'float32' for feature in FEATURES}))
+    return frames
+
+
 def _get_open_dates(start_date: datetime, end_date: datetime):
-    xnys = xcals.get_calendar("XNYS")  # New York Stock Exchange
-    return xnys.sessions_in_range(str(start_date), str(end_date))
+    return _get_calendar().sessions_in_range(str(start_date), str(end_date))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_calendar():
+    return xcals.get_calendar("XNYS")  # New York Stock Exchange
 
 
 if __name__ == "__main__":
-    df = pd.read_csv("./csv/yh_finance_data_MSFT.csv", parse_dates=['date'])
-    print(preprocess(df).info())
+    # Usage: python -m market_data.preprocess [TICKER ...]
+    print(preprocess_batch(sys.argv[1:] or ['MSFT']).info())
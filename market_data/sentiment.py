@@ -0,0 +1,177 @@
+"""
+sentiment
+
+Per-session market sentiment from timestamped text records such as headlines or posts.
+
+Records are streamed from local CSV or JSON lines files (columns timestamp, ticker and text) in fixed-size chunks, so
+memory use does not depend on the size of the input. Every chunk is scored in one batch and reduced to per ticker,
+per trading session sums and counts right away. Records are assigned to the XNYS session they can first affect:
+anything published after a session's close, or on a weekend or holiday, counts towards the next session.
+
+Scorers are pluggable: any object with a score(texts) method returning one score in [-1, 1] per text can be used,
+for example a wrapper around a neural language model. The built-in LexiconScorer tokenizes and scores a whole batch
+with vectorized pandas/NumPy operations and handles millions of records per hour on one core.
+
+The aggregated scores are written to the feature store as 'sentiment' entries, which preprocess_batch appends to the
+technical indicators as extra feature columns (see SENTIMENT_FEATURES).
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+from market_data.feature_store import FeatureStore
+from market_data.preprocess import _get_calendar, _get_open_dates
+from trading.training_controller import SENTIMENT_FEATURES
+
+RECORD_COLUMNS = ['timestamp', 'ticker', 'text']
+
+# Small finance lexicon of word valences, in the spirit of the Loughran-McDonald word lists
+LEXICON = {
+    'beat': 1., 'beats': 1., 'bullish': 1., 'buy': .5, 'gain': .75, 'gains': .75, 'growth': .75, 'high': .25,
+    'outperform': 1., 'profit': .75, 'profitable': .75, 'rally': 1., 'record': .5, 'rise': .5, 'rises': .5,
+    'soar': 1., 'soars': 1., 'strong': .75, 'surge': 1., 'surges': 1., 'up': .25, 'upgrade': 1., 'upgraded': 1.,
+    'win': .75, 'bankruptcy': -1., 'bearish': -1., 'crash': -1., 'cut': -.5, 'cuts': -.5, 'decline': -.75,
+    'declines': -.75, 'default': -1., 'down': -.25, 'downgrade': -1., 'downgraded': -1., 'drop': -.75,
+    'drops': -.75, 'fall': -.5, 'falls': -.5, 'fraud': -1., 'investigation': -.75, 'lawsuit': -.75, 'loss': -.75,
+    'losses': -.75, 'low': -.25, 'miss': -1., 'misses': -1., 'plunge': -1., 'plunges': -1., 'recall': -.5,
+    'sell': -.5, 'slump': -1., 'underperform': -1., 'warning': -.75, 'weak': -.75,
+}
+
+# Words that flip the valence of the word following them
+NEGATIONS = ('no', 'not', 'never', "isn't", "didn't", "doesn't", "won't", 'without')
+
+
+class LexiconScorer(object):
+    """
+    Scores texts by the summed valence of their lexicon words, squashed into [-1, 1] as s / sqrt(s^2 + alpha).
+
+    A batch is scored without a Python loop over records: all texts are tokenized at once, the tokens are flattened
+    into one array with the index of the record they came from, and valences are looked up and summed per record with
+    a single bincount.
+
+    :param lexicon: Word to valence mapping, defaults to LEXICON
+    :param negations: Words that flip the valence of the next word
+    :param alpha: Normalization constant, larger values need more sentiment words for a score near -1 or 1
+    """
+
+    def __init__(self, lexicon: dict = None, negations=NEGATIONS, alpha: float = 4.):
+        self.lexicon = pd.Series(lexicon or LEXICON, dtype=np.float64)
+        self.negations = pd.Index(negations)
+        self.alpha = alpha
+
+    def score(self, texts) -> np.ndarray:
+        tokens = pd.Series(texts, dtype=object).str.lower().str.findall(r"[a-z']+").explode()
+        records = tokens.index.to_numpy()
+        words = pd.Index(tokens.to_numpy(dtype=object))
+
+        valence = self.lexicon.reindex(words).to_numpy(dtype=np.float64, copy=True)  # Writable, negations flip it
+        negated = words.isin(self.negations)
+        valence[1:] *= np.where(negated[:-1] & (records[1:] == records[:-1]), -1., 1.)
+
+        total = np.bincount(records, weights=np.nan_to_num(valence), minlength=len(texts))
+        return total / np.sqrt(total ** 2 + self.alpha)
+
+
+def load_lexicon(path: str) -> dict:
+    # Reads a lexicon of "word<TAB>valence" lines
+    lexicon = pd.read_csv(path, sep='\t', names=['word', 'valence'], comment='#')
+    return dict(zip(lexicon.word.str.lower(), lexicon.valence.astype(float)))
+
+
+def read_records(paths: list, chunk_size: int = 100_000):
+    """
+    Streams text records from CSV (.csv) and JSON lines (.jsonl, .json) files.
+
+    :return: Generator of DataFrames of at most chunk_size rows with RECORD_COLUMNS
+    """
+    for path in paths:
+        if path.endswith('.csv'):
+            reader = pd.read_csv(path, usecols=RECORD_COLUMNS, chunksize=chunk_size)
+        elif path.endswith(('.jsonl', '.json')):
+            reader = pd.read_json(path, lines=True, chunksize=chunk_size)
+        else:
+            raise ValueError(f'Unsupported record file {path}, expected .csv or .jsonl')
+
+        with reader:
+            for chunk in reader:
+                yield chunk[RECORD_COLUMNS]
+
+
+def assign_sessions(timestamps: pd.Series) -> np.ndarray:
+    """
+    Maps publication times to the first XNYS session whose close is at or after them. Times without a time zone are
+    taken as UTC.
+
+    :return: Session date per timestamp, NaT for timestamps before the calendar's first session or past its end
+    """
+    calendar = _get_calendar()
+    timestamps = pd.to_datetime(timestamps, utc=True)
+    start = max(timestamps.min().tz_localize(None).normalize(), calendar.first_session)
+    end = timestamps.max().tz_localize(None).normalize() + pd.Timedelta(days=7)  # Past any run of closed days
+    end = max(min(end, calendar.last_session), start)
+
+    sessions = _get_open_dates(start, end)
+    closes = pd.to_datetime(calendar.closes.loc[sessions], utc=True).to_numpy(dtype='datetime64[ns]')
+
+    position = np.searchsorted(closes, timestamps.to_numpy(dtype='datetime64[ns]'), side='left')
+    result = np.full(len(timestamps), np.datetime64('NaT'), dtype='datetime64[ns]')
+    # The sessions before the calendar starts are unknown, so older records are not assigned to its first session
+    before = timestamps.to_numpy(dtype='datetime64[ns]') < np.datetime64(calendar.first_session.tz_localize(None), 'ns')
+    valid = (position < len(sessions)) & ~before
+    result[valid] = sessions.to_numpy(dtype='datetime64[ns]')[position[valid]]
+    return result
+
+
+def aggregate_sentiment(records, scorer=None, tickers: list = None) -> pd.DataFrame:
+    """
+    Scores a stream of record chunks and aggregates the scores per ticker and session.
+
+    :param records: Iterable of DataFrames with RECORD_COLUMNS, e.g. from read_records
+    :param scorer: Object with a score(texts) method, defaults to a LexiconScorer
+    :param tickers: Only keep records of these tickers
+    :return: DataFrame with columns ['ticker', 'date', 'sentiment', 'sentiment_volume'] where sentiment is the mean
+    score and sentiment_volume the number of records
+    """
+    scorer = scorer or LexiconScorer()
+
+    partials = []
+    for chunk in records:
+        if tickers is not None:
+            chunk = chunk[chunk.ticker.isin(tickers)]
+        if chunk.empty:
+            continue
+
+        scored = pd.DataFrame({'ticker': chunk.ticker.to_numpy(), 'date': assign_sessions(chunk.timestamp),
+                               'score': scorer.score(chunk.text.to_numpy()), 'count': 1})
+        partials.append(scored.dropna(subset=['date']).groupby(['ticker', 'date'])[['score', 'count']].sum())
+
+    if not partials:
+        return pd.DataFrame(columns=['ticker', 'date'] + SENTIMENT_FEATURES)
+
+    totals = pd.concat(partials).groupby(level=['ticker', 'date']).sum()
+    return pd.DataFrame({'sentiment': totals.score / totals['count'],
+                         'sentiment_volume': totals['count']}).astype('float32').reset_index()
+
+
+def ingest_sentiment(paths: list, store: FeatureStore = None, scorer=None, tickers: list = None,
+                     chunk_size: int = 100_000) -> pd.DataFrame:
+    """
+    Scores record files and writes the per-session aggregates to the feature store, replacing each ticker's previous
+    'sentiment' entry.
+
+    :param paths: CSV or JSON lines files of records, see read_records
+    :return: The aggregated scores, see aggregate_sentiment
+    """
+    store = store or FeatureStore()
+    scorer = scorer or LexiconScorer()
+    sentiment = aggregate_sentiment(read_records(paths, chunk_size), scorer, tickers)
+
+    for ticker, df in sentiment.groupby('ticker'):
+        store.write('sentiment', ticker, df.drop(columns='ticker').sort_values('date'), scorer=type(scorer).__name__)
+    return sentiment
+
+
+if __name__ == "__main__":
+    # Usage: python -m market_data.sentiment FILE [FILE ...]
+    print(ingest_sentiment(sys.argv[1:]).describe())
@@ -0,0 +1,152 @@
+"""
+Incremental versions of the indicators in market_data.indicators for live trading, where one new daily bar arrives at a
+time. Each bar is an O(1) (amortized) update on O(window) state per ticker, and the output matches the batch ta
+computation with fillna=True.
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import config
+from market_data.indicators import INDICATORS
+
+# Default value each indicator falls back to before it has a valid reading (ta's fillna values)
+_FILL_VALUES = np.array([0, 0, 50, 50, 0, -50, 0, 0, 0, np.nan])
+
+
+class _RollingExtreme(object):
+    # Monotonic deque over the last `window` values, the front is always the window's min (or max)
+    def __init__(self, window: int, maximum: bool):
+        self.window = window
+        self.sign = -1 if maximum else 1
+        self.values = deque()
+
+    def update(self, i: int, value: float) -> float:
+        key = self.sign * value
+        while self.values and self.values[-1][1] >= key:
+            self.values.pop()
+        self.values.append((i, key))
+        if self.values[0][0] <= i - self.window:
+            self.values.popleft()
+        return self.sign * self.values[0][1]
+
+
+class _Ema(object):
+    # pandas ewm(adjust=False): the first value seeds the average
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x: float) -> float:
+        self.value = x if self.value is None else (1 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class StreamingIndicators(object):
+    """
+    Indicator state of a single ticker. update takes one daily bar and returns the ten indicators in INDICATORS order.
+    """
+
+    def __init__(self, window: int = config.LOOK_BACK_WINDOW):
+        self.window = window
+        self._bars = 0
+        self._previous_close = None
+
+        self._adi = 0.
+        self._obv = 0.
+        self._ema_up = _Ema(1 / window)
+        self._ema_down = _Ema(1 / window)
+        self._lowest_low = _RollingExtreme(window, maximum=False)
+        self._highest_high = _RollingExtreme(window, maximum=True)
+        self._ema_fast = _Ema(2 / (12 + 1))
+        self._ema_slow = _Ema(2 / (26 + 1))
+        self._ema = _Ema(2 / (window + 1))
+
+        self._closes = deque(maxlen=window + 1)  # Current close plus `window` previous ones for ROC and SMA
+        self._close_sum = 0.
+
+        self._last = _FILL_VALUES.copy()  # Last valid value of each indicator, forward filled like ta
+
+    def update(self, high: float, low: float, close: float, volume: float) -> np.ndarray:
+        i = self._bars
+        self._bars += 1
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Accumulation/Distribution Index (ADI)
+            clv = np.float64((close - low) - (high - close)) / (high - low)
+            self._adi += (0. if np.isnan(clv) else clv) * volume
+
+            # On-Balance Volume (OBV)
+            self._obv += -volume if self._previous_close is not None and close < self._previous_close else volume
+
+            # Relative Strength Index (RSI)
+            diff = 0. if self._previous_close is None else close - self._previous_close
+            ema_up = self._ema_up.update(max(diff, 0.))
+            ema_down = self._ema_down.update(max(-diff, 0.))
+            rsi = 100. if ema_down == 0 else 100 - (100 / (1 + np.float64(ema_up) / ema_down))
+
+            # Stochastic Oscillator (SR) and Williams %R (WR)
+            lowest_low = self._lowest_low.update(i, low)
+            highest_high = self._highest_high.update(i, high)
+            sr = 100 * np.float64(close - lowest_low) / (highest_high - lowest_low)
+            wr = -100 * np.float64(highest_high - close) / (highest_high - lowest_low)
+
+            # Rate of Change (ROC) and Simple Moving Average (SMA)
+            if len(self._closes) == self._closes.maxlen:
+                self._close_sum -= self._closes[0]
+            self._closes.append(close)
+            self._close_sum += close
+            roc = np.nan
+            if len(self._closes) == self._closes.maxlen:
+                roc = (close - self._closes[0]) / np.float64(self._closes[0]) * 100
+                sma = (self._close_sum - self._closes[0]) / self.window
+            else:
+                sma = self._close_sum / len(self._closes)
+
+            # Moving Average Convergence Divergence (MACD) and Exponential Moving Average (EMA)
+            macd = self._ema_fast.update(close) - self._ema_slow.update(close)
+            ema = self._ema.update(close)
+
+            disp_index = (close / np.float64(ema)) * 100
+
+        self._previous_close = close
+
+        values = np.array([self._adi, self._obv, rsi, sr, roc, wr, macd, ema, sma, disp_index])
+        valid = np.isfinite(values)
+        valid[-1] = True  # The disparity index is not filled by ta
+        self._last[valid] = values[valid]
+        return self._last.copy()
+
+
+class IndicatorEngine(object):
+    """
+    Streaming indicators for a universe of tickers, keyed by ticker symbol.
+    """
+
+    def __init__(self, window: int = config.LOOK_BACK_WINDOW):
+        self.window = window
+        self.tickers = {}
+
+    def prime(self, ticker: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Builds a ticker's state from its history, one pass over the bars.
+
+        :param ticker: The ticker symbol
+        :param df: DataFrame containing columns ['high', 'low', 'close', 'volume'] in chronological order
+        :return: DataFrame of the indicators for every bar, equal to add_technical_indicators
+        """
+        state = self.tickers[ticker] = StreamingIndicators(self.window)
+        bars = df[['high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+        values = [state.update(*bar) for bar in bars]
+        return pd.DataFrame(values, columns=INDICATORS, index=df.index)
+
+    def update(self, ticker: str, high: float, low: float, close: float, volume: float) -> dict:
+        """
+        Adds the next daily bar of a ticker, creating its state on the first bar.
+
+        :return: Indicator name -> value for the new bar
+        """
+        if ticker not in self.tickers:
+            self.tickers[ticker] = StreamingIndicators(self.window)
+        return dict(zip(INDICATORS, self.tickers[ticker].update(high, low, close, volume)))
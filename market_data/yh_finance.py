@@ -8,14 +8,36 @@ A collection of web scraper utilities to obtain historical stock data from Yahoo
 Author: Ian Dunn
 """
 import os
-from datetime import datetime
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from html import unescape
 
+import numpy as np
 import requests
-from bs4 import BeautifulSoup
+import requests.adapters
+from bs4 import BeautifulSoup, SoupStrainer
 import pandas as pd
+from urllib3.util.retry import Retry
 
+from market_data.feature_store import FeatureStore
 
-def get_historical_data(ticker: str, start_date: datetime, save_csv=False) -> pd.DataFrame:
+
+BASE_URL = 'https://finance.yahoo.com'
+FEATURES = ['date', 'open', 'high', 'low', 'close', 'adj_close', 'volume']
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                         'Chrome/58.0.3029.110 Safari/537.3'}
+
+# lxml parses several times faster than the pure-Python html.parser backend when it is installed
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+
+def get_historical_data(ticker: str, start_date: datetime, save_csv=False, store: FeatureStore = None,
+                        session: requests.Session = None, base_url: str = BASE_URL) -> pd.DataFrame:
     """
     A function to query daily historical stock price data from Yahoo Finance. Includes date, open, high, low, close,
     adjusted close, and volume. Returns a pandas dataframe with the values from the given date to present.
@@ -24,25 +46,44 @@ def get_historical_data(ticker: str, start_date: datetime, save_csv=False) -> pd
 
     :param ticker: The ticker symbol to query
     :param start_date: The start date of stock data with date strings replaced by datetime objects
+    :param store: Feature store to append the new bars to as 'raw' data
+    :param session: HTTP session to reuse pooled connections from
+    :param base_url: Yahoo Finance host, can point at a local stub server
     :return:
     """
     start_date = int(start_date.timestamp())
     end_date = int(datetime.now().timestamp())
-    features = ['date', 'open', 'high', 'low', 'close', 'adj_close', 'volume']
-    url = (f'https://finance.yahoo.com/quote/{ticker}/history?period1={start_date}&period2={end_date}&interval=1d'
+    url = (f'{base_url}/quote/{ticker}/history?period1={start_date}&period2={end_date}&interval=1d'
            f'&filter=history&frequency=1d')
 
     # Fetch webpage
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                             'Chrome/58.0.3029.110 Safari/537.3'}
-    response = requests.get(url, headers=headers)
+    response = (session or requests).get(url, headers=HEADERS)
     html = response.text
 
     if response.status_code != 200:
-        raise RuntimeError('Invalid API Query (non-200 response value)')
+        raise RuntimeError(f'Invalid API Query for {ticker} (non-200 response value {response.status_code})')
+
+    df = extract_history_table(html)
+
+    if save_csv:
+        os.makedirs('./csv', exist_ok=True)
+        df.to_csv(f'./csv/yh_finance_data_{ticker}.csv', index=False)
+
+    if store is not None:
+        store.append('raw', ticker, df)
+
+    return df
 
-    # Parse HTML content
-    soup = BeautifulSoup(html, 'html.parser')
+
+def parse_history_page(html: str) -> pd.DataFrame:
+    """
+    Extracts the daily price history table from a Yahoo Finance history page.
+
+    :param html: The page's HTML
+    :return: DataFrame of FEATURES in chronological order
+    """
+    # Parse only the table elements of the HTML content
+    soup = BeautifulSoup(html, PARSER, parse_only=SoupStrainer('table'))
     table = soup.find('table', class_='svelte-ewueuo')
 
     # Extract rows from the table
@@ -52,22 +93,90 @@ def get_historical_data(ticker: str, start_date: datetime, save_csv=False) -> pd
         # Extract the columns from each row
         cols = row.find_all('td')
         # If there are columns, extract the text and append to the data list
-        if cols and len(cols) == len(features):  # Avoid dividend rows
+        if cols and len(cols) == len(FEATURES):  # Avoid dividend rows
             col_names = [ele.text.strip() for ele in cols]
             col_names[0] = date_to_datetime(col_names[0])  # Convert date to datetime
             col_names[6] = int(col_names[6].replace(',', ''))  # Convert volume to int
             data.append(col_names)
 
-    df = pd.DataFrame(data, columns=features)
+    df = pd.DataFrame(data, columns=FEATURES)
     df = df.iloc[::-1].reset_index(drop=True)  # Reverse final dataframe so dates are in chronological order
+    df[FEATURES[1:6]] = df[FEATURES[1:6]].replace(',', '', regex=True).astype(float)  # Prices as numbers, not text
+    return df
 
-    if save_csv:
-        os.makedirs('./csv', exist_ok=True)
-        df.to_csv(f'./csv/yh_finance_data_{ticker}.csv', index=False)
 
+# Patterns for extract_history_table, cells are matched within rows within the history table
+_TABLE = re.compile(r'<table[^>]*class="[^"]*svelte-ewueuo[^"]*"[^>]*>(.*?)</table>', re.S)
+_ROW = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S)
+_CELL = re.compile(r'<td[^>]*>(.*?)</td>', re.S)
+_TAG = re.compile(r'<[^>]+>')
+
+
+def extract_history_table(html: str) -> pd.DataFrame:
+    """
+    High-throughput equivalent of parse_history_page. The table is scanned once with regular expressions instead of
+    building a parse tree, and the DataFrame is built column-wise with the dates and comma-formatted numbers converted
+    in bulk. Cells shown as '-' (such as the volume of an index) are NaN, so all value columns are float64.
+
+    :param html: The page's HTML
+    :return: DataFrame of FEATURES in chronological order
+    """
+    table = _TABLE.search(html)
+    if table is None:
+        raise RuntimeError('Price history table not found')
+
+    rows = []
+    for row in _ROW.findall(table.group(1)):
+        cells = _CELL.findall(row)
+        if len(cells) == len(FEATURES):  # Avoid dividend rows
+            rows.append(cells)
+    rows.reverse()  # Chronological order
+
+    # Tags removed and entities (&amp;, &#x2C;) decoded, as BeautifulSoup's get_text does
+    columns = [pd.Series(column, dtype=object).str.replace(_TAG, '', regex=True).map(unescape).str.strip()
+               for column in zip(*rows)] if rows else [pd.Series([], dtype=object)] * len(FEATURES)
+
+    df = pd.DataFrame({'date': pd.to_datetime(columns[0], format='%b %d, %Y')})
+    for name, column in zip(FEATURES[1:], columns[1:]):
+        df[name] = pd.to_numeric(column.str.replace(',', '', regex=False).replace('-', np.nan)).astype('float64')
     return df
 
 
+def download_many(tickers: list, start_date: datetime, store: FeatureStore = None, max_workers: int = 8,
+                  retries: int = 3, base_url: str = BASE_URL) -> dict:
+    """
+    Downloads many tickers concurrently into the feature store, over one pooled HTTP session with at most max_workers
+    requests in flight. Tickers already in the store are only fetched from the day after their last stored bar.
+    Connection errors and 429 or 5xx responses are retried with exponential backoff. The first failing ticker's error
+    is raised once the remaining downloads have finished and been stored.
+
+    :param tickers: The ticker symbols to query
+    :param start_date: Start date for tickers with no stored data
+    :param store: Feature store the bars are appended to as 'raw' data
+    :param max_workers: Maximum number of concurrent requests
+    :param retries: Retries per request for transient failures
+    :param base_url: Yahoo Finance host, can point at a local stub server
+    :return: Mapping of ticker -> DataFrame of the newly downloaded bars
+    """
+    store = store or FeatureStore()
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  raise_on_status=False)  # The last response is returned, get_historical_data reports its status
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def download(ticker):
+        last_date = store.last_date('raw', ticker)
+        ticker_start = start_date if last_date is None else (last_date + timedelta(days=1)).to_pydatetime()
+        if ticker_start.date() > datetime.now().date():
+            return pd.DataFrame(columns=FEATURES)
+        return get_historical_data(ticker, ticker_start, store=store, session=session, base_url=base_url)
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(tickers, executor.map(download, tickers)))
+
+
 def date_to_datetime(date_str: str) -> datetime:
     """
     Converts a date string in the format Mon dd, YYYY (ex. Mar 11, 2024) to Unix timestamp.
@@ -80,5 +189,5 @@ def date_to_datetime(date_str: str) -> datetime:
 
 
 if __name__ == '__main__':
-    data = get_historical_data('MSFT', datetime(2024, 3, 11), save_csv=True)
+    data = get_historical_data('MSFT', datetime(2024, 3, 11), store=FeatureStore())
     print(data)
@@ -0,0 +1,64 @@
+"""
+yh-stub-server
+
+A local stand-in for Yahoo Finance that serves saved history pages, so yh_finance downloads can be exercised without
+network access. A request for /quote/<TICKER>/history returns <directory>/<TICKER>.html.
+
+Usage: python -m market_data.yh_stub_server <directory> [port]
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def serve_saved_pages(directory: str, port: int = 0, transient_errors: dict = None) -> ThreadingHTTPServer:
+    """
+    Starts the stub server on a background thread.
+
+    :param directory: Directory of saved <TICKER>.html history pages
+    :param port: Port to listen on, 0 picks a free one
+    :param transient_errors: Mapping of ticker -> number of requests answered with 503 before its page is served
+    :return: The running server, its address is f'http://127.0.0.1:{server.server_port}'
+    """
+    remaining_errors = dict(transient_errors or {})
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlparse(self.path).path.strip('/').split('/')
+            ticker = parts[1] if len(parts) == 3 and parts[0] == 'quote' else None
+            with lock:
+                failing = remaining_errors.get(ticker, 0) > 0
+                if failing:
+                    remaining_errors[ticker] -= 1
+            if failing:
+                self.send_error(503)
+                return
+
+            page = None if ticker is None else os.path.join(directory, f'{ticker}.html')
+            if page is None or not os.path.exists(page):
+                self.send_error(404)
+                return
+
+            with open(page, 'rb') as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    stub = serve_saved_pages(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
+    print(f'Serving {sys.argv[1]} at http://127.0.0.1:{stub.server_port}')
+    threading.Event().wait()
@@ -0,0 +1,154 @@
+"""
+Full training state checkpoints for resuming after a crash.
+
+A checkpoint is a directory holding state.pt (networks, target networks, optimizers, TD3's iteration counter, RNG
+states, the replay buffer's pointers and small arrays, and any training loop counters) and one .npy file per replay
+buffer row array. The row arrays are written incrementally: every save copies only the rows added since the previous
+one, and a background thread writes those copies into the same preallocated .npy files. Resuming memory-maps those
+files copy-on-write as the replay buffer's storage, so neither saving nor resuming copies the whole buffer.
+"""
+import copy
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+# Per-row replay buffer arrays, written incrementally
+ROW_ARRAYS = ('state', 'action', 'next_state', 'reward', 'not_done')
+
+# Remaining replay buffer state, saved in full with every checkpoint
+SMALL_ARRAYS = ('final_state', 'final_index', 'final_row')
+SCALARS = ('ptr', 'size', 'final_ptr', 'max_priority', 'beta')
+
+
+def _rng_state() -> dict:
+    return {
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'numpy': np.random.get_state(),
+        'python': random.getstate(),
+    }
+
+
+def _set_rng_state(state: dict):
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+
+
+class Checkpointer(object):
+    """
+    Writes full-state checkpoints of a TD3 policy and its replay buffer to one directory.
+
+    save takes a consistent snapshot of the training state and of the new buffer rows on the calling thread (pause any
+    learner thread while it runs, see AsyncLearner.weights_lock) and writes it to disk on a background thread. Rows are
+    appended in the ring order they were added, so checkpoints must be saved before the buffer wraps around completely
+    again. The first save of a run that did not load a checkpoint replaces any older checkpoint in the directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._saved_ptr = None
+        self._loaded = False
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, 'state.pt'))
+
+    def save(self, policy, replay_buffer, **counters):
+        """
+        :param counters: Training loop state to restore on load, e.g. the time step and evaluations so far
+        :return: Future completed once the checkpoint is on disk
+        """
+        self.wait()
+
+        state = {
+            'policy': copy.deepcopy(policy.state_dict()),
+            'rng': _rng_state(),
+            'counters': copy.deepcopy(counters),
+            'buffer': {name: getattr(replay_buffer, name) for name in SCALARS if hasattr(replay_buffer, name)},
+        }
+        for name in SMALL_ARRAYS:
+            if hasattr(replay_buffer, name):
+                state['buffer'][name] = getattr(replay_buffer, name).copy()
+        if hasattr(replay_buffer, 'tree'):
+            state['buffer']['tree'] = replay_buffer.tree.tree.copy()
+
+        # Rows added since the last save, plus the next states CompactReplayBuffer writes ahead of ptr
+        ahead = replay_buffer.num_envs if hasattr(replay_buffer, 'final_state') else 0
+        fresh = self._saved_ptr is None and not self._loaded  # First save of a run that did not resume
+        if self._saved_ptr is None:
+            start, count = replay_buffer.ptr - replay_buffer.size, replay_buffer.size + ahead
+        else:
+            start, count = self._saved_ptr, (replay_buffer.ptr - self._saved_ptr) % replay_buffer.max_size + ahead
+        rows = (start + np.arange(min(count, replay_buffer.max_size))) % replay_buffer.max_size
+        self._saved_ptr = replay_buffer.ptr
+
+        # Copied here, the buffer keeps changing while the background thread writes
+        arrays = {name: (getattr(replay_buffer, name)[rows], getattr(replay_buffer, name).shape)
+                  for name in ROW_ARRAYS if hasattr(replay_buffer, name)}
+
+        self._pending = self._executor.submit(self._write, state, arrays, rows, fresh)
+        return self._pending
+
+    def _write(self, state: dict, arrays: dict, rows: np.ndarray, fresh: bool):
+        os.makedirs(self.path, exist_ok=True)
+        if fresh and os.path.exists(os.path.join(self.path, 'state.pt')):
+            # An older run's checkpoint, its row files may not match this buffer and are recreated below
+            os.remove(os.path.join(self.path, 'state.pt'))
+
+        for name, (values, shape) in arrays.items():
+            filename = os.path.join(self.path, f'{name}.npy')
+            if os.path.exists(filename) and not fresh:
+                target = np.load(filename, mmap_mode='r+')
+            else:
+                target = np.lib.format.open_memmap(filename, mode='w+', dtype=values.dtype, shape=shape)
+            target[rows] = values
+            target.flush()
+
+        # state.pt is replaced last, so an interrupted save leaves the previous checkpoint usable
+        torch.save(state, os.path.join(self.path, 'state.pt.tmp'))
+        os.replace(os.path.join(self.path, 'state.pt.tmp'), os.path.join(self.path, 'state.pt'))
+
+    def wait(self):
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def load(self, policy, replay_buffer) -> dict:
+        """
+        Restores a checkpoint into an existing policy and replay buffer of the same shapes. Pass the buffer itself,
+        not a SharedReplayBuffer wrapping it.
+
+        :return: The counters passed to save
+        """
+        state = torch.load(os.path.join(self.path, 'state.pt'), weights_only=False)
+        policy.load_state_dict(state['policy'])
+        _set_rng_state(state['rng'])
+
+        for name in ROW_ARRAYS:
+            if hasattr(replay_buffer, name):
+                # Copy-on-write: pages load lazily and new transitions never modify the checkpoint
+                setattr(replay_buffer, name, np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='c'))
+        for name, value in state['buffer'].items():
+            if name == 'tree':
+                replay_buffer.tree.tree[:] = value
+            else:
+                setattr(replay_buffer, name, value)
+
+        # Collection restarts from fresh episodes, so the interrupted ones end at their written-ahead next states
+        if hasattr(replay_buffer, 'end_episodes'):
+            replay_buffer.end_episodes()
+
+        self._saved_ptr = replay_buffer.ptr
+        self._loaded = True
+        return state['counters']
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
@@ -0,0 +1,393 @@
+"""
+Ape-X style distributed training.
+
+Many actor processes, on this machine or others, step their own VectorMarketEnv and stream transitions over TCP to a
+ReplayServer. The server adds them to the ReplayBuffer of an AsyncLearner, which trains TD3 in the same process, and
+sends the learner's actor weights back to actors that ask for them. Each actor explores with its own noise scale,
+from broad to nearly greedy across the actor ids (Horgan et al., 2018).
+
+Wire format: every message is a HEADER (message type, payload length) followed by the payload, all little-endian.
+    TRANSITIONS  BATCH_HEADER (rows, state_dim, action_dim), then float32 state, action, next_state, reward and done
+                 arrays of those rows, back to back
+    ACK          VERSION (learner updates so far), sent once a TRANSITIONS batch is in the replay buffer
+    GET_WEIGHTS  empty
+    WEIGHTS      VERSION, then the actor's parameters as one float32 vector (parameters_to_vector order)
+
+Backpressure: the server acknowledges a batch only after it is stored and, once training has started, only while the
+learner is less than max_update_lag updates behind its update-to-data ratio. Actors keep at most max_in_flight
+unacknowledged batches, so they slow down to the rate the learner can absorb instead of queueing without bound.
+
+Observation normalization is not applied in this mode, since every actor would otherwise keep its own statistics.
+
+Usage:
+    python -m model.distributed --role local --actors 4                          # Everything on localhost
+    python -m model.distributed --role server --address 0.0.0.0:5555
+    python -m model.distributed --role actor --address HOST:5555 --actor-id 0 --actors 4
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+import torch
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+
+import config
+from envs.episode_sampler import EpisodeSampler
+from envs.vector_market_env import VectorMarketEnv
+from model import td3, utils
+from model.evaluation import Evaluator
+from model.learner import AsyncLearner
+from trading.training_controller import load_feature_tensor
+
+# Message types
+TRANSITIONS = 1
+ACK = 2
+GET_WEIGHTS = 3
+WEIGHTS = 4
+
+HEADER = struct.Struct('<BI')
+BATCH_HEADER = struct.Struct('<III')
+VERSION = struct.Struct('<Q')
+
+
+def send_message(sock: socket.socket, message_type: int, *buffers):
+    payload = b''.join(buffers)
+    sock.sendall(HEADER.pack(message_type, len(payload)) + payload)
+
+
+def receive_message(sock: socket.socket) -> tuple:
+    """
+    :return: Tuple of (message type, payload bytes), or (None, None) when the connection was closed
+    """
+    header = _receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None, None
+    message_type, length = HEADER.unpack(header)
+    return message_type, _receive_exactly(sock, length)
+
+
+def _receive_exactly(sock: socket.socket, size: int) -> bytearray:
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        received = sock.recv_into(view)
+        if received == 0:
+            return None
+        view = view[received:]
+    return data
+
+
+def encode_transitions(state, action, next_state, reward, done) -> list:
+    rows, state_dim = state.shape
+    return [BATCH_HEADER.pack(rows, state_dim, action.shape[1])] + [
+        np.ascontiguousarray(array, dtype=np.float32).tobytes() for array in (state, action, next_state, reward, done)]
+
+
+def decode_transitions(payload) -> tuple:
+    # Zero-copy views of (state, action, next_state, reward, done) into the payload
+    rows, state_dim, action_dim = BATCH_HEADER.unpack_from(payload)
+    arrays, offset = [], BATCH_HEADER.size
+    for width in (state_dim, action_dim, state_dim, 1, 1):
+        arrays.append(np.frombuffer(payload, dtype=np.float32, count=rows * width, offset=offset).reshape(rows, width))
+        offset += rows * width * 4
+    state, action, next_state, reward, done = arrays
+    return state, action, next_state, reward[:, 0], done[:, 0]
+
+
+def exploration_noise(actor_id: int, num_actors: int, base: float = 0.4, alpha: float = 7.) -> float:
+    # Ape-X per-actor exploration, as a fraction of max_action: base ** (1 + alpha * i / (N - 1))
+    return base ** (1 + alpha * actor_id / max(num_actors - 1, 1))
+
+
+class ReplayServer(object):
+    """
+    Accepts actor connections and feeds their transitions to an AsyncLearner, see the module docstring.
+
+    :param learner: Learner whose (unwrapped) replay buffer takes plain, non-lockstep transitions, e.g. ReplayBuffer
+    :param address: (host, port) to listen on, port 0 picks a free one
+    :param start_timesteps: Environment steps collected before the learner starts
+    :param max_update_lag: Updates the learner may fall behind before batches stop being acknowledged
+    """
+
+    def __init__(self, learner: AsyncLearner, address=('127.0.0.1', 0), start_timesteps=config.START_TIMESTEPS,
+                 max_update_lag=10000):
+        self.learner = learner
+        self.start_timesteps = start_timesteps
+        self.max_update_lag = max_update_lag
+
+        self.env_steps = 0
+        self._steps_lock = threading.Lock()
+        self._weights = (-1, b'')
+
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                server._serve_connection(self.request)
+
+        self._server = socketserver.ThreadingTCPServer(address, Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def address(self) -> tuple:
+        return self._server.server_address
+
+    def _serve_connection(self, sock: socket.socket):
+        while True:
+            message_type, payload = receive_message(sock)
+            if message_type is None:
+                return
+            if message_type == TRANSITIONS:
+                transitions = decode_transitions(payload)
+                self.learner.replay_buffer.add_batch(*transitions)
+                self._add_env_steps(len(transitions[0]))
+                send_message(sock, ACK, VERSION.pack(self.learner.updates))
+            elif message_type == GET_WEIGHTS:
+                version, weights = self.weights()
+                send_message(sock, WEIGHTS, VERSION.pack(version), weights)
+            else:
+                raise ValueError(f'Unexpected message type {message_type}')
+
+    def _add_env_steps(self, steps: int):
+        with self._steps_lock:
+            self.env_steps += steps
+            if self.env_steps >= self.start_timesteps and not self.learner.started:
+                self.learner.start()
+        if not self.learner.started:
+            return
+
+        self.learner.add_env_steps(steps)
+        # Hold the acknowledgement while the learner is too far behind, woken by its updates
+        learner = self.learner
+        with learner.progress:
+            learner.progress.wait_for(lambda: learner.exited or
+                                      learner.update_ratio * learner.env_steps - learner.updates <= self.max_update_lag)
+
+    def weights(self) -> tuple:
+        # (version, float32 parameter bytes) of the learner's actor, re-serialized only after new updates
+        version, weights = self._weights
+        if version != self.learner.updates:
+            with self.learner.weights_lock:
+                version = self.learner.updates
+                weights = parameters_to_vector(self.learner.policy.actor.parameters()).detach().cpu().numpy()
+            self._weights = version, weights.astype(np.float32).tobytes()
+        return self._weights
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _make_sampler(split: str, seed: int = None) -> EpisodeSampler:
+    # Episodes from the same train/validation split as main.train
+    _, features = load_feature_tensor(config.FEATURE_PATH)
+    return EpisodeSampler(len(features), features.shape[1], config.EPISODE_LENGTH,
+                          split=split if config.VAL_FRACTION else None, val_fraction=config.VAL_FRACTION,
+                          block_days=config.SPLIT_BLOCK_DAYS, split_seed=config.SPLIT_SEED, seed=seed)
+
+
+def _make_env(num_envs: int, seed: int) -> VectorMarketEnv:
+    return VectorMarketEnv(config.FEATURE_PATH, num_envs, max_episode_steps=config.EPISODE_LENGTH, seed=seed,
+                           sampler=_make_sampler("train", seed))
+
+
+def _connect(address: tuple, timeout: float = 60.) -> socket.socket:
+    # Retries until the server is up, actors may start before it
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection(address)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def run_actor(address: tuple, actor_id: int = 0, num_actors: int = 1, steps: int = int(config.MAX_TIMESTEPS),
+              num_envs: int = config.NUM_ENVS, batch_rows: int = 256, max_in_flight: int = 4,
+              sync_freq: int = config.ACTOR_SYNC_FREQ, seed: int = config.SEED):
+    """
+    Collects steps environment steps and streams them to a ReplayServer.
+
+    :param batch_rows: Transitions per TRANSITIONS message, rounded up to a multiple of num_envs
+    :param max_in_flight: Unacknowledged batches allowed before waiting for the server
+    :param sync_freq: Environment steps between weight requests, sent only when the learner has new updates
+    """
+    torch.set_num_threads(1)
+    seed += 1000 * actor_id
+    env = _make_env(num_envs, seed)
+    np.random.seed(seed)
+
+    state_dim = env.single_observation_space.shape[0]
+    action_dim = env.single_action_space.shape[0]
+    max_action = float(env.single_action_space.high[0])
+    actor = td3.Actor(state_dim, action_dim, max_action)
+    noise = max_action * exploration_noise(actor_id, num_actors)
+
+    sock = _connect(address)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    rows = -(-batch_rows // num_envs) * num_envs
+    batch = [np.zeros((rows, state_dim), dtype=np.float32), np.zeros((rows, action_dim), dtype=np.float32),
+             np.zeros((rows, state_dim), dtype=np.float32), np.zeros(rows, dtype=np.float32),
+             np.zeros(rows, dtype=np.float32)]
+    filled = 0
+    in_flight = 0
+    version, learner_version = 0, 0
+    steps_since_sync = 0
+
+    def receive(expected: int) -> bytes:
+        # Reads responses in order, counting acknowledgements, until one of the expected type
+        nonlocal in_flight, learner_version
+        while True:
+            message_type, payload = receive_message(sock)
+            if message_type is None:
+                raise ConnectionError('Replay server closed the connection')
+            if message_type == ACK:
+                in_flight -= 1
+                learner_version = VERSION.unpack(payload)[0]
+            if message_type == expected:
+                return payload
+
+    state = env.reset()
+    for _ in range(0, steps, num_envs):
+        # Random actions until the learner has trained
+        if version == 0:
+            action = env.action_space.sample()
+        else:
+            with torch.no_grad():
+                action = actor(torch.as_tensor(state, dtype=torch.float32)).numpy()
+            action = (action + np.random.normal(0, noise, size=action.shape)).clip(-max_action, max_action)
+
+        next_state, reward, done, info = env.step(action)
+        transition_next_state = np.where(done[:, None], info.get('final_observation', next_state), next_state)
+
+        rows_slice = slice(filled, filled + num_envs)
+        batch[0][rows_slice], batch[1][rows_slice], batch[2][rows_slice] = state, action, transition_next_state
+        batch[3][rows_slice], batch[4][rows_slice] = reward, done & ~info['truncated']
+        filled += num_envs
+        state = next_state
+
+        if filled == rows:
+            while in_flight >= max_in_flight:
+                receive(ACK)
+            send_message(sock, TRANSITIONS, *encode_transitions(*batch))
+            in_flight += 1
+            filled = 0
+
+        steps_since_sync += num_envs
+        if steps_since_sync >= sync_freq and learner_version > version:
+            send_message(sock, GET_WEIGHTS)
+            payload = receive(WEIGHTS)
+            version = VERSION.unpack_from(payload)[0]
+            weights = np.frombuffer(payload, dtype=np.float32, offset=VERSION.size)
+            vector_to_parameters(torch.from_numpy(weights.copy()), actor.parameters())
+            steps_since_sync = 0
+
+    if filled:
+        send_message(sock, TRANSITIONS, *encode_transitions(*(array[:filled] for array in batch)))
+        in_flight += 1
+    while in_flight > 0:
+        receive(ACK)
+    sock.close()
+
+
+def run_server(address: tuple, stop_event: threading.Event = None,
+               file_name: str = f"TD3_distributed_{config.SEED}") -> td3.TD3:
+    """
+    Runs the replay server and learner until stop_event is set (or interrupted), evaluating every EVAL_FREQ received
+    steps on the validation split. With SAVE_MODEL the policy is saved to ./models/<file_name> at the end.
+
+    :return: The trained policy
+    """
+    env = _make_env(1, config.SEED)  # For the observation and action spaces
+    state_dim = env.single_observation_space.shape[0]
+    action_dim = env.single_action_space.shape[0]
+    max_action = float(env.single_action_space.high[0])
+
+    torch.manual_seed(config.SEED)
+    policy = td3.TD3(state_dim, action_dim, max_action, discount=config.DISCOUNT, tau=config.TAU,
+                     policy_noise=config.POLICY_NOISE * max_action, noise_clip=config.NOISE_CLIP * max_action,
+                     policy_freq=config.POLICY_FREQ, fused=config.FUSED_UPDATE, compile=config.TORCH_COMPILE)
+    learner = AsyncLearner(policy, utils.ReplayBuffer(state_dim, action_dim), config.BATCH_SIZE,
+                           config.UPDATE_TO_DATA_RATIO, config.ACTOR_SYNC_FREQ)
+    server = ReplayServer(learner, address, config.START_TIMESTEPS)
+    print(f"Replay server listening on {server.address[0]}:{server.address[1]}")
+
+    evaluator = Evaluator(config.FEATURE_PATH, config.SEED, config.EVAL_EPISODES, config.EPISODE_LENGTH,
+                          _make_sampler("val"))
+    stop_event = stop_event or threading.Event()
+    evaluated, pending_evaluations = 0, []
+    while not _wait(stop_event, 1.):
+        if server.env_steps // config.EVAL_FREQ > evaluated:
+            evaluated = server.env_steps // config.EVAL_FREQ
+            with learner.weights_lock:
+                pending_evaluations.append((server.env_steps, learner.updates, evaluator.submit(policy.actor)))
+
+        # Report finished background evaluations in submission order
+        while pending_evaluations and pending_evaluations[0][2].done():
+            steps, updates, evaluation = pending_evaluations.pop(0)
+            print(f"Steps: {steps} Updates: {updates} Evaluation: {evaluation.result():.3f}")
+
+    server.stop()
+    learner.stop()
+    evaluator.close()
+    if config.SAVE_MODEL:
+        os.makedirs("./models", exist_ok=True)
+        policy.save(f"./models/{file_name}")
+    return policy
+
+
+def _wait(event: threading.Event, timeout: float) -> bool:
+    # Event.wait that treats Ctrl+C as the event being set
+    try:
+        return event.wait(timeout)
+    except KeyboardInterrupt:
+        event.set()
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--role', choices=['local', 'server', 'actor'], default='local')
+    parser.add_argument('--address', default='127.0.0.1:0', help='host:port of the replay server')
+    parser.add_argument('--actors', type=int, default=4, help='Total number of actors')
+    parser.add_argument('--actor-id', type=int, default=0)
+    parser.add_argument('--steps', type=int, default=int(config.MAX_TIMESTEPS), help='Environment steps per actor')
+    args = parser.parse_args()
+
+    host, port = args.address.rsplit(':', 1)
+    if args.role == 'actor':
+        run_actor((host, int(port)), args.actor_id, args.actors, args.steps)
+    elif args.role == 'server':
+        run_server((host, int(port)))
+    else:
+        # Server and learner in this process, actors in spawned processes, all on localhost
+        if int(port) == 0:
+            with socket.socket() as probe:
+                probe.bind((host, 0))
+                port = probe.getsockname()[1]
+        stop = threading.Event()
+        server_thread = threading.Thread(target=run_server, args=((host, int(port)), stop))
+        server_thread.start()
+
+        context = multiprocessing.get_context('spawn')
+        actors = [context.Process(target=run_actor, args=((host, int(port)), i, args.actors, args.steps))
+                  for i in range(args.actors)]
+        # Ctrl+C lands here, the server thread only stops once stop is set
+        try:
+            for process in actors:
+                process.start()
+            for process in actors:
+                process.join()
+        finally:
+            stop.set()
+            server_thread.join()
@@ -0,0 +1,61 @@
+import copy
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+import config
+from envs.episode_sampler import EpisodeSampler
+from envs.vector_market_env import VectorMarketEnv
+from model.td3 import device
+
+
+class Evaluator(object):
+    """
+    Keeps a warm VectorMarketEnv around for policy evaluation and runs every evaluation episode in parallel, with one
+    batched actor forward pass per step across all episodes.
+
+    The eval environment is reseeded before every evaluation, so each one scores the actor on the same episodes,
+    drawn by the given EpisodeSampler (e.g. over the validation split) or from the whole history.
+    submit evaluates a snapshot of the actor on a background thread so training can carry on in the meantime.
+    Observations are normalized with a frozen copy of the given normalizer, if any, taken when evaluation starts.
+    """
+
+    def __init__(self, path: str = config.FEATURE_PATH, seed: int = config.SEED, eval_episodes: int = 10,
+                 max_episode_steps: int = 300, sampler: EpisodeSampler = None):
+        # A fixed seed is used for the eval environment
+        self.seed = seed + 100
+        self.eval_episodes = eval_episodes
+        self.env = VectorMarketEnv(path, eval_episodes, max_episode_steps=max_episode_steps, seed=self.seed,
+                                   sampler=sampler)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def evaluate(self, actor, normalizer=None) -> float:
+        # Runs actor for eval_episodes episodes and returns average reward
+        self.env.normalizer = None if normalizer is None else normalizer.frozen_copy()
+        state = self.env.reset(seed=self.seed)
+        episode_reward = np.zeros(self.eval_episodes)
+        running = np.ones(self.eval_episodes, dtype=bool)
+
+        with torch.no_grad():
+            while running.any():
+                action = actor(torch.as_tensor(state, dtype=torch.float32, device=device)).cpu().numpy()
+                state, reward, done, _ = self.env.step(action)
+                # Finished episodes are reset by the env, but only their first run counts
+                episode_reward += reward * running
+                running &= ~done
+
+        avg_reward = episode_reward.mean()
+
+        print("---------------------------------------")
+        print(f"Evaluation over {self.eval_episodes} episodes: {avg_reward:.3f}")
+        print("---------------------------------------")
+        return avg_reward
+
+    def submit(self, actor, normalizer=None) -> Future:
+        # Evaluates a copy of the actor's current weights and normalizer statistics on the background thread
+        return self._executor.submit(self.evaluate, copy.deepcopy(actor),
+                                     None if normalizer is None else normalizer.frozen_copy())
+
+    def close(self):
+        self._executor.shutdown(wait=True)
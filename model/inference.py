@@ -0,0 +1,152 @@
+"""
+Low-latency actor inference for live trading decisions.
+
+InferencePolicy loads only the actor (and observation normalizer, if one was saved) of a TD3 checkpoint and runs it
+under torch.inference_mode on a preallocated input buffer, optionally as an int8 dynamically quantized or TorchScript
+model. InferenceServer shares one InferencePolicy between many strategies: concurrent requests are micro-batched into a
+single forward pass.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from model.td3 import Actor
+from model.utils import ObservationNormalizer
+
+# Inference always runs on the CPU, where a single small forward pass has the lowest latency
+device = torch.device("cpu")
+
+
+class InferencePolicy(object):
+    """
+    :param filename: Checkpoint file name as passed to TD3.save, only <filename>_actor and <filename>_normalizer
+    (normalizer statistics saved by training, used frozen) are read
+    :param max_batch: Largest batch of states act will be called with
+    :param quantize: Apply dynamic int8 quantization to the Linear layers
+    :param script: Run the actor as a TorchScript module
+    """
+
+    def __init__(self, filename, state_dim, action_dim, max_action, max_batch=64, quantize=False, script=False):
+        actor = Actor(state_dim, action_dim, max_action)
+        actor.load_state_dict(torch.load(filename + "_actor", map_location=device))
+        actor.eval()
+
+        if quantize:
+            actor = torch.ao.quantization.quantize_dynamic(actor, {nn.Linear}, dtype=torch.qint8)
+        if script:
+            actor = torch.jit.script(actor)
+            if not quantize:
+                actor = torch.jit.freeze(actor)  # Inlines the weights as constants
+
+        self.normalizer = None
+        if os.path.exists(filename + "_normalizer"):
+            self.normalizer = ObservationNormalizer(0)
+            self.normalizer.load(filename)  # Restores the feature count with the statistics
+            self.normalizer.frozen = True
+
+        self.actor = actor
+        self.state_dim = state_dim
+        self._input = torch.zeros((max_batch, state_dim), dtype=torch.float32)
+        self._input_array = self._input.numpy()  # Shares memory with _input
+
+    def act(self, states: np.ndarray) -> np.ndarray:
+        # Actions for a (n, state_dim) batch of states, or a single (state_dim,) state
+        single = states.ndim == 1
+        states = states.reshape(-1, self.state_dim)
+        n = len(states)
+        if n > len(self._input_array):
+            raise ValueError(f'Batch of {n} states exceeds max_batch ({len(self._input_array)})')
+
+        self._input_array[:n] = states
+        if self.normalizer is not None:
+            self.normalizer.normalize(self._input_array[:n], out=self._input_array[:n])
+        with torch.inference_mode():
+            actions = self.actor(self._input[:n]).numpy()
+        return actions[0] if single else actions
+
+    def export_torchscript(self, path: str):
+        torch.jit.save(torch.jit.script(self.actor), path)
+
+    def export_onnx(self, path: str):
+        torch.onnx.export(self.actor, (self._input[:1],), path, input_names=['state'], output_names=['action'],
+                          dynamic_axes={'state': {0: 'batch'}, 'action': {0: 'batch'}})
+
+
+class InferenceServer(object):
+    """
+    Micro-batches action requests from many strategies onto one InferencePolicy.
+
+    submit returns a Future immediately. A worker thread waits for the first pending request, collects whatever else
+    arrives within max_delay (up to max_batch requests) and answers all of them with one forward pass. The latency from
+    submit to result of every request is kept for latency_percentiles. stop answers every request submitted before it.
+    """
+
+    def __init__(self, policy: InferencePolicy, max_batch: int = None, max_delay: float = 0.0005):
+        if max_batch is not None and max_batch > len(policy._input):
+            raise ValueError(f'max_batch {max_batch} exceeds the policy\'s max_batch ({len(policy._input)})')
+        self.policy = policy
+        self.max_batch = max_batch or len(policy._input)
+        self.max_delay = max_delay
+
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._latencies = []
+
+        self._worker = threading.Thread(target=self._serve, daemon=True)
+        self._worker.start()
+
+    def submit(self, state: np.ndarray) -> Future:
+        future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError('InferenceServer is stopped')
+            self._pending.append((time.perf_counter(), state, future))
+            self._condition.notify()
+        return future
+
+    def act(self, state: np.ndarray) -> np.ndarray:
+        return self.submit(state).result()
+
+    def _serve(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+
+                # Give concurrent strategies a moment to join the batch, requests left at stop are answered right away
+                deadline = time.perf_counter() + self.max_delay
+                while not self._stopped and len(self._pending) < self.max_batch and \
+                        (remaining := deadline - time.perf_counter()) > 0:
+                    self._condition.wait(remaining)
+
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+
+            try:
+                actions = self.policy.act(np.stack([state for _, state, _ in batch]))
+            except Exception as error:
+                for _, _, future in batch:
+                    future.set_exception(error)
+                continue
+            done = time.perf_counter()
+            for (submitted, _, future), action in zip(batch, actions):
+                future.set_result(action)
+                self._latencies.append(done - submitted)
+
+    def latency_percentiles(self, percentiles=(50, 99)) -> dict:
+        # Request latency in milliseconds, e.g. {'p50': ..., 'p99': ...}
+        latencies = np.array(self._latencies) * 1e3
+        return {f'p{p}': float(np.percentile(latencies, p)) for p in percentiles} if len(latencies) else {}
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._worker.join()
@@ -0,0 +1,127 @@
+import copy
+import threading
+
+import torch
+
+from model.td3 import device
+
+
+class SharedReplayBuffer(object):
+    """
+    Thread-safe view of a replay buffer shared between the acting loop and an AsyncLearner. Only add, sample and
+    priority updates take the lock; everything else is read straight from the wrapped buffer.
+    """
+
+    def __init__(self, replay_buffer):
+        self.replay_buffer = replay_buffer
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.replay_buffer, name)
+
+    def add(self, *transition):
+        with self.lock:
+            self.replay_buffer.add(*transition)
+
+    def add_batch(self, *transitions):
+        with self.lock:
+            self.replay_buffer.add_batch(*transitions)
+
+    def sample(self, batch_size):
+        with self.lock:
+            return self.replay_buffer.sample(batch_size)
+
+    def update_priorities(self, ids, td_errors):
+        with self.lock:
+            self.replay_buffer.update_priorities(ids, td_errors)
+
+
+class AsyncLearner(threading.Thread):
+    """
+    Runs TD3 updates on a background thread while the acting loop steps the environment.
+
+    The learner keeps at most update_ratio updates per environment step reported through add_env_steps and waits for
+    more data otherwise. The acting loop chooses actions with its own copy of the actor, refreshed from the learner
+    every sync_freq environment steps, so acting never blocks on a training step. If an update raises, the learner
+    exits and the error is re-raised by the next add_env_steps or stop.
+    """
+
+    def __init__(self, policy, replay_buffer, batch_size=256, update_ratio=1., sync_freq=1000):
+        super().__init__(daemon=True)
+
+        self.policy = policy
+        self.replay_buffer = SharedReplayBuffer(replay_buffer)
+        self.batch_size = batch_size
+        self.update_ratio = update_ratio
+        self.sync_freq = sync_freq
+
+        self.env_steps = 0
+        self.updates = 0
+        self.weights_lock = threading.Lock()  # Held during each update, and by anything reading the policy weights
+        self.progress = threading.Condition()  # Notified after every update and when the learner exits
+        self.started = False
+        self.exited = False
+        self.error = None
+        self._data = threading.Condition()
+        self._stopped = False
+
+        self.actor = copy.deepcopy(policy.actor)
+        self._steps_since_sync = 0
+
+    def start(self):
+        self.started = True
+        super().start()
+
+    def run(self):
+        try:
+            while True:
+                with self._data:
+                    while not self._stopped and self.updates >= self.update_ratio * self.env_steps:
+                        self._data.wait()
+                    if self._stopped:
+                        return
+
+                with self.weights_lock:
+                    self.policy.train(self.replay_buffer, self.batch_size)
+                with self.progress:
+                    self.updates += 1
+                    self.progress.notify_all()
+        except Exception as error:
+            self.error = error
+        finally:
+            with self.progress:
+                self.exited = True
+                self.progress.notify_all()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError('AsyncLearner update failed') from self.error
+
+    def add_env_steps(self, steps):
+        # Allow update_ratio more updates per new environment step
+        self._raise_error()
+        with self._data:
+            self.env_steps += steps
+            self._data.notify()
+
+        self._steps_since_sync += steps
+        if self._steps_since_sync >= self.sync_freq:
+            self.sync_actor()
+
+    def sync_actor(self):
+        with self.weights_lock:
+            self.actor.load_state_dict(self.policy.actor.state_dict())
+        self._steps_since_sync = 0
+
+    def select_actions(self, states):
+        with torch.no_grad():
+            states = torch.as_tensor(states, dtype=torch.float32, device=device)
+            return self.actor(states).cpu().numpy()
+
+    def stop(self):
+        with self._data:
+            self._stopped = True
+            self._data.notify()
+        if self.is_alive():
+            self.join()
+        self._raise_error()
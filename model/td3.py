@@ -1,9 +1,13 @@
 import copy
+import os
+
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+import telemetry
+
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
@@ -62,6 +66,111 @@ class Critic(nn.Module):
         return q1
 
 
+CRITIC_KEYS = [f'l{i}.{p}' for i in range(1, 7) for p in ('weight', 'bias')]  # Critic parameter order
+
+
+def _stack_critic(layers):
+    # Critic tensors keyed by CRITIC_KEYS to the StackedCritic layout, for parameters and their optimizer state
+    return {
+        'l1.weight': torch.cat([layers['l1.weight'], layers['l4.weight']]),
+        'l1.bias': torch.cat([layers['l1.bias'], layers['l4.bias']]),
+        'w2': torch.stack([layers['l2.weight'].t(), layers['l5.weight'].t()]),
+        'b2': torch.stack([layers['l2.bias'], layers['l5.bias']]).unsqueeze(1),
+        'w3': torch.stack([layers['l3.weight'].t(), layers['l6.weight'].t()]),
+        'b3': torch.stack([layers['l3.bias'], layers['l6.bias']]).unsqueeze(1),
+    }
+
+
+def _unstack_critic(stacked):
+    # Inverse of _stack_critic, copies so saved tensors do not share the stacked storage
+    l1_weight, l4_weight = stacked['l1.weight'].chunk(2)
+    l1_bias, l4_bias = stacked['l1.bias'].chunk(2)
+    layers = {'l1.weight': l1_weight, 'l1.bias': l1_bias, 'l4.weight': l4_weight, 'l4.bias': l4_bias}
+    for head, (hidden, output) in enumerate([(2, 3), (5, 6)]):
+        layers[f'l{hidden}.weight'] = stacked['w2'][head].t()
+        layers[f'l{hidden}.bias'] = stacked['b2'][head, 0]
+        layers[f'l{output}.weight'] = stacked['w3'][head].t()
+        layers[f'l{output}.bias'] = stacked['b3'][head, 0]
+    return {key: layers[key].clone(memory_format=torch.contiguous_format) for key in CRITIC_KEYS}
+
+
+def _unstack_state_dict(module, state_dict, prefix, local_metadata):
+    # Runs after the l1 child saved its weights, a _save_to_state_dict override would be overwritten by it
+    stacked = {name: state_dict.pop(prefix + name) for name, _ in module.named_parameters()}
+    for key, value in _unstack_critic(stacked).items():
+        state_dict[prefix + key] = value
+
+
+def _convert_optimizer_state(state_dict, keys, new_keys, convert):
+    """
+    Remaps a single parameter group optimizer state dict between critic layouts, applying the parameter layout
+    conversion to per-parameter tensors like the Adam moments.
+
+    :param keys: Parameter names in the order of state_dict
+    :param new_keys: Parameter names in the order of the optimizer loading the result
+    :param convert: _stack_critic or _unstack_critic
+    """
+    group, = state_dict['param_groups']
+    state = [state_dict['state'].get(index) for index in group['params']]
+    new_state = {}
+    if all(state):  # Empty before the first step
+        new_state = {index: {} for index in range(len(new_keys))}
+        for field, value in state[0].items():
+            if torch.is_tensor(value) and value.dim() > 0:
+                converted = convert({key: entry[field] for key, entry in zip(keys, state)})
+                values = [converted[key] for key in new_keys]
+            else:  # Step counts are equal for all parameters, copied so in-place increments stay separate
+                values = [value.clone() if torch.is_tensor(value) else value for _ in new_keys]
+            for index, value in enumerate(values):
+                new_state[index][field] = value
+    return {'state': new_state, 'param_groups': [dict(group, params=list(range(len(new_keys))))]}
+
+
+class StackedCritic(nn.Module):
+    """
+    Critic with both Q heads evaluated together: one Linear layer for the shared state-action input and batched
+    matrix multiplies over the (2, ...) stacked hidden and output layers, instead of six separate Linear calls.
+    Initialized like Critic. Saves and loads Critic state dicts, so fused and unfused checkpoints are interchangeable.
+    """
+
+    def __init__(self, state_dim, action_dim):
+        super(StackedCritic, self).__init__()
+
+        critic = Critic(state_dim, action_dim)
+        self.l1 = nn.Linear(state_dim + action_dim, 512)
+        self.w2 = nn.Parameter(torch.empty(2, 256, 256))
+        self.b2 = nn.Parameter(torch.empty(2, 1, 256))
+        self.w3 = nn.Parameter(torch.empty(2, 256, 1))
+        self.b3 = nn.Parameter(torch.empty(2, 1, 1))
+        self._register_state_dict_hook(_unstack_state_dict)
+        self.load_state_dict(critic.state_dict())
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Stack the separate Q1 (l1-l3) and Q2 (l4-l6) layers of a Critic state dict
+        if prefix + 'l4.weight' in state_dict:
+            layers = {key: state_dict.pop(prefix + key) for key in CRITIC_KEYS}
+            for key, value in _stack_critic(layers).items():
+                state_dict[prefix + key] = value
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, state, action):
+        sa = torch.cat([state, action], 1)
+
+        q = F.relu(self.l1(sa))
+        q = q.view(-1, 2, 256).transpose(0, 1)  # (2, batch, 256)
+        q = F.relu(torch.baddbmm(self.b2, q, self.w2))
+        q = torch.baddbmm(self.b3, q, self.w3)
+        return q[0], q[1]
+
+    def Q1(self, state, action):
+        sa = torch.cat([state, action], 1)
+
+        q1 = F.relu(F.linear(sa, self.l1.weight[:256], self.l1.bias[:256]))
+        q1 = F.relu(torch.addmm(self.b2[0], q1, self.w2[0]))
+        q1 = torch.addmm(self.b3[0], q1, self.w3[0])
+        return q1
+
+
 class TD3(object):
     def __init__(
             self,
@@ -72,16 +181,27 @@ class TD3(object):
             tau=0.005,
             policy_noise=0.2,
             noise_clip=0.5,
-            policy_freq=2
+            policy_freq=2,
+            fused=False,
+            compile=False
     ):
+        # fused: stacked twin critic, multi-tensor Adam and Polyak averaging; compile: torch.compile the networks
+        critic_class = StackedCritic if fused else Critic
+        adam_kwargs = {"lr": 3e-4}
+        if fused:
+            adam_kwargs["fused" if device.type == "cuda" else "foreach"] = True
 
         self.actor = Actor(state_dim, action_dim, max_action).to(device)
         self.actor_target = copy.deepcopy(self.actor)
-        self.actor_optimizer = torch.optim.Adam(self.actor.parameters(), lr=3e-4)
+        self.actor_optimizer = torch.optim.Adam(self.actor.parameters(), **adam_kwargs)
 
-        self.critic = Critic(state_dim, action_dim).to(device)
+        self.critic = critic_class(state_dim, action_dim).to(device)
         self.critic_target = copy.deepcopy(self.critic)
-        self.critic_optimizer = torch.optim.Adam(self.critic.parameters(), lr=3e-4)
+        self.critic_optimizer = torch.optim.Adam(self.critic.parameters(), **adam_kwargs)
+
+        self.fused = fused
+        self.compile = compile
+        self._prepare_update()
 
         self.max_action = max_action
         self.discount = discount
@@ -92,15 +212,41 @@ class TD3(object):
 
         self.total_it = 0
 
+    def _prepare_update(self):
+        # Cache parameter lists for multi-tensor Polyak averaging and (re)build compiled networks, after init and load
+        self._critic_params = list(self.critic.parameters())
+        self._critic_target_params = list(self.critic_target.parameters())
+        self._actor_params = list(self.actor.parameters())
+        self._actor_target_params = list(self.actor_target.parameters())
+
+        wrap = torch.compile if self.compile else (lambda module: module)
+        self._actor_fn = wrap(self.actor)
+        self._actor_target_fn = wrap(self.actor_target)
+        self._critic_fn = wrap(self.critic)
+        self._critic_target_fn = wrap(self.critic_target)
+
+    def _soft_update(self, params, target_params):
+        with torch.no_grad():
+            torch._foreach_mul_(target_params, 1 - self.tau)
+            torch._foreach_add_(target_params, params, alpha=self.tau)
+
     def select_action(self, state):
-        state = torch.FloatTensor(state.reshape(1, -1)).to(device)
-        return self.actor(state).cpu().data.numpy().flatten()
+        with torch.inference_mode():
+            state = torch.as_tensor(state.reshape(1, -1), dtype=torch.float32, device=device)
+            return self.actor(state).cpu().numpy().flatten()
+
+    def select_actions(self, states):
+        # Batched select_action, one actor forward pass for a (n, state_dim) array of states
+        with torch.inference_mode():
+            states = torch.as_tensor(states, dtype=torch.float32, device=device)
+            return self.actor(states).cpu().numpy()
 
     def train(self, replay_buffer, batch_size=256):
         self.total_it += 1
 
         # Sample replay buffer
-        state, action, next_state, reward, not_done = replay_buffer.sample(batch_size)
+        batch = replay_buffer.sample(batch_size)
+        state, action, next_state, reward, not_done = batch[:5]
 
         with torch.no_grad():
             # Select action according to policy and add clipped noise
@@ -109,55 +255,116 @@ class TD3(object):
             ).clamp(-self.noise_clip, self.noise_clip)
 
             next_action = (
-                    self.actor_target(next_state) + noise
+                    self._actor_target_fn(next_state) + noise
             ).clamp(-self.max_action, self.max_action)
 
             # Compute the target Q value
-            target_Q1, target_Q2 = self.critic_target(next_state, next_action)
+            target_Q1, target_Q2 = self._critic_target_fn(next_state, next_action)
             target_Q = torch.min(target_Q1, target_Q2)
             target_Q = reward + not_done * self.discount * target_Q
 
         # Get current Q estimates
-        current_Q1, current_Q2 = self.critic(state, action)
+        current_Q1, current_Q2 = self._critic_fn(state, action)
 
         # Compute critic loss
-        critic_loss = F.mse_loss(current_Q1, target_Q) + F.mse_loss(current_Q2, target_Q)
+        if len(batch) > 5:
+            # Prioritized replay: importance-sampling weighted loss, and feed the new TD errors back as priorities
+            weights, ids = batch[5:]
+            critic_loss = (weights * ((current_Q1 - target_Q) ** 2 + (current_Q2 - target_Q) ** 2)).mean()
+            td_error = torch.max(torch.abs(current_Q1 - target_Q), torch.abs(current_Q2 - target_Q))
+            replay_buffer.update_priorities(ids, td_error.detach().cpu().numpy())
+        else:
+            critic_loss = F.mse_loss(current_Q1, target_Q) + F.mse_loss(current_Q2, target_Q)
 
         # Optimize the critic
         self.critic_optimizer.zero_grad()
         critic_loss.backward()
         self.critic_optimizer.step()
 
+        tm = telemetry.get()
+        if tm.enabled and tm.should_record('train/critic_loss'):
+            tm.write('train/critic_loss', critic_loss.item())
+
         # Delayed policy updates
         if self.total_it % self.policy_freq == 0:
 
             # Compute actor losse
-            actor_loss = -self.critic.Q1(state, self.actor(state)).mean()
+            actor_loss = -self.critic.Q1(state, self._actor_fn(state)).mean()
 
             # Optimize the actor
             self.actor_optimizer.zero_grad()
             actor_loss.backward()
             self.actor_optimizer.step()
 
-            # Update the frozen target models
-            for param, target_param in zip(self.critic.parameters(), self.critic_target.parameters()):
-                target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+            if tm.enabled and tm.should_record('train/actor_loss'):
+                tm.write('train/actor_loss', actor_loss.item())
 
-            for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
-                target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+            # Update the frozen target models
+            if self.fused:
+                self._soft_update(self._critic_params, self._critic_target_params)
+                self._soft_update(self._actor_params, self._actor_target_params)
+            else:
+                for param, target_param in zip(self.critic.parameters(), self.critic_target.parameters()):
+                    target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+
+                for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
+                    target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+
+    def _critic_optimizer_state_dict(self):
+        # Saved in the Critic parameter order, like the critic weights
+        state_dict = self.critic_optimizer.state_dict()
+        if self.fused:
+            keys = [name for name, _ in self.critic.named_parameters()]
+            state_dict = _convert_optimizer_state(state_dict, keys, CRITIC_KEYS, _unstack_critic)
+        return state_dict
+
+    def _load_critic_optimizer_state_dict(self, state_dict):
+        # Fused checkpoints saved before the Critic parameter order was used load as they are
+        if self.fused and len(state_dict['param_groups'][0]['params']) == len(CRITIC_KEYS):
+            keys = [name for name, _ in self.critic.named_parameters()]
+            state_dict = _convert_optimizer_state(state_dict, CRITIC_KEYS, keys, _stack_critic)
+        self.critic_optimizer.load_state_dict(state_dict)
+
+    def state_dict(self):
+        return {
+            "actor": self.actor.state_dict(),
+            "actor_target": self.actor_target.state_dict(),
+            "actor_optimizer": self.actor_optimizer.state_dict(),
+            "critic": self.critic.state_dict(),
+            "critic_target": self.critic_target.state_dict(),
+            "critic_optimizer": self._critic_optimizer_state_dict(),
+            "total_it": self.total_it,
+        }
+
+    def load_state_dict(self, state_dict):
+        self.actor.load_state_dict(state_dict["actor"])
+        self.actor_target.load_state_dict(state_dict["actor_target"])
+        self.actor_optimizer.load_state_dict(state_dict["actor_optimizer"])
+        self.critic.load_state_dict(state_dict["critic"])
+        self.critic_target.load_state_dict(state_dict["critic_target"])
+        self._load_critic_optimizer_state_dict(state_dict["critic_optimizer"])
+        self.total_it = state_dict["total_it"]
 
     def save(self, filename):
         torch.save(self.critic.state_dict(), filename + "_critic")
-        torch.save(self.critic_optimizer.state_dict(), filename + "_critic_optimizer")
+        torch.save(self.critic_target.state_dict(), filename + "_critic_target")
+        torch.save(self._critic_optimizer_state_dict(), filename + "_critic_optimizer")
 
         torch.save(self.actor.state_dict(), filename + "_actor")
+        torch.save(self.actor_target.state_dict(), filename + "_actor_target")
         torch.save(self.actor_optimizer.state_dict(), filename + "_actor_optimizer")
 
     def load(self, filename):
+        # Checkpoints saved without target networks start the targets from the loaded networks
         self.critic.load_state_dict(torch.load(filename + "_critic"))
-        self.critic_optimizer.load_state_dict(torch.load(filename + "_critic_optimizer"))
+        self._load_critic_optimizer_state_dict(torch.load(filename + "_critic_optimizer"))
         self.critic_target = copy.deepcopy(self.critic)
+        if os.path.exists(filename + "_critic_target"):
+            self.critic_target.load_state_dict(torch.load(filename + "_critic_target"))
 
         self.actor.load_state_dict(torch.load(filename + "_actor"))
         self.actor_optimizer.load_state_dict(torch.load(filename + "_actor_optimizer"))
         self.actor_target = copy.deepcopy(self.actor)
+        if os.path.exists(filename + "_actor_target"):
+            self.actor_target.load_state_dict(torch.load(filename + "_actor_target"))
+        self._prepare_update()
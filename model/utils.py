@@ -1,3 +1,5 @@
+import copy
+
 import numpy as np
 import torch
 
@@ -26,6 +28,19 @@ class ReplayBuffer(object):
         self.ptr = (self.ptr + 1) % self.max_size
         self.size = min(self.size + 1, self.max_size)
 
+    def add_batch(self, state, action, next_state, reward, done, ended=None):
+        # Adds one transition per row, wrapping around the end of the buffer; ended is only used by CompactReplayBuffer
+        ind = (self.ptr + np.arange(len(state))) % self.max_size
+
+        self.state[ind] = state
+        self.action[ind] = action
+        self.next_state[ind] = next_state
+        self.reward[ind] = np.reshape(reward, (-1, 1))
+        self.not_done[ind] = 1. - np.reshape(done, (-1, 1))
+
+        self.ptr = (self.ptr + len(state)) % self.max_size
+        self.size = min(self.size + len(state), self.max_size)
+
     def sample(self, batch_size):
         ind = np.random.randint(0, self.size, size=batch_size)
 
@@ -36,3 +51,343 @@ class ReplayBuffer(object):
             torch.FloatTensor(self.reward[ind]).to(self.device),
             torch.FloatTensor(self.not_done[ind]).to(self.device)
         )
+
+
+class CompactReplayBuffer(object):
+    """
+    Memory-efficient ReplayBuffer with the same add/add_batch/sample interface.
+
+    Transitions are added in lockstep from num_envs streams (one row per stream per add_batch call, as the vectorized
+    environment produces them), so the next state of a row is simply the state num_envs rows later and is never stored
+    twice. The next states of the most recent rows are written ahead into the rows the following add will fill, which
+    costs num_envs rows of capacity. When a stream's episode ends, as reported by the caller through add_batch's ended
+    mask, its terminal next state does not match the state that follows, so it is kept in a small side buffer instead.
+    That side buffer is a ring sized for episodes of at least min_episode_length steps; if shorter episodes make it wrap
+    while a terminal state is still referenced, the row it belonged to is invalidated and never sampled again.
+
+    States are stored as float32 by default; float16 halves that again but only suits normalized observations.
+    sample fills preallocated (pinned, when using CUDA) tensors instead of allocating new ones, so the returned tensors
+    are only valid until the next call to sample.
+    """
+
+    def __init__(self, state_dim, action_dim, max_size=int(1e6), num_envs=1, state_dtype=np.float32,
+                 min_episode_length=10):
+        self.max_size = max_size
+        self.num_envs = num_envs
+        self.ptr = 0
+        self.size = 0
+
+        self.state = np.zeros((max_size, state_dim), dtype=state_dtype)
+        self.action = np.zeros((max_size, action_dim), dtype=np.float32)
+        self.reward = np.zeros((max_size, 1), dtype=np.float32)
+        self.not_done = np.zeros((max_size, 1), dtype=np.float32)
+
+        # Terminal next states of episodes that ended, indexed by final_index (-1 where the next row is the next state,
+        # -2 where the terminal state was overwritten) and owned by the row in final_row
+        final_size = max_size // min_episode_length + num_envs
+        self.final_state = np.zeros((final_size, state_dim), dtype=state_dtype)
+        self.final_index = np.full(max_size, -1, dtype=np.int64)
+        self.final_row = np.full(final_size, -1, dtype=np.int64)
+        self.final_ptr = 0
+
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self._batch_size = None
+
+    def add(self, state, action, next_state, reward, done, ended=None):
+        self.add_batch(np.reshape(state, (1, -1)), np.reshape(action, (1, -1)), np.reshape(next_state, (1, -1)),
+                       [reward], [done], None if ended is None else [ended])
+
+    def add_batch(self, state, action, next_state, reward, done, ended=None):
+        """
+        :param done: Terminal flag of each transition, stored as not_done
+        :param ended: Whether each stream's episode ended with this transition, including time limit truncations where
+        done is 0; defaults to done
+        """
+        if len(state) != self.num_envs:
+            raise ValueError(f'Expected one transition per stream ({self.num_envs}), got {len(state)}')
+
+        ind = (self.ptr + np.arange(self.num_envs)) % self.max_size
+        self.state[ind] = state
+        self.action[ind] = action
+        self.reward[ind] = np.reshape(reward, (-1, 1))
+        self.not_done[ind] = 1. - np.reshape(done, (-1, 1))
+        self.final_index[ind] = -1
+
+        # The states following ended episodes start new ones, so keep their terminal next states aside
+        ended = np.flatnonzero(np.reshape(done if ended is None else ended, -1))
+        if len(ended):
+            self._store_final(ind[ended], np.asarray(next_state)[ended])
+
+        # Write next states ahead into the rows the next add will fill
+        self.ptr = (self.ptr + self.num_envs) % self.max_size
+        self.state[(self.ptr + np.arange(self.num_envs)) % self.max_size] = next_state
+        self.size = min(self.size + self.num_envs, self.max_size - self.num_envs)
+
+    def end_episodes(self):
+        """
+        Treats every stream's current episode as ended, e.g. when collection restarts from fresh episodes after
+        resuming, so the written-ahead next states are kept as terminal states.
+        """
+        if self.size == 0:
+            return
+        ahead = (self.ptr + np.arange(self.num_envs)) % self.max_size
+        self._store_final((ahead - self.num_envs) % self.max_size, self.state[ahead])
+
+    def _store_final(self, rows, final_state):
+        slots = (self.final_ptr + np.arange(len(rows))) % len(self.final_state)
+
+        # Rows still referencing the slots about to be reused lose their next state
+        owners = self.final_row[slots]
+        overwritten = owners[(owners >= 0) & (self.final_index[np.maximum(owners, 0)] == slots)]
+        if len(overwritten):
+            self._invalidate(overwritten)
+
+        self.final_state[slots] = final_state
+        self.final_row[slots] = rows
+        self.final_index[rows] = slots
+        self.final_ptr = (self.final_ptr + len(rows)) % len(self.final_state)
+
+    def _invalidate(self, rows):
+        self.final_index[rows] = -2
+
+    def _allocate_batch(self, batch_size):
+        pin = self.device.type == "cuda"
+        state_dim, action_dim = self.state.shape[1], self.action.shape[1]
+        shapes = [(batch_size, state_dim), (batch_size, action_dim), (batch_size, state_dim), (batch_size, 1),
+                  (batch_size, 1)]
+
+        self._host_batch = [torch.empty(shape, dtype=torch.float32, pin_memory=pin) for shape in shapes]
+        self._host_arrays = [tensor.numpy() for tensor in self._host_batch]
+        if pin:
+            self._device_batch = [torch.empty(shape, dtype=torch.float32, device=self.device) for shape in shapes]
+        else:
+            self._device_batch = self._host_batch
+        self._batch_size = batch_size
+
+    def sample(self, batch_size):
+        if batch_size != self._batch_size:
+            self._allocate_batch(batch_size)
+
+        # Offsets back from ptr so only rows with a known next state are drawn, redrawing invalidated rows
+        ind = (self.ptr - 1 - np.random.randint(0, self.size, size=batch_size)) % self.max_size
+        invalid = np.flatnonzero(self.final_index[ind] == -2)
+        if len(invalid) and (self.final_index[(self.ptr - 1 - np.arange(self.size)) % self.max_size] == -2).all():
+            raise RuntimeError('No valid transitions to sample, every stored row was invalidated')
+        while len(invalid):
+            ind[invalid] = (self.ptr - 1 - np.random.randint(0, self.size, size=len(invalid))) % self.max_size
+            invalid = invalid[self.final_index[ind[invalid]] == -2]
+        return self._gather(ind)
+
+    def _gather(self, ind):
+        state, action, next_state, reward, not_done = self._host_arrays
+
+        state[:] = self.state[ind]
+        np.take(self.action, ind, axis=0, out=action)
+        next_state[:] = self.state[(ind + self.num_envs) % self.max_size]
+        np.take(self.reward, ind, axis=0, out=reward)
+        np.take(self.not_done, ind, axis=0, out=not_done)
+
+        final = self.final_index[ind]
+        ended = final >= 0
+        if ended.any():
+            next_state[ended] = self.final_state[final[ended]]
+
+        if self._device_batch is not self._host_batch:
+            for device_tensor, host_tensor in zip(self._device_batch, self._host_batch):
+                device_tensor.copy_(host_tensor, non_blocking=True)
+
+        return tuple(self._device_batch)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.state, self.action, self.reward, self.not_done, self.final_state,
+                                              self.final_index, self.final_row))
+
+
+class SumTree(object):
+    """
+    Binary sum-tree over a flat NumPy array. Leaves hold priorities and every inner node the sum of its children, so
+    prefix-sum lookups and priority updates are O(log n) and are done for a whole batch at once.
+    """
+
+    def __init__(self, capacity):
+        self.depth = max(int(capacity - 1).bit_length(), 1)
+        self.capacity = 1 << self.depth
+        self.tree = np.zeros(2 * self.capacity)  # Node 1 is the root, leaves start at capacity
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, ind, priority):
+        ind = np.asarray(ind) + self.capacity
+        self.tree[ind] = priority
+        for _ in range(self.depth):
+            ind = np.unique(ind // 2)
+            self.tree[ind] = self.tree[2 * ind] + self.tree[2 * ind + 1]
+
+    def find(self, values):
+        # Leaf index where the running sum of priorities first exceeds each value
+        ind = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * ind
+            go_right = values > self.tree[left]
+            values = values - self.tree[left] * go_right
+            ind = left + go_right
+        return ind - self.capacity
+
+    def get(self, ind):
+        return self.tree[ind + self.capacity]
+
+
+class PrioritizedReplayBuffer(CompactReplayBuffer):
+    """
+    CompactReplayBuffer sampled proportionally to TD error (Schaul et al., Prioritized Experience Replay).
+
+    sample returns the ReplayBuffer batch followed by its importance-sampling weights and the sampled transition ids,
+    which TD3.train passes back to update_priorities with the new TD errors. Ids count the transitions added, so
+    priorities of rows that add_batch overwrote (or that were invalidated) since they were sampled are left alone.
+    """
+
+    def __init__(self, state_dim, action_dim, max_size=int(1e6), num_envs=1, state_dtype=np.float32,
+                 min_episode_length=10, alpha=0.6, beta=0.4, beta_steps=int(1e6), eps=1e-6):
+        super().__init__(state_dim, action_dim, max_size, num_envs, state_dtype, min_episode_length)
+
+        self.tree = SumTree(max_size)
+        self.max_priority = 1.
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1. - beta) / beta_steps
+        self.eps = eps
+
+        self.weights = None
+        self.added = 0  # Transitions added by this process, only compared between sample and update_priorities
+
+    def add_batch(self, state, action, next_state, reward, done, ended=None):
+        ind = (self.ptr + np.arange(self.num_envs)) % self.max_size
+        super().add_batch(state, action, next_state, reward, done, ended)
+        self.added += self.num_envs
+
+        # New transitions are sampled at least once; the written-ahead rows hold no transition yet
+        self.tree.update(ind, self.max_priority)
+        self.tree.update((self.ptr + np.arange(self.num_envs)) % self.max_size, 0.)
+
+    def _invalidate(self, rows):
+        super()._invalidate(rows)
+        self.tree.update(rows, 0.)
+
+    def _allocate_batch(self, batch_size):
+        super()._allocate_batch(batch_size)
+        self.weights = torch.empty((batch_size, 1), dtype=torch.float32, device=self.device)
+
+    def sample(self, batch_size):
+        if batch_size != self._batch_size:
+            self._allocate_batch(batch_size)
+
+        if self.tree.total() <= 0:
+            raise RuntimeError('No valid transitions to sample, every stored row has zero priority')
+
+        # Stratified sampling, one value from each of batch_size equal segments of the total priority
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        ind = np.minimum(self.tree.find(values), self.max_size - 1)
+
+        # Rounding in the descent can land on a zero-priority leaf, which would give an infinite weight
+        probabilities = np.maximum(self.tree.get(ind), self.eps ** self.alpha) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        self.weights.copy_(torch.from_numpy((weights / weights.max()).reshape(-1, 1)))
+        self.beta = min(1., self.beta + self.beta_increment)
+
+        ids = self.added - 1 - (self.ptr - 1 - ind) % self.max_size
+        return self._gather(ind) + (self.weights, ids)
+
+    def update_priorities(self, ids, td_errors):
+        """
+        :param ids: Transition ids returned by sample
+        :param td_errors: TD error of each sampled transition
+        """
+        priorities = (np.abs(np.reshape(td_errors, -1)) + self.eps) ** self.alpha
+        self.max_priority = max(self.max_priority, priorities.max())
+
+        # Skip rows overwritten since sampling, they keep the priority add_batch gave them, and invalidated rows
+        offset = self.added - 1 - np.asarray(ids)
+        ind = (self.ptr - 1 - offset) % self.max_size
+        keep = (offset < self.size) & (self.final_index[ind] != -2)
+        if keep.any():
+            self.tree.update(ind[keep], priorities[keep])
+
+
+class ObservationNormalizer(object):
+    """
+    Standardizes [cash_balance, shares_owned, asset_info] observations with running means and variances.
+
+    Statistics are pooled across assets: there is one mean and variance for the cash balance, one for share holdings
+    and one per asset feature, so raw OBV and ADI values in the millions end up on the same scale as RSI, and any
+    number or subset of assets can be normalized with the same statistics. Each update merges the batch statistics of
+    all (observations, assets) values into the running ones (Welford's algorithm in its parallel form), which is a few
+    vectorized reductions per batch. Once frozen, for evaluation and inference, update does nothing.
+
+    :param num_features: Features per asset in the observation
+    :param clip: Normalized values are clipped to [-clip, clip]
+    """
+
+    def __init__(self, num_features, clip=10., eps=1e-8):
+        self.num_features = num_features
+        self.clip = clip
+        self.eps = eps
+        self.frozen = False
+
+        # Statistics of [cash_balance, shares_owned, feature 0, ..., feature n - 1]
+        self.count = np.zeros(2 + num_features)
+        self.mean = np.zeros(2 + num_features)
+        self.var = np.ones(2 + num_features)
+
+    def _split(self, observations):
+        # Views of (n, obs_dim) observations as cash (n, 1), shares (n, assets) and asset features (n, assets, features)
+        num_assets = (observations.shape[1] - 1) // (1 + self.num_features)
+        return (observations[:, :1], observations[:, 1:1 + num_assets],
+                observations[:, 1 + num_assets:].reshape(len(observations), num_assets, self.num_features))
+
+    def update(self, observations):
+        if self.frozen:
+            return
+        cash, shares, features = self._split(np.reshape(observations, (-1, np.shape(observations)[-1])))
+
+        batch_count = np.array([cash.size, shares.size] + [features.size // self.num_features] * self.num_features)
+        batch_mean = np.concatenate([[cash.mean(), shares.mean()], features.mean(axis=(0, 1))])
+        batch_var = np.concatenate([[cash.var(), shares.var()], features.var(axis=(0, 1))])
+
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * batch_count / total
+        self.var = (self.var * self.count + batch_var * batch_count + delta ** 2 * self.count * batch_count / total) \
+            / total
+        self.count = total
+
+    def normalize(self, observations, out=None):
+        # Normalizes observations with the current statistics, in place when out is observations
+        num_assets = (np.shape(observations)[-1] - 1) // (1 + self.num_features)
+        mean = np.concatenate([self.mean[:1], np.repeat(self.mean[1], num_assets), np.tile(self.mean[2:], num_assets)])
+        std = np.sqrt(np.concatenate([self.var[:1], np.repeat(self.var[1], num_assets),
+                                      np.tile(self.var[2:], num_assets)]) + self.eps)
+
+        out = np.subtract(observations, mean, out=out)
+        out /= std
+        return np.clip(out, -self.clip, self.clip, out=out)
+
+    def frozen_copy(self):
+        normalizer = copy.deepcopy(self)
+        normalizer.frozen = True
+        return normalizer
+
+    def state_dict(self):
+        return {"count": self.count.copy(), "mean": self.mean.copy(), "var": self.var.copy()}
+
+    def load_state_dict(self, state_dict):
+        self.count, self.mean, self.var = state_dict["count"].copy(), state_dict["mean"].copy(), \
+            state_dict["var"].copy()
+        self.num_features = len(self.mean) - 2
+
+    def save(self, filename):
+        torch.save(self.state_dict(), filename + "_normalizer")
+
+    def load(self, filename):
+        self.load_state_dict(torch.load(filename + "_normalizer", weights_only=False))
@@ -0,0 +1,150 @@
+"""
+Multi-seed and hyperparameter sweeps.
+
+Schedules many main.train runs over a grid or random search of config values and spreads them across a pool of worker
+processes, one run per worker at a time, with the cores split evenly between workers' torch threads. Each run gets a
+fresh worker process, so config overrides never leak from one run into the next. Every run reads the same preprocessed
+feature tensor (config.FEATURE_PATH) as a read-only memory map, so the market data is held once in the page cache and
+shared by all workers rather than loaded per process.
+
+Runs report each evaluation to the sweep, and a run is stopped early by the median stopping rule: once it has at least
+min_evals evaluations, it stops when its best evaluation so far is below the median of the other runs' average
+evaluation over the same number of evaluations. Results of all runs are collected into one table.
+
+Usage:
+    python sweep.py '{"SEED": [0, 1, 2], "TAU": [0.005, 0.01]}' [--random 20] [--workers 4] [--min-evals 5]
+                    [--output results/sweep.csv]
+
+With --random, list values are sampled uniformly and [low, high] pairs given as {"low": .., "high": ..} are sampled
+uniformly from the range (integers if both bounds are integers).
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+def grid(space: dict) -> list:
+    """
+    :param space: Config names mapped to lists of values
+    :return: Overrides for every combination of values
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space: dict, num_runs: int, seed: int = 0) -> list:
+    """
+    :param space: Config names mapped to lists of values to choose from, or {'low': .., 'high': ..} ranges
+    :return: num_runs randomly sampled overrides
+    """
+    rng = np.random.default_rng(seed)
+    runs = []
+    for _ in range(num_runs):
+        overrides = {}
+        for name, values in space.items():
+            if isinstance(values, dict):
+                low, high = values['low'], values['high']
+                if isinstance(low, int) and isinstance(high, int):
+                    overrides[name] = int(rng.integers(low, high + 1))
+                else:
+                    overrides[name] = float(rng.uniform(low, high))
+            else:
+                overrides[name] = values[rng.integers(len(values))]
+        runs.append(overrides)
+    return runs
+
+
+def should_stop(name: str, progress, min_evals: int, evaluations: list) -> bool:
+    # Median stopping rule, progress maps run names to their evaluations so far and is shared by all workers
+    progress[name] = list(evaluations)
+    n = len(evaluations)
+    if n < min_evals:
+        return False
+
+    others = [np.mean(values[:n]) for other, values in progress.items() if other != name and len(values) >= n]
+    return len(others) > 0 and max(evaluations) < np.median(others)
+
+
+def _run(name: str, overrides: dict, progress, min_evals: int, threads: int) -> dict:
+    # Worker process entry point, applies the overrides to this process's config before training
+    import torch
+    torch.set_num_threads(threads)
+
+    # Separate output paths per run, unless the sweep sets them
+    overrides = {'CHECKPOINT_PATH': os.path.join(config.CHECKPOINT_PATH, name),
+                 'TELEMETRY_PATH': f'./results/{name}.telemetry.bin',
+                 'PROFILE_PATH': f'./results/{name}.profile', **overrides}
+    for key, value in overrides.items():
+        if not hasattr(config, key):
+            raise AttributeError(f'Unknown config value {key}')
+        setattr(config, key, value)
+
+    import main
+
+    start = time.perf_counter()
+    evaluations = main.train(name, lambda evaluations: should_stop(name, progress, min_evals, evaluations))
+    return {
+        'evaluations': len(evaluations),
+        'final_eval': evaluations[-1],
+        'best_eval': max(evaluations),
+        'stopped': len(evaluations) < int(config.MAX_TIMESTEPS // config.EVAL_FREQ) + 1,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_sweep(runs: list, max_workers: int = None, min_evals: int = 5, output: str = './results/sweep.csv'):
+    """
+    Trains one run per set of overrides.
+
+    :param runs: Config overrides of every run, e.g. from grid or random_search
+    :param max_workers: Worker processes, defaults to one per core (at most one per run)
+    :param min_evals: Evaluations a run gets before it can be stopped early
+    :param output: CSV file the results table is written to, updated as runs finish
+    :return: DataFrame with one row per run: its overrides, evaluation count, final and best evaluation, whether it
+    was stopped early and its duration
+    """
+    max_workers = max_workers or max(1, min(os.cpu_count(), len(runs)))
+    threads = max(1, os.cpu_count() // max_workers)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    rows = []
+    results = pd.DataFrame(rows)
+    # Spawned workers, forking a process that already initialized torch threads is unsafe
+    context = multiprocessing.get_context('spawn')
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers, mp_context=context, max_tasks_per_child=1) as executor:
+        progress = manager.dict()
+        futures = {executor.submit(_run, f'sweep_{i:03d}', overrides, progress, min_evals, threads): (i, overrides)
+                   for i, overrides in enumerate(runs)}
+
+        for future in as_completed(futures):
+            i, overrides = futures[future]
+            rows.append({'run': f'sweep_{i:03d}', **overrides, **future.result()})
+            results = pd.DataFrame(rows).sort_values('run').reset_index(drop=True)
+            results.to_csv(output, index=False)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('space', help='JSON object of config names mapped to values')
+    parser.add_argument('--random', type=int, help='Sample this many runs instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random search')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--min-evals', type=int, default=5)
+    parser.add_argument('--output', default='./results/sweep.csv')
+    args = parser.parse_args()
+
+    space = json.loads(args.space)
+    runs = random_search(space, args.random, args.seed) if args.random else grid(space)
+    print(run_sweep(runs, args.workers, args.min_evals, args.output).sort_values('best_eval', ascending=False))
@@ -0,0 +1,226 @@
+"""
+Low-overhead training telemetry.
+
+Metrics are appended as fixed-size binary records (wall time, step, metric id, value) to one log file by a background
+writer thread, and can be read back into a DataFrame with read_log. Recording only appends a tuple to a list in the
+calling thread; packing and file I/O happen on the writer.
+
+Each metric can be sampled (only every sample_every-th value is kept) and filtered by level. When telemetry is
+disabled, get() returns a NullTelemetry whose enabled flag is False, so hot loops can skip all work with one check:
+
+    tm = telemetry.get()
+    if tm.enabled:
+        tm.record('env/reward', reward)
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+
+DEBUG = 10
+INFO = 20
+
+RECORD = np.dtype([('time', '<f8'), ('step', '<i8'), ('metric', '<u2'), ('value', '<f8')])
+
+
+class NullTelemetry(object):
+    enabled = False
+    step = 0
+
+    def should_record(self, name, level=INFO):
+        return False
+
+    def record(self, name, value, step=None, level=INFO):
+        pass
+
+    def write(self, name, value, step=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class Telemetry(object):
+    """
+    :param path: Log file, metric names are stored next to it in <path>.names.json
+    :param level: Minimum level of recorded metrics
+    :param sample_every: Keep every n-th value of each metric, per metric name
+    :param batch_size: Records handed to the writer thread at once
+    """
+    enabled = True
+
+    def __init__(self, path: str = config.TELEMETRY_PATH, level: int = INFO, sample_every: int = 1,
+                 batch_size: int = 4096):
+        self.path = path
+        self.level = level
+        self.sample_every = sample_every
+        self.batch_size = batch_size
+        self.step = 0  # Default step of records, set by the training loop
+
+        self._metric_ids = {}
+        if os.path.exists(path + '.names.json'):  # Appending to an existing log keeps its metric ids
+            with open(path + '.names.json') as f:
+                self._metric_ids = json.load(f)
+        self._counts = {}
+        self._records = []
+        self._lock = threading.Lock()  # Records may come from the training loop and the learner thread
+        self._queue = queue.SimpleQueue()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'ab')
+        self._writer = threading.Thread(target=self._write_batches, daemon=True)
+        self._writer.start()
+
+    def should_record(self, name, level=INFO):
+        # Whether the next value of this metric would be kept, advances the metric's sampling counter
+        if level < self.level:
+            return False
+        count = self._counts.get(name, 0)
+        self._counts[name] = count + 1
+        return count % self.sample_every == 0
+
+    def record(self, name, value, step=None, level=INFO):
+        if self.should_record(name, level):
+            self.write(name, value, step)
+
+    def write(self, name, value, step=None):
+        # Unconditionally records a value, for callers that already checked should_record
+        metric = self._metric_ids.get(name)
+        if metric is None:
+            metric = self._register(name)
+
+        with self._lock:
+            self._records.append((time.time(), self.step if step is None else step, metric, value))
+            if len(self._records) >= self.batch_size:
+                self._queue.put(self._records)
+                self._records = []
+
+    def _register(self, name):
+        with self._lock:
+            if name not in self._metric_ids:
+                self._metric_ids[name] = len(self._metric_ids)
+                tmp_path = self.path + '.names.json.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._metric_ids, f)
+                os.replace(tmp_path, self.path + '.names.json')
+            return self._metric_ids[name]
+
+    def _write_batches(self):
+        while True:
+            records = self._queue.get()
+            if records is None:
+                return
+            np.array(records, dtype=RECORD).tofile(self._file)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._records:
+                self._queue.put(self._records)
+                self._records = []
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+
+
+def read_log(path: str = config.TELEMETRY_PATH) -> pd.DataFrame:
+    """
+    Reads a telemetry log.
+
+    :return: DataFrame with columns ['time', 'step', 'metric', 'value'], metric holding the metric names
+    """
+    with open(path + '.names.json') as f:
+        names = {metric: name for name, metric in json.load(f).items()}
+
+    records = np.fromfile(path, dtype=RECORD)
+    df = pd.DataFrame(records)
+    df['metric'] = pd.Categorical.from_codes(df['metric'], [names[i] for i in range(len(names))])
+    return df
+
+
+class Profiler(object):
+    """
+    Profiles a window of training loop iterations with cProfile or torch.profiler.
+
+    step(t) is called once per iteration; profiling starts at the first call with t >= start and the trace is written
+    after `steps` iterations, to <path>.prof (cProfile, open with pstats or snakeviz) or <path>.json (Chrome trace of
+    torch.profiler, open in chrome://tracing or Perfetto). With mode None, step does nothing.
+
+    cProfile only sees the thread that calls step, so training with it runs TD3 updates synchronously on the training
+    loop thread instead of an AsyncLearner (see main.train); torch.profiler records the operators of every thread.
+    """
+
+    def __init__(self, mode: str = config.PROFILE, path: str = config.PROFILE_PATH, start: int = 0,
+                 steps: int = config.PROFILE_STEPS):
+        if mode not in (None, 'cprofile', 'torch'):
+            raise ValueError(f'Unknown profiler {mode}, expected None, "cprofile" or "torch"')
+
+        self.mode = mode
+        self.path = path
+        self.start = start
+        self.steps = steps
+        self._profiler = None
+        self._remaining = steps
+
+    def step(self, t: int):
+        if self.mode is None or self._remaining < 0 or t < self.start:
+            return
+
+        if self._profiler is None:
+            self._begin()
+        elif self._remaining == 0:
+            self._end()
+        elif self.mode == 'torch':
+            self._profiler.step()
+        self._remaining -= 1
+
+    def _begin(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.mode == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            import torch.profiler
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profiler = torch.profiler.profile(activities=activities, record_shapes=True, with_stack=True)
+            self._profiler.__enter__()
+
+    def _end(self):
+        if self.mode == 'cprofile':
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path + '.prof')
+        else:
+            self._profiler.__exit__(None, None, None)
+            self._profiler.export_chrome_trace(self.path + '.json')
+
+    def close(self):
+        # Writes the trace if the loop ended inside the profiled window
+        if self._profiler is not None and self._remaining >= 0:
+            self._remaining = -1
+            self._end()
+
+
+_telemetry = NullTelemetry()
+
+
+def configure(enabled: bool = config.TELEMETRY, **kwargs):
+    """
+    Sets up the process-wide telemetry returned by get(), see Telemetry for the keyword arguments.
+    """
+    global _telemetry
+    _telemetry.close()
+    _telemetry = Telemetry(**kwargs) if enabled else NullTelemetry()
+    return _telemetry
+
+
+def get():
+    return _telemetry
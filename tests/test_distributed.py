@@ -0,0 +1,43 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import config
+from benchmarks.synthetic import make_feature_tensor
+from model import distributed
+
+
+def test_transitions_round_trip():
+    rng = np.random.default_rng(0)
+    rows, state_dim, action_dim = 12, 7, 3
+    batch = (rng.standard_normal((rows, state_dim)), rng.standard_normal((rows, action_dim)),
+             rng.standard_normal((rows, state_dim)), rng.standard_normal(rows), rng.integers(0, 2, rows))
+
+    decoded = distributed.decode_transitions(b''.join(distributed.encode_transitions(*batch)))
+    for expected, actual in zip(batch, decoded):
+        assert actual.dtype == np.float32
+        np.testing.assert_array_equal(actual, np.asarray(expected, dtype=np.float32))
+
+
+def test_local_server_and_actor(tmp_path, monkeypatch):
+    make_feature_tensor(str(tmp_path), 200, 3)
+    for name, value in {'FEATURE_PATH': str(tmp_path), 'EPISODE_LENGTH': 20, 'VAL_FRACTION': 0.,
+                        'START_TIMESTEPS': 64, 'EVAL_FREQ': 1e9, 'EVAL_EPISODES': 1, 'SAVE_MODEL': False}.items():
+        monkeypatch.setattr(config, name, value)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    stop, result = threading.Event(), {}
+    server = threading.Thread(target=lambda: result.update(policy=distributed.run_server(('127.0.0.1', port), stop)))
+    server.start()
+    try:
+        distributed.run_actor(('127.0.0.1', port), steps=256, num_envs=4, batch_rows=32, sync_freq=64, seed=0)
+    finally:
+        stop.set()
+        server.join(timeout=60)
+    assert not server.is_alive() and result['policy'] is not None
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import config
+from envs.episode_sampler import EpisodeSampler, split_days
+
+
+def _sampler(num_days, split):
+    return EpisodeSampler(num_days, 5, config.EPISODE_LENGTH, split=split, val_fraction=config.VAL_FRACTION,
+                          block_days=config.SPLIT_BLOCK_DAYS, split_seed=config.SPLIT_SEED, seed=0)
+
+
+@pytest.mark.parametrize('num_days', [1000, 2520, 5040])
+def test_default_config_has_train_and_val_windows(num_days):
+    train, val = _sampler(num_days, 'train'), _sampler(num_days, 'val')
+    assert len(train) and len(val)
+
+    span = config.EPISODE_LENGTH + 1
+    starts, _ = val.sample(len(val))
+    in_val = split_days(num_days, 'val', config.VAL_FRACTION, max(config.SPLIT_BLOCK_DAYS, span), config.SPLIT_SEED)
+    assert all(in_val[start:start + span].all() for start in starts)
+
+
+def test_splits_are_disjoint_and_cover_history():
+    train = split_days(2520, 'train', 0.2, 301, 0)
+    val = split_days(2520, 'val', 0.2, 301, 0)
+    assert not (train & val).any() and (train | val).all()
+
+
+def test_short_history_names_config():
+    with pytest.raises(ValueError, match='EPISODE_LENGTH'):
+        _sampler(400, 'train')
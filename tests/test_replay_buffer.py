@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from model.utils import CompactReplayBuffer, PrioritizedReplayBuffer
+
+
+def add(buffer, count):
+    for _ in range(count):
+        buffer.add_batch(np.random.standard_normal((1, 2)), np.zeros((1, 1)), np.random.standard_normal((1, 2)), [0.],
+                         [0.])
+
+
+def test_priorities_of_overwritten_rows_are_kept():
+    np.random.seed(0)
+    buffer = PrioritizedReplayBuffer(2, 1, max_size=8)
+    add(buffer, 6)
+    ids = buffer.sample(4)[-1]  # One draw from each quarter of the priority mass covers rows 0-1 and 4-5
+
+    add(buffer, 5)  # Rows 0-2 now hold new transitions and row 3 the written-ahead next state
+    buffer.update_priorities(ids, np.full(len(ids), 10.))
+    expected = np.where(ids >= 4, (10. + buffer.eps) ** buffer.alpha, np.where(ids == 3, 0., 1.))
+    np.testing.assert_allclose(buffer.tree.get(ids % 8), expected)
+
+
+@pytest.mark.parametrize('buffer_class', [CompactReplayBuffer, PrioritizedReplayBuffer])
+def test_sampling_only_invalid_rows_raises(buffer_class):
+    buffer = buffer_class(2, 1, max_size=8)
+    add(buffer, 3)
+    buffer._invalidate(np.arange(3))
+    with pytest.raises(RuntimeError, match='No valid transitions'):
+        buffer.sample(4)
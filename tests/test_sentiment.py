@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from market_data.feature_store import FeatureStore
+from market_data.preprocess import preprocess_batch
+from market_data.sentiment import LexiconScorer, assign_sessions, ingest_sentiment
+from trading.training_controller import SENTIMENT_FEATURES
+
+
+def _raw_bars(start: str, days: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    return pd.DataFrame({'date': pd.bdate_range(start, periods=days), 'open': close, 'high': close * 1.01,
+                         'low': close * 0.99, 'close': close, 'adj_close': close,
+                         'volume': rng.integers(100_000, 1_000_000, days)})
+
+
+def test_negation_flips_valence():
+    scores = LexiconScorer().score(['shares surge', 'shares did not surge', 'no news'])
+    assert scores[0] > 0 > scores[1] and scores[2] == 0
+
+
+def test_sessions_outside_the_calendar_are_nat():
+    sessions = assign_sessions(pd.Series(['2000-01-05 12:00', '2024-01-05 22:00', '2024-01-08 15:00']))
+    assert np.isnat(sessions[0])
+    assert list(sessions[1:]) == [np.datetime64('2024-01-08'), np.datetime64('2024-01-08')]
+
+
+def test_ingest_and_merge_into_preprocess_batch(tmp_path):
+    store = FeatureStore(str(tmp_path / 'store'))
+    for seed, ticker in enumerate(['AAA', 'BBB']):
+        store.write('raw', ticker, _raw_bars('2023-06-01', 200, seed))
+
+    records = tmp_path / 'records.csv'
+    pd.DataFrame({'timestamp': ['2023-09-01 14:00', '2023-09-01 15:00', '2001-02-01 15:00'],
+                  'ticker': ['AAA', 'AAA', 'AAA'],
+                  'text': ['AAA shares surge on record profit', 'AAA beats estimates', 'AAA crash']}).to_csv(records)
+
+    sentiment = ingest_sentiment([str(records)], store)
+    assert len(sentiment) == 1 and sentiment.sentiment_volume.iloc[0] == 2
+
+    panel = preprocess_batch(['AAA', 'BBB'], store, max_workers=1, save_features=False)
+    assert panel.loc['2023-09-01', ('AAA', 'sentiment')] > 0
+    assert panel.loc['2023-09-01', ('AAA', 'sentiment_volume')] == 2
+    assert (panel[[('BBB', feature) for feature in SENTIMENT_FEATURES]] == 0).all().all()
+    assert panel[('AAA', 'sentiment_volume')].sum() == 2
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from model.td3 import TD3
+from model.utils import ReplayBuffer
+
+STATE_DIM, ACTION_DIM, ROWS = 7, 3, 128
+
+
+@pytest.fixture
+def replay_buffer():
+    rng = np.random.default_rng(0)
+    replay_buffer = ReplayBuffer(STATE_DIM, ACTION_DIM, ROWS)
+    replay_buffer.add_batch(rng.standard_normal((ROWS, STATE_DIM)), rng.uniform(-1, 1, (ROWS, ACTION_DIM)),
+                            rng.standard_normal((ROWS, STATE_DIM)), rng.standard_normal(ROWS), np.zeros(ROWS))
+    return replay_buffer
+
+
+def train(policy, replay_buffer, steps):
+    # Same seeds, so both policies see the same batches and target noise
+    torch.manual_seed(0)
+    np.random.seed(0)
+    for _ in range(steps):
+        policy.train(replay_buffer, 32)
+
+
+def assert_same_networks(expected, actual):
+    state, action = torch.randn(16, STATE_DIM), torch.rand(16, ACTION_DIM)
+    with torch.no_grad():
+        for name in ('critic', 'critic_target'):
+            q_expected, q_actual = getattr(expected, name)(state, action), getattr(actual, name)(state, action)
+            torch.testing.assert_close(torch.cat(q_actual, 1), torch.cat(q_expected, 1), rtol=1e-4, atol=1e-5)
+        torch.testing.assert_close(actual.actor(state), expected.actor(state), rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('fused', [True, False])
+def test_fused_and_unfused_checkpoints_are_interchangeable(tmp_path, replay_buffer, fused):
+    source = TD3(STATE_DIM, ACTION_DIM, 1., fused=fused)
+    train(source, replay_buffer, 4)
+    source.save(str(tmp_path / 'source'))
+
+    loaded = TD3(STATE_DIM, ACTION_DIM, 1., fused=not fused)
+    loaded.load(str(tmp_path / 'source'))
+    assert_same_networks(source, loaded)
+
+    # Equal updates after loading need the Adam moments remapped along with the weights
+    train(source, replay_buffer, 2)
+    train(loaded, replay_buffer, 2)
+    assert_same_networks(source, loaded)
+
+    round_trip = TD3(STATE_DIM, ACTION_DIM, 1., fused=fused)
+    round_trip.load_state_dict(loaded.state_dict())
+    assert_same_networks(loaded, round_trip)
+    assert set(round_trip.state_dict()['critic']) == set(TD3(STATE_DIM, ACTION_DIM, 1.).state_dict()['critic'])
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.yh_parse import synthetic_page
+from market_data.feature_store import FeatureStore
+from market_data.yh_finance import download_many, extract_history_table
+from market_data.yh_stub_server import serve_saved_pages
+
+
+@pytest.fixture
+def pages(tmp_path):
+    directory = tmp_path / 'pages'
+    directory.mkdir()
+    for ticker, rows in {'AAA': 30, 'BBB': 20}.items():
+        (directory / f'{ticker}.html').write_text(synthetic_page(rows), encoding='utf-8')
+    return directory
+
+
+def test_missing_cells_are_nan():
+    cells = [['Mar 11, 2024', '5,117.94', '5,124.66', '5,091.14', '5,117.94', '5,117.94', '-'],
+             ['Mar 8, 2024', '-', '-', '-', '-', '-', '3,853,000']]
+    html = ('<table class="table svelte-ewueuo"><tbody>'
+            + ''.join('<tr>' + ''.join(f'<td>{cell}</td>' for cell in row) + '</tr>' for row in cells)
+            + '</tbody></table>')
+
+    df = extract_history_table(html)
+    assert list(df.date) == [pd.Timestamp('2024-03-08'), pd.Timestamp('2024-03-11')]
+    assert df.iloc[0, 1:6].isna().all() and df.volume.iloc[0] == 3853000
+    assert df.close.iloc[1] == 5117.94 and np.isnan(df.volume.iloc[1])
+
+
+def test_download_many_retries_and_caches(tmp_path, pages):
+    server = serve_saved_pages(str(pages), transient_errors={'BBB': 2})
+    store = FeatureStore(str(tmp_path / 'store'))
+    try:
+        result = download_many(['AAA', 'BBB'], datetime(2020, 1, 1), store, max_workers=2,
+                               base_url=f'http://127.0.0.1:{server.server_port}')
+        for ticker in ('AAA', 'BBB'):
+            expected = extract_history_table((pages / f'{ticker}.html').read_text(encoding='utf-8'))
+            pd.testing.assert_frame_equal(result[ticker], expected)
+            pd.testing.assert_frame_equal(store.read('raw', ticker), expected, check_dtype=False)
+
+        # The stub ignores the requested period, the store still only appends bars after the last stored one
+        download_many(['AAA'], datetime(2020, 1, 1), store, base_url=f'http://127.0.0.1:{server.server_port}')
+        assert store.meta('raw', 'AAA')['rows'] == 30
+    finally:
+        server.shutdown()
+
+
+def test_download_many_errors(tmp_path, pages):
+    server = serve_saved_pages(str(pages), transient_errors={'BBB': 2})
+    store = FeatureStore(str(tmp_path / 'store'))
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        with pytest.raises(RuntimeError, match='CCC'):  # Not found, not retried
+            download_many(['CCC', 'AAA'], datetime(2020, 1, 1), store, base_url=base_url)
+        assert store.meta('raw', 'AAA')['rows'] == 30  # Other tickers still finish
+
+        with pytest.raises(RuntimeError, match='503'):  # More transient errors than retries
+            download_many(['BBB'], datetime(2020, 1, 1), store, retries=1, base_url=base_url)
+        assert store.meta('raw', 'BBB') is None
+    finally:
+        server.shutdown()
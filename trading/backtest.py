@@ -0,0 +1,129 @@
+"""
+Backtesting of trained actors over a precomputed feature panel.
+
+Portfolio accounting follows MarketEnv (whole-share orders filled at the closing price), with proportional transaction
+costs charged on every fill and counted when checking whether a buy is affordable, so cash never goes negative.
+Observations are path dependent, so time is stepped day by day, but every day is a single batched step over all
+backtested actors: the actors' weights are stacked and evaluated with one vmapped forward pass, and cash, positions and
+costs are updated as (actors, assets) arrays. Scoring thousands of checkpoints or parameter settings costs about as many
+forward passes as scoring one.
+"""
+import numpy as np
+import pandas as pd
+import torch
+from torch.func import functional_call, stack_module_state
+
+import config
+from envs.market_env import fill_orders
+from model.td3 import Actor, device
+from trading.training_controller import load_feature_tensor
+
+TRADING_DAYS = 252
+
+
+def load_actors(filenames: list, state_dim: int, action_dim: int, max_action: float) -> list:
+    # Loads the actors of checkpoints written by TD3.save
+    actors = []
+    for filename in filenames:
+        actor = Actor(state_dim, action_dim, max_action).to(device)
+        actor.load_state_dict(torch.load(filename + "_actor", map_location=device))
+        actors.append(actor)
+    return actors
+
+
+def backtest(actors: list, features: np.ndarray = None, start: int = 0, end: int = None,
+             initial_balance: float = config.INITIAL_BALANCE, cost_rate: float = 0.001, normalizer=None) -> tuple:
+    """
+    Runs every actor over the same date range of a feature panel.
+
+    :param actors: Actor networks with identical architecture
+    :param features: (days, assets, features) panel, defaults to the training feature tensor
+    :param start: First day index
+    :param end: Last day index (exclusive), defaults to the end of the panel
+    :param initial_balance: Starting cash of every portfolio
+    :param cost_rate: Transaction cost as a fraction of traded value
+    :param normalizer: ObservationNormalizer the actors were trained with, its statistics are not updated
+    :return: Tuple of (metrics DataFrame with one row per actor, (days, actors) array of portfolio values)
+    """
+    if features is None:
+        _, features = load_feature_tensor()
+    end = len(features) if end is None else end
+    num_actors, num_days, num_assets = len(actors), end - start, features.shape[1]
+
+    # Stacked weights, so one vmapped call evaluates every actor
+    params, buffers = stack_module_state(actors)
+    base = actors[0]
+
+    def act(params, buffers, observation):
+        return functional_call(base, (params, buffers), (observation,))
+
+    act_all = torch.vmap(act)
+
+    cash_balance = np.full(num_actors, initial_balance)
+    shares_owned = np.zeros((num_actors, num_assets), dtype=np.float32)
+    observation = np.zeros((num_actors, 1 + num_assets + num_assets * features.shape[2]), dtype=np.float32)
+    portfolio_values = np.zeros((num_days, num_actors))
+    traded_value = np.zeros(num_actors)
+
+    with torch.no_grad():
+        for i, day in enumerate(range(start, end)):
+            asset_info = features[day]
+            closing_prices = asset_info[:, 0]
+            portfolio_values[i] = cash_balance + shares_owned @ closing_prices
+            if day == end - 1:
+                break
+
+            # [cash_balance, shares_owned, asset_info] for every actor, as in MarketEnv
+            observation[:, 0] = cash_balance
+            observation[:, 1:1 + num_assets] = shares_owned
+            observation[:, 1 + num_assets:] = asset_info.reshape(-1)
+            if normalizer is not None:
+                normalizer.normalize(observation, out=observation)
+            action = act_all(params, buffers, torch.as_tensor(observation, device=device)).cpu().numpy()
+
+            previous_shares = shares_owned.copy()
+            cash_balance = fill_orders(action, shares_owned, cash_balance, closing_prices, cost_rate)
+            traded_value += np.abs(shares_owned - previous_shares) @ closing_prices
+
+    return _metrics(portfolio_values, traded_value), portfolio_values
+
+
+def _metrics(portfolio_values: np.ndarray, traded_value: np.ndarray) -> pd.DataFrame:
+    daily_returns = portfolio_values[1:] / portfolio_values[:-1] - 1
+    std = daily_returns.std(axis=0)
+    drawdown = 1 - portfolio_values / np.maximum.accumulate(portfolio_values, axis=0)
+
+    return pd.DataFrame({
+        'total_return': portfolio_values[-1] / portfolio_values[0] - 1,
+        'annual_return': (portfolio_values[-1] / portfolio_values[0])
+        ** (TRADING_DAYS / max(len(daily_returns), 1)) - 1,
+        'sharpe': np.divide(daily_returns.mean(axis=0), std, out=np.zeros_like(std), where=std > 0)
+        * np.sqrt(TRADING_DAYS),
+        'max_drawdown': drawdown.max(axis=0),
+        'turnover': traded_value / portfolio_values.mean(axis=0),
+    })
+
+
+if __name__ == '__main__':
+    # Usage: python -m trading.backtest CHECKPOINT [CHECKPOINT ...] (file names as passed to TD3.save)
+    import os
+    import sys
+
+    from model.utils import ObservationNormalizer
+
+    checkpoints = sys.argv[1:]
+    if not checkpoints:
+        sys.exit('Usage: python -m trading.backtest CHECKPOINT [CHECKPOINT ...]')
+
+    tickers, panel = load_feature_tensor()
+    max_action = 5.
+
+    # Checkpoints of one backtest share the normalizer statistics of the first one
+    normalizer = None
+    if os.path.exists(checkpoints[0] + "_normalizer"):
+        normalizer = ObservationNormalizer(panel.shape[2])
+        normalizer.load(checkpoints[0])
+
+    metrics, _ = backtest(load_actors(checkpoints, 1 + len(tickers) * (1 + panel.shape[2]), len(tickers), max_action),
+                          panel, normalizer=normalizer)
+    print(metrics.set_axis(checkpoints))
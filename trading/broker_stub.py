@@ -0,0 +1,165 @@
+"""
+broker-stub
+
+A local HTTP stand-in for a brokerage, backed by a PaperController, so the live-trading path can be exercised and
+load-tested without a real broker. BrokerController is the matching client-side Controller; connections are kept
+alive between requests and orders are sent in batches, so one client can place thousands of orders per second.
+
+Endpoints (JSON bodies, list-valued fields are one entry per asset or order):
+    GET  /snapshot             all of /account, /positions and /market in one response
+    GET  /account              {"step", "cash", "portfolio_value", "done"}
+    GET  /positions            {"tickers", "shares"}
+    GET  /market               {"asset_info"}, (assets, features) closing price first
+    GET  /orders?start=<id>    {"id", "step", "asset", "status", "quantity", "filled", "price", "fee"}
+    POST /orders               {"assets", "quantities"} -> {"ids"}
+    POST /update, POST /reset  advance one step, restart the account
+
+Usage: python -m trading.broker_stub [port]
+"""
+import http.client
+import json
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from trading.controller import Controller
+from trading.paper import ORDER, PaperController
+
+
+def serve_broker(controller: PaperController, port: int = 0) -> ThreadingHTTPServer:
+    """
+    Starts the broker stub on a background thread.
+
+    :param controller: Paper-trading account the stub exposes
+    :param port: Port to listen on, 0 picks a free one
+    :return: The running server, its address is f'http://127.0.0.1:{server.server_port}'
+    """
+
+    def account():
+        return {'step': controller.step, 'cash': float(controller.get_buying_power()),
+                'portfolio_value': float(controller.get_portfolio_value()), 'done': bool(controller.is_done())}
+
+    def positions():
+        return {'tickers': list(controller.get_open_positions()), 'shares': controller.get_shares_owned().tolist()}
+
+    def market():
+        return {'asset_info': controller.get_asset_info().tolist()}
+
+    state = {'/snapshot': lambda: {**account(), **positions(), **market()}, '/account': account,
+             '/positions': positions, '/market': market}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive connections
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path in state:
+                # Read under the account lock, so a response never mixes values from before and after an order batch
+                with controller.lock:
+                    data = state[url.path]()
+                self._send(data)
+            elif url.path == '/orders':
+                orders = controller.get_orders(int(parse_qs(url.query).get('start', ['0'])[0]))
+                self._send({name: orders[name].tolist() for name in ORDER.names})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path == '/orders':
+                orders = json.loads(body)
+                ids = controller.submit_orders(np.asarray(orders['assets'], dtype=np.int64), orders['quantities'])
+                self._send({'ids': ids.tolist()})
+            elif self.path == '/update':
+                controller.update()
+                self._send({'step': controller.step})
+            elif self.path == '/reset':
+                controller.reset()
+                self._send({'step': controller.step})
+            else:
+                self.send_error(404)
+
+        def _send(self, data: dict):
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class BrokerController(Controller):
+    """
+    Controller for a broker stub (or any server with the same API) over a persistent connection; use one instance per
+    thread. Getters are served from Controller's snapshot cache, filled with a single /snapshot request after every
+    update and order batch.
+
+    :param url: Base address of the broker, e.g. 'http://127.0.0.1:8000'
+    :param cache_max_age: See Controller
+    """
+    executes_orders = True
+
+    def __init__(self, url: str, cache_max_age: float = None):
+        super().__init__(cache_max_age)
+        address = urlparse(url)
+        self._connection = http.client.HTTPConnection(address.hostname, address.port)
+        self._connection.connect()
+        self._connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.positions = self.get_open_positions()
+
+    def _request(self, method: str, path: str, data: dict = None) -> dict:
+        body = None if data is None else json.dumps(data).encode()
+        self._connection.request(method, path, body, {'Content-Type': 'application/json'})
+        response = self._connection.getresponse()
+        payload = response.read()
+        if response.status != 200:
+            raise ConnectionError(f'{method} {path} failed with status {response.status}')
+        return json.loads(payload)
+
+    def update(self):
+        self.step = self._request('POST', '/update')['step']
+        self.invalidate()
+
+    def reset(self):
+        self.step = self._request('POST', '/reset')['step']
+        self.invalidate()
+
+    def fetch_snapshot(self) -> dict:
+        snapshot = self._request('GET', '/snapshot')
+        snapshot['shares'] = np.array(snapshot['shares'], dtype=np.float32)
+        snapshot['asset_info'] = np.array(snapshot['asset_info'], dtype=np.float32)
+        return snapshot
+
+    # ORDERS
+
+    def submit_orders(self, assets, quantities):
+        data = {'assets': np.asarray(assets).tolist(), 'quantities': np.asarray(quantities, dtype=np.float64).tolist()}
+        ids = np.array(self._request('POST', '/orders', data)['ids'], dtype=np.int64)
+        self.invalidate()  # Cash and holdings changed
+        return ids
+
+    def get_orders(self, start: int = 0):
+        columns = self._request('GET', f'/orders?start={start}')
+        orders = np.zeros(len(columns['id']), dtype=ORDER)
+        for name in ORDER.names:
+            orders[name] = columns[name]
+        return orders
+
+
+if __name__ == '__main__':
+    stub = serve_broker(PaperController(), int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
+    print(f'Broker stub at http://127.0.0.1:{stub.server_port}')
+    threading.Event().wait()
@@ -1,29 +1,95 @@
+import time
+
 
 class Controller:
-    def __init__(self):
+    """
+    Account and market data source of MarketEnv.
+
+    The getters are served from a cached snapshot of the whole account and market state, fetched in one batched call
+    to fetch_snapshot. The snapshot is read through: it is fetched on the first read after update() or after orders
+    change the account, and every later read is a cache hit, so a controller backed by a remote broker makes one round
+    trip per refresh instead of one per getter call. Controllers with local data (TrainingController) override the
+    getters directly and never fetch.
+
+    :param cache_max_age: Also refetch snapshots older than this many seconds, None keeps them until invalidated
+    """
+    # Whether orders are filled by the controller (submit_orders) rather than by the environment
+    executes_orders = False
+
+    def __init__(self, cache_max_age: float = None):
         self.positions = []
         self.step = 0
 
+        self.cache_max_age = cache_max_age
+        self._snapshot = None
+        self._snapshot_time = 0.
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._max_served_age = 0.
+
     # TODO State updates after each simulated day - then agent can perform trades
-    # TODO All API data should be cached for faster training, refresh on call to update()
     def update(self):
         self.step += 1  # TODO
+        self.invalidate()
+
+    # CACHE
+
+    def fetch_snapshot(self) -> dict:
+        # Fetch the whole state in as few requests as possible: dict with 'step', 'cash', 'portfolio_value', 'done',
+        # 'tickers', 'shares' (assets,) and 'asset_info' (assets, features) arrays
+        raise NotImplementedError(f'{type(self).__name__} does not fetch snapshots')
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        if self._snapshot is None or (self.cache_max_age is not None
+                                      and now - self._snapshot_time > self.cache_max_age):
+            self.cache_misses += 1
+            self._snapshot = self.fetch_snapshot()
+            self._snapshot['ticker_index'] = {ticker: i for i, ticker in enumerate(self._snapshot['tickers'])}
+            self._snapshot_time = now
+        else:
+            self.cache_hits += 1
+            self._max_served_age = max(self._max_served_age, now - self._snapshot_time)
+        return self._snapshot
+
+    def invalidate(self):
+        # The next read fetches a new snapshot, max_served_age starts over with it
+        self._snapshot = None
+        self._max_served_age = 0.
+
+    def cache_metrics(self) -> dict:
+        """
+        :return: Dict of hits, misses, hit_rate, age (seconds since the current snapshot was fetched, None without
+        one) and max_served_age (oldest snapshot a read was served from since the last invalidate)
+        """
+        reads = self.cache_hits + self.cache_misses
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': self.cache_hits / reads if reads else 0.,
+            'age': None if self._snapshot is None else time.monotonic() - self._snapshot_time,
+            'max_served_age': self._max_served_age,
+        }
 
     def reset(self):
         pass
 
     def is_done(self):
         # Has reached end of available training data
+        return self.snapshot()['done']
+
+    def sync_holdings(self, cash_balance, shares_owned):
+        # Record cash and shares after the environment applies trades (live brokers track this themselves)
         pass
 
     # ACCOUNT INFORMATION
 
     def get_buying_power(self):
         # Get buying power (cash balance)
-        pass
+        return self.snapshot()['cash']
 
     def get_portfolio_value(self):
-        pass
+        return self.snapshot()['portfolio_value']
 
     # Get gain/loss of portfolio
 
@@ -34,15 +100,35 @@ class Controller:
     # Get list of all open positions
     def get_open_positions(self):
         # Return list of tickers
-        pass
+        return self.snapshot()['tickers']
 
     # Get a position
     def get_position_data(self, ticker: str):
         # Return tuple with most recent closing price and array of indicators
-        pass
+        snapshot = self.snapshot()
+        row = snapshot['asset_info'][snapshot['ticker_index'][ticker]]
+        return row[0], row[1:]
+
+    # Get number of shares held of every open position
+    def get_shares_owned(self):
+        return self.snapshot()['shares']
+
+    # Get most recent closing price of every open position
+    def get_closing_prices(self):
+        return self.snapshot()['asset_info'][:, 0]
+
+    # Get (assets, features) array of closing price followed by indicators for every open position
+    def get_asset_info(self):
+        return self.snapshot()['asset_info']
 
     # ORDERS
 
-    # Create order
+    # Create a batch of orders
+    def submit_orders(self, assets, quantities):
+        # Signed share quantity per order for the given asset indices, return array of order ids
+        raise NotImplementedError(f'{type(self).__name__} does not execute orders')
 
     # Get all orders
+    def get_orders(self, start: int = 0):
+        # Return structured array of orders with ids from start on (see trading.paper.ORDER)
+        raise NotImplementedError(f'{type(self).__name__} does not execute orders')
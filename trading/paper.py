@@ -0,0 +1,182 @@
+"""
+Paper trading against replayed market data.
+
+PaperController keeps its own order and position ledger and fills orders with a simulated MatchingEngine instead of
+letting MarketEnv apply trades at the closing price. Orders are stored in one growable structured array (OrderLedger),
+so submitting a batch of orders, matching it and recording the fills are a handful of array operations no matter how
+many orders the batch holds.
+"""
+import threading
+
+import numpy as np
+
+import config
+from trading.training_controller import TrainingController
+
+# Order ledger row; quantity is signed (positive buys, negative sells), filled has the same sign
+ORDER = np.dtype([('id', '<i8'), ('step', '<i8'), ('asset', '<i4'), ('status', 'u1'), ('quantity', '<f8'),
+                  ('filled', '<f8'), ('price', '<f8'), ('fee', '<f8')])
+
+# Order statuses
+FILLED = 1
+PARTIALLY_FILLED = 2
+REJECTED = 3
+
+
+class OrderLedger(object):
+    """
+    Append-only record of every order, backed by a structured array that doubles in size when full.
+    Order ids are row numbers.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._orders = np.zeros(capacity, dtype=ORDER)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, step: int, assets: np.ndarray, quantities: np.ndarray) -> np.ndarray:
+        # Records new orders and returns their ids
+        if self.size + len(assets) > len(self._orders):
+            grown = np.zeros(max(2 * len(self._orders), self.size + len(assets)), dtype=ORDER)
+            grown[:self.size] = self._orders[:self.size]
+            self._orders = grown
+
+        ids = np.arange(self.size, self.size + len(assets))
+        rows = self._orders[self.size:self.size + len(assets)]
+        rows['id'] = ids
+        rows['step'] = step
+        rows['asset'] = assets
+        rows['quantity'] = quantities
+        self.size += len(assets)
+        return ids
+
+    def record_fills(self, ids: np.ndarray, filled: np.ndarray, price: np.ndarray, fee: np.ndarray):
+        rows = self._orders[ids]
+        rows['filled'] = filled
+        rows['price'] = price
+        rows['fee'] = fee
+        rows['status'] = np.where(filled == rows['quantity'], FILLED, np.where(filled == 0, REJECTED, PARTIALLY_FILLED))
+        self._orders[ids] = rows
+
+    def orders(self, start: int = 0) -> np.ndarray:
+        # Copy of the orders with ids from start on
+        return self._orders[start:self.size].copy()
+
+    def clear(self):
+        self.size = 0
+
+
+class MatchingEngine(object):
+    """
+    Fills batches of market orders at a reference price plus slippage, charging proportional fees.
+
+    Like fill_orders, sells settle first and never for more shares than are held (later sells of the same asset get
+    what earlier ones left), then buys fill whole, in submission order, for as long as their cumulative cost including
+    fees is covered by the cash balance.
+
+    :param slippage: Buys fill at price * (1 + slippage) and sells at price * (1 - slippage)
+    :param fee_rate: Fee as a fraction of the traded value
+    :param min_fee: Smallest fee charged per filled order
+    """
+
+    def __init__(self, slippage: float = 0.0005, fee_rate: float = 0.001, min_fee: float = 0.):
+        self.slippage = slippage
+        self.fee_rate = fee_rate
+        self.min_fee = min_fee
+
+    def _fees(self, notional: np.ndarray) -> np.ndarray:
+        return np.where(notional > 0, np.maximum(notional * self.fee_rate, self.min_fee), 0.)
+
+    def match(self, assets: np.ndarray, quantities: np.ndarray, prices: np.ndarray, cash_balance: float,
+              shares_owned: np.ndarray) -> tuple:
+        """
+        :param assets: Asset index of every order
+        :param quantities: Signed quantity of every order
+        :param prices: Reference price per asset
+        :param shares_owned: Shares held per asset, updated in place
+        :return: Tuple of (signed filled quantity, fill price and fee of every order, cash balance after the fills)
+        """
+        filled = np.zeros(len(quantities))
+        price = prices[assets] * (1 + self.slippage * np.sign(quantities))
+
+        # Sells, grouped by asset in submission order: each gets the holdings left after the earlier ones
+        sells = np.flatnonzero(quantities < 0)
+        if len(sells):
+            order = sells[np.argsort(assets[sells], kind='stable')]
+            asset, quantity = assets[order], -quantities[order]
+            sold_before = np.cumsum(quantity) - quantity
+            group_start = np.r_[True, asset[1:] != asset[:-1]]
+            sold_before -= np.maximum.accumulate(np.where(group_start, sold_before, 0))
+            filled[order] = -np.clip(shares_owned[asset] - sold_before, 0, quantity)
+
+            proceeds = -filled[sells] * price[sells]
+            cash_balance += (proceeds - self._fees(proceeds)).sum()
+
+        # Buys, all or nothing in submission order while the cash lasts
+        buys = np.flatnonzero(quantities > 0)
+        if len(buys):
+            cost = quantities[buys] * price[buys]
+            cost += self._fees(cost)
+            fits = np.cumsum(cost) <= cash_balance
+            filled[buys[fits]] = quantities[buys[fits]]
+            cash_balance -= cost[fits].sum()
+
+        np.add.at(shares_owned, assets, filled.astype(shares_owned.dtype))
+        return filled, price, self._fees(np.abs(filled) * price), cash_balance
+
+
+class PaperController(TrainingController):
+    """
+    Paper-trading account over a feature tensor: market data is replayed as in TrainingController, orders go through
+    the ledger and matching engine. With executes_orders set, MarketEnv submits its actions as orders instead of
+    filling them itself. Safe to share between threads, e.g. behind the broker stub.
+    """
+    executes_orders = True
+
+    def __init__(self, path: str = config.FEATURE_PATH, initial_balance: float = config.INITIAL_BALANCE,
+                 engine: MatchingEngine = None):
+        super().__init__(path, initial_balance)
+        self.engine = engine or MatchingEngine()
+        self.ledger = OrderLedger()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            super().reset()
+            self.ledger.clear()
+
+    def update(self):
+        with self.lock:
+            super().update()
+
+    def sync_holdings(self, cash_balance, shares_owned):
+        pass  # The ledger is the source of truth
+
+    def submit_orders(self, assets, quantities) -> np.ndarray:
+        """
+        Places a batch of market orders for whole shares, filled immediately at the current step's closing prices.
+        Zero quantity orders are dropped.
+
+        :param assets: Asset index (position in get_open_positions) of every order
+        :param quantities: Signed number of shares of every order
+        :return: Ids of the placed orders
+        """
+        quantities = np.rint(np.asarray(quantities, dtype=np.float64))
+        placed = quantities != 0
+        assets, quantities = np.asarray(assets, dtype=np.int64)[placed], quantities[placed]
+        if not len(assets):
+            return np.zeros(0, dtype=np.int64)
+
+        with self.lock:
+            ids = self.ledger.add(self.step, assets, quantities)
+            filled, price, fee, self.cash_balance = self.engine.match(
+                assets, quantities, self.get_closing_prices(), self.cash_balance, self.shares_owned)
+            self.ledger.record_fills(ids, filled, price, fee)
+        return ids
+
+    def get_orders(self, start: int = 0) -> np.ndarray:
+        # Orders with ids from start on, as ORDER records
+        with self.lock:
+            return self.ledger.orders(start)
@@ -1,6 +1,141 @@
+import os
+
+import numpy as np
+
+import config
 from trading.controller import Controller
 
+# Column order of the preprocessed indicator DataFrames (see market_data.preprocess)
+FEATURES = ['close', 'adi', 'obv', 'rsi', 'sr', 'roc', 'wr', 'macd', 'ema', 'sma', 'disp_index']
+
+# Per-session sentiment columns (see market_data.sentiment), appended to FEATURES when sentiment data is available
+SENTIMENT_FEATURES = ['sentiment', 'sentiment_volume']
+
+
+def save_feature_tensor(frames: dict, path: str = config.FEATURE_PATH, features: list = FEATURES) -> np.memmap:
+    """
+    Stacks preprocessed indicator DataFrames into one contiguous (days, assets, features) float32 array on disk.
+    The array is written with numpy's .npy header so it can be memory-mapped and shared by several training processes.
+
+    :param frames: Mapping of ticker -> preprocessed DataFrame, all aligned to the same trading sessions
+    :param path: Directory to write features.npy, tickers.txt and features.txt into
+    :param features: Columns of the DataFrames to stack, closing price first
+    :return: The written memory-mapped feature tensor
+    """
+    tickers = list(frames)
+    lengths = {len(frames[ticker]) for ticker in tickers}
+    if len(lengths) != 1:
+        raise ValueError('All tickers must cover the same trading sessions')
+
+    out = _open_feature_tensor(path, tickers, features, (lengths.pop(), len(tickers), len(features)))
+    for i, ticker in enumerate(tickers):
+        out[:, i, :] = frames[ticker][features].to_numpy(dtype=np.float32)
+    out.flush()
+    return out
+
+
+def write_feature_tensor(features: np.ndarray, tickers: list, path: str = config.FEATURE_PATH,
+                         feature_names: list = FEATURES) -> np.memmap:
+    """
+    Writes an already stacked (days, assets, features) array in the layout expected by TrainingController.
+
+    :param features: Array of shape (days, len(tickers), len(feature_names))
+    :param tickers: Ticker symbol of each asset column
+    :param path: Directory to write features.npy, tickers.txt and features.txt into
+    :param feature_names: Name of each feature, closing price first
+    :return: The written memory-mapped feature tensor
+    """
+    if features.ndim != 3 or features.shape[1:] != (len(tickers), len(feature_names)):
+        raise ValueError(f'Expected shape (days, {len(tickers)}, {len(feature_names)}), got {features.shape}')
+
+    out = _open_feature_tensor(path, tickers, feature_names, features.shape)
+    out[:] = features
+    out.flush()
+    return out
+
+
+def _open_feature_tensor(path: str, tickers: list, feature_names: list, shape: tuple) -> np.memmap:
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'tickers.txt'), 'w') as f:
+        f.write('\n'.join(tickers))
+    with open(os.path.join(path, 'features.txt'), 'w') as f:
+        f.write('\n'.join(feature_names))
+    return np.lib.format.open_memmap(os.path.join(path, 'features.npy'), mode='w+', dtype=np.float32, shape=shape)
+
+
+def load_feature_tensor(path: str = config.FEATURE_PATH) -> tuple:
+    """
+    Memory-maps a feature tensor written by save_feature_tensor (read-only, pages are shared between processes).
+
+    :return: Tuple of (tickers, features) where features has shape (days, assets, features)
+    """
+    with open(os.path.join(path, 'tickers.txt')) as f:
+        tickers = f.read().split('\n')
+    features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+    return tickers, features
+
+
+def load_feature_names(path: str = config.FEATURE_PATH) -> list:
+    # Names of the feature tensor's last axis, tensors written before features.txt existed hold FEATURES
+    try:
+        with open(os.path.join(path, 'features.txt')) as f:
+            return f.read().split('\n')
+    except FileNotFoundError:
+        return list(FEATURES)
+
 
 class TrainingController(Controller):
-    def __init__(self):
-        super().__init__()
\ No newline at end of file
+    """
+    Simulated account backed by a precomputed feature tensor. Every getter is a slice of the memory-mapped array at the
+    current step, so no pandas work happens inside the environment step loop.
+    """
+
+    def __init__(self, path: str = config.FEATURE_PATH, initial_balance: float = config.INITIAL_BALANCE):
+        super().__init__()
+
+        self.positions, self.features = load_feature_tensor(path)
+        self._ticker_index = {ticker: i for i, ticker in enumerate(self.positions)}
+        self.initial_balance = initial_balance
+
+        self.cash_balance = initial_balance
+        self.shares_owned = np.zeros(len(self.positions), dtype=np.float32)
+
+    def reset(self):
+        self.step = 0
+        self.cash_balance = self.initial_balance
+        self.shares_owned[:] = 0
+
+    def is_done(self):
+        return self.step >= len(self.features) - 1
+
+    def sync_holdings(self, cash_balance, shares_owned):
+        self.cash_balance = cash_balance
+        self.shares_owned[:] = shares_owned
+
+    # ACCOUNT INFORMATION
+
+    def get_buying_power(self):
+        return self.cash_balance
+
+    def get_portfolio_value(self):
+        return self.cash_balance + float(np.dot(self.shares_owned, self.get_closing_prices()))
+
+    # POSITIONS
+
+    def get_open_positions(self):
+        return self.positions
+
+    def get_position_data(self, ticker: str):
+        row = self.features[self.step, self._ticker_index[ticker]]
+        return row[0], row[1:]
+
+    def get_shares_owned(self) -> np.ndarray:
+        return self.shares_owned
+
+    def get_closing_prices(self) -> np.ndarray:
+        # View of every asset's closing price at the current step
+        return self.features[self.step, :, 0]
+
+    def get_asset_info(self) -> np.ndarray:
+        # View of the (assets, features) slice at the current step, closing price first
+        return self.features[self.step]